@@ -0,0 +1,227 @@
+"""
+Configurações de desempenho do Raiox AI.
+
+Todos os valores são lidos de variáveis de ambiente (arquivo .env),
+seguindo o mesmo padrão usado em app/main.py e app/db/session.py.
+"""
+
+import os
+from urllib.parse import unquote
+
+from dotenv import load_dotenv
+
+# Carregar o .env antes de ler qualquer valor (este módulo é importado
+# antes do load_dotenv() de app/main.py)
+load_dotenv()
+
+
+def _env_bool(name, default):
+    """Lê uma variável de ambiente booleana ("1", "true", "yes", "on")."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Micro-batching do encoder CLIP
+CLIP_BATCHING_ENABLED = _env_bool("CLIP_BATCHING_ENABLED", True)
+CLIP_BATCH_MAX_SIZE = int(os.getenv("CLIP_BATCH_MAX_SIZE", "8"))
+CLIP_BATCH_MAX_WAIT_MS = float(os.getenv("CLIP_BATCH_MAX_WAIT_MS", "5"))
+
+# Execução da inferência fora do event loop
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", str(min(4, os.cpu_count() or 1))))
+INFERENCE_PROCESS_WORKERS = int(os.getenv("INFERENCE_PROCESS_WORKERS", "0"))
+
+# Modelo CLIP
+CLIP_MODEL_NAME = os.getenv("CLIP_MODEL_NAME", "ViT-B-32")
+CLIP_PRETRAINED = os.getenv("CLIP_PRETRAINED", "openai")
+# Quantização do encoder em CPU: "none" (fp32) ou "int8" (dinâmica)
+CLIP_QUANTIZATION = os.getenv("CLIP_QUANTIZATION", "none")
+# Versão dos embeddings gravados no catálogo (implants.model_version): a
+# quantização não entra, as consultas int8 são comparadas aos embeddings fp32
+EMBEDDING_MODEL_VERSION = f"{CLIP_MODEL_NAME}:{CLIP_PRETRAINED}"
+# Intervalo (s) entre verificações da coluna com os embeddings do modelo em
+# catálogos sem embedding_versions (com as vagas, cada busca confere a vaga)
+EMBEDDING_VERSION_INTERVAL = float(os.getenv("EMBEDDING_VERSION_INTERVAL", "5"))
+
+# Cache de embeddings por conteúdo (memória + SQLite)
+EMBEDDING_CACHE_ENABLED = _env_bool("EMBEDDING_CACHE_ENABLED", True)
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "2048"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "/opt/raiox-app/cache/embeddings.sqlite3")
+EMBEDDING_CACHE_DISK_MAX_ITEMS = int(os.getenv("EMBEDDING_CACHE_DISK_MAX_ITEMS", "100000"))
+
+# Startup do modelo: "background" (carrega em thread após o uvicorn subir) ou "eager"
+CLIP_STARTUP_MODE = os.getenv("CLIP_STARTUP_MODE", "background")
+CLIP_WEIGHTS_PATH = os.getenv("CLIP_WEIGHTS_PATH", "")
+CLIP_WEIGHTS_CACHE_DIR = os.getenv("CLIP_WEIGHTS_CACHE_DIR", "/opt/raiox-app/cache/clip")
+CLIP_WARMUP_BATCH_SIZE = int(os.getenv("CLIP_WARMUP_BATCH_SIZE", str(CLIP_BATCH_MAX_SIZE)))
+CLIP_WARMUP_ITERATIONS = int(os.getenv("CLIP_WARMUP_ITERATIONS", "2"))
+# Tempo máximo (s) que uma requisição espera o modelo ficar pronto antes do 503
+CLIP_READY_TIMEOUT = float(os.getenv("CLIP_READY_TIMEOUT", "30"))
+# Nova tentativa de carregar o modelo após falha: espera inicial (s), dobrando até o máximo
+CLIP_LOAD_RETRY_BASE = float(os.getenv("CLIP_LOAD_RETRY_BASE", "5"))
+CLIP_LOAD_RETRY_MAX = float(os.getenv("CLIP_LOAD_RETRY_MAX", "300"))
+
+# Backend do encoder de imagens: "eager", "torchscript" ou "onnx"
+CLIP_BACKEND = os.getenv("CLIP_BACKEND", "eager")
+CLIP_ARTIFACTS_DIR = os.getenv("CLIP_ARTIFACTS_DIR", "/opt/raiox-app/models")
+# Vazio = caminho padrão em CLIP_ARTIFACTS_DIR (ver scripts/exportar_encoder_clip.py)
+CLIP_BACKEND_ARTIFACT = os.getenv("CLIP_BACKEND_ARTIFACT", "")
+CLIP_ONNX_THREADS = int(os.getenv("CLIP_ONNX_THREADS", "0"))
+
+# Pré-processamento rápido de radiografias (draft JPEG, 16 bits, zero-copy)
+CLIP_FAST_PREPROCESS = _env_bool("CLIP_FAST_PREPROCESS", True)
+
+# Chave do cache de embeddings: tudo que muda o vetor gerado para a mesma
+# imagem (modelo, backend do encoder, pré-processamento e quantização)
+CLIP_MODEL_ID = ":".join([
+    CLIP_MODEL_NAME,
+    CLIP_PRETRAINED,
+    CLIP_BACKEND,
+    "fast" if CLIP_FAST_PREPROCESS else "open_clip",
+])
+if CLIP_QUANTIZATION != "none":
+    # Embeddings quantizados não podem reaproveitar o cache dos fp32
+    CLIP_MODEL_ID = f"{CLIP_MODEL_ID}:{CLIP_QUANTIZATION}"
+
+# Banco vetorial (pgvector) usado por find_similar_implants
+VECTOR_DB_HOST = os.getenv("DB_HOST", "159.65.183.73")
+VECTOR_DB_NAME = os.getenv("DB_NAME", "raiox")
+VECTOR_DB_USER = os.getenv("DB_USER", "raiox_user")
+# No .env a senha está codificada para URL (%40 = @), como em DATABASE_URL
+VECTOR_DB_PASSWORD = unquote(os.getenv("DB_PASSWORD", "Xc7!rA2v9Z@1pQ3y"))
+VECTOR_DB_PORT = int(os.getenv("DB_PORT", "5432"))
+VECTOR_DB_POOL_MIN = int(os.getenv("VECTOR_DB_POOL_MIN", "1"))
+VECTOR_DB_POOL_MAX = int(os.getenv("VECTOR_DB_POOL_MAX", "8"))
+# Tempo máximo (s) esperando uma conexão livre do pool
+VECTOR_DB_POOL_TIMEOUT = float(os.getenv("VECTOR_DB_POOL_TIMEOUT", "5"))
+# Conexões ociosas há mais que isso (s) são testadas com SELECT 1 antes do uso
+VECTOR_DB_HEALTHCHECK_INTERVAL = float(os.getenv("VECTOR_DB_HEALTHCHECK_INTERVAL", "30"))
+VECTOR_DB_CONNECT_TIMEOUT = int(os.getenv("VECTOR_DB_CONNECT_TIMEOUT", "5"))
+
+# Índice pgvector em implants.embedding (scripts/gerenciar_indice_pgvector.py)
+PGVECTOR_INDEX_TYPE = os.getenv("PGVECTOR_INDEX_TYPE", "hnsw")
+PGVECTOR_HNSW_M = int(os.getenv("PGVECTOR_HNSW_M", "16"))
+PGVECTOR_HNSW_EF_CONSTRUCTION = int(os.getenv("PGVECTOR_HNSW_EF_CONSTRUCTION", "64"))
+# 0 = calculado pelo número de linhas (linhas/1000)
+PGVECTOR_IVFFLAT_LISTS = int(os.getenv("PGVECTOR_IVFFLAT_LISTS", "0"))
+PGVECTOR_MAINTENANCE_WORK_MEM = os.getenv("PGVECTOR_MAINTENANCE_WORK_MEM", "")
+# Opções de consulta aplicadas em cada conexão da busca (recall vs latência)
+PGVECTOR_HNSW_EF_SEARCH = int(os.getenv("PGVECTOR_HNSW_EF_SEARCH", "40"))
+PGVECTOR_IVFFLAT_PROBES = int(os.getenv("PGVECTOR_IVFFLAT_PROBES", "10"))
+PGVECTOR_SESSION_SETTINGS = {
+    "hnsw.ef_search": PGVECTOR_HNSW_EF_SEARCH,
+    "ivfflat.probes": PGVECTOR_IVFFLAT_PROBES,
+}
+
+# Backend de busca: "pgvector" (SQL), "exact" (NumPy sobre catálogo memory-mapped)
+# "hnsw" (índice aproximado em processo, requer hnswlib), "pca" (dois estágios)
+# "pq" (códigos IVF-PQ comprimidos) ou "sharded" (scatter-gather em SEARCH_SHARDS)
+VECTOR_SEARCH_BACKEND = os.getenv("VECTOR_SEARCH_BACKEND", "pgvector")
+# Catálogo exportado por scripts/exportar_catalogo_embeddings.py
+CATALOG_EXPORT_DIR = os.getenv("CATALOG_EXPORT_DIR", "/opt/raiox-app/cache/catalog")
+CATALOG_RELOAD_INTERVAL = float(os.getenv("CATALOG_RELOAD_INTERVAL", "30"))
+
+# Busca em lote (/search/batch): máximo de imagens por chamada e timeout do download
+SEARCH_BATCH_MAX_ITEMS = int(os.getenv("SEARCH_BATCH_MAX_ITEMS", "32"))
+SEARCH_BATCH_FETCH_TIMEOUT = float(os.getenv("SEARCH_BATCH_FETCH_TIMEOUT", "15"))
+
+# Download de imagens por URL (/webhook e /search/batch): cliente httpx
+# compartilhado com keep-alive (HTTP/2 se o pacote h2 estiver instalado),
+# tamanho máximo, timeouts de conexão e de leitura e prazo total do download
+IMAGE_FETCH_MAX_BYTES = int(os.getenv("IMAGE_FETCH_MAX_BYTES", str(20 * 2**20)))
+IMAGE_FETCH_CONNECT_TIMEOUT = float(os.getenv("IMAGE_FETCH_CONNECT_TIMEOUT", "5"))
+IMAGE_FETCH_READ_TIMEOUT = float(os.getenv("IMAGE_FETCH_READ_TIMEOUT", "10"))
+IMAGE_FETCH_TOTAL_TIMEOUT = float(os.getenv("IMAGE_FETCH_TOTAL_TIMEOUT", "30"))
+IMAGE_FETCH_MAX_CONNECTIONS = int(os.getenv("IMAGE_FETCH_MAX_CONNECTIONS", "100"))
+IMAGE_FETCH_MAX_KEEPALIVE = int(os.getenv("IMAGE_FETCH_MAX_KEEPALIVE", "20"))
+IMAGE_FETCH_HTTP2 = _env_bool("IMAGE_FETCH_HTTP2", True)
+
+# Índice HNSW (scripts/construir_indice_hnsw.py); ef_search vale sem reconstruir
+HNSW_INDEX_PATH = os.getenv("HNSW_INDEX_PATH", "/opt/raiox-app/cache/hnsw/implants.bin")
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+# Busca em dois estágios (scripts/ajustar_projecao_pca.py): dimensões da PCA
+# e quantos candidatos do espaço reduzido passam pelo re-rank exato em 512-d
+PCA_COMPONENTS = int(os.getenv("PCA_COMPONENTS", "128"))
+PCA_CANDIDATES = int(os.getenv("PCA_CANDIDATES", "200"))
+
+# Índice IVF-PQ (scripts/construir_indice_pq.py): bytes por vetor (subespaços),
+# listas do IVF (0 = PQ plana), listas visitadas por consulta e candidatos
+# reavaliados com o vetor exato; nprobe e rerank valem sem reconstruir
+PQ_SUBVECTORS = int(os.getenv("PQ_SUBVECTORS", "64"))
+PQ_NLIST = int(os.getenv("PQ_NLIST", "256"))
+PQ_NPROBE = int(os.getenv("PQ_NPROBE", "16"))
+PQ_RERANK = int(os.getenv("PQ_RERANK", "32"))
+
+# Busca distribuída (VECTOR_SEARCH_BACKEND=sharded): endereços dos shards,
+# separados por vírgula ("http://127.0.0.1:8101" ou "unix:/run/raiox/shard-00.sock"),
+# e prazo (s) de cada busca; shards atrasados ficam fora do resultado
+SEARCH_SHARDS = [alvo.strip() for alvo in os.getenv("SEARCH_SHARDS", "").split(",") if alvo.strip()]
+SEARCH_SHARD_DEADLINE = float(os.getenv("SEARCH_SHARD_DEADLINE", "0.5"))
+# Shards gerados por scripts/dividir_catalogo_shards.py
+SHARDS_EXPORT_DIR = os.getenv("SHARDS_EXPORT_DIR", "/opt/raiox-app/cache/shards")
+
+# Cache de resultados para consultas quase idênticas (hash LSH do embedding):
+# acerta com cosseno >= RESULT_CACHE_THRESHOLD entre as consultas, mesmo limit e
+# filtros; descartado quando a versão do catálogo muda (verificada a cada
+# RESULT_CACHE_VERSION_INTERVAL segundos)
+RESULT_CACHE_ENABLED = _env_bool("RESULT_CACHE_ENABLED", False)
+RESULT_CACHE_THRESHOLD = float(os.getenv("RESULT_CACHE_THRESHOLD", "0.98"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "300"))
+RESULT_CACHE_MAX_ITEMS = int(os.getenv("RESULT_CACHE_MAX_ITEMS", "4096"))
+RESULT_CACHE_BITS = int(os.getenv("RESULT_CACHE_BITS", "16"))
+RESULT_CACHE_TABLES = int(os.getenv("RESULT_CACHE_TABLES", "8"))
+RESULT_CACHE_VERSION_INTERVAL = float(os.getenv("RESULT_CACHE_VERSION_INTERVAL", "5"))
+
+# DigitalOcean Spaces (uploads da API e ingestão do catálogo)
+DO_SPACES_KEY = os.getenv("DO_SPACES_KEY")
+DO_SPACES_SECRET = os.getenv("DO_SPACES_SECRET")
+DO_SPACES_BUCKET = os.getenv("DO_SPACES_BUCKET", "raiox-imagens")
+DO_SPACES_REGION = os.getenv("DO_SPACES_REGION", "nyc3")
+DO_SPACES_ENDPOINT = os.getenv("DO_SPACES_ENDPOINT", "https://nyc3.digitaloceanspaces.com")
+
+# Upload write-behind das radiografias (app/services/upload_spool.py): os
+# endpoints gravam no spool local e respondem sem esperar o Spaces; threads
+# em segundo plano enviam com UPLOAD_CONCURRENCY envios simultâneos por
+# worker, com backoff exponencial entre tentativas (UPLOAD_RETRY_BASE até
+# UPLOAD_RETRY_MAX segundos). Desativado, o upload volta a ser síncrono
+UPLOAD_WRITE_BEHIND = _env_bool("UPLOAD_WRITE_BEHIND", True)
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", "/opt/raiox-app/cache/upload_spool")
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+UPLOAD_MAX_ATTEMPTS = int(os.getenv("UPLOAD_MAX_ATTEMPTS", "8"))
+UPLOAD_RETRY_BASE = float(os.getenv("UPLOAD_RETRY_BASE", "2"))
+UPLOAD_RETRY_MAX = float(os.getenv("UPLOAD_RETRY_MAX", "300"))
+
+# Objetos endereçados por conteúdo (app/services/object_index.py): nome
+# UPLOAD_OBJECT_PREFIX/<sha256[:2]>/<sha256>.<ext>; o índice local evita
+# reenviar imagens já armazenadas e guarda submissão -> objeto
+UPLOAD_OBJECT_PREFIX = os.getenv("UPLOAD_OBJECT_PREFIX", "uploads/sha256")
+OBJECT_INDEX_PATH = os.getenv("OBJECT_INDEX_PATH", "/opt/raiox-app/cache/objects.sqlite3")
+# Objetos "pending" há mais de UPLOAD_ORPHAN_AFTER segundos sem envio no
+# spool (ex.: o processo caiu entre o registro e o spool) são marcados
+# "failed" no startup: a próxima submissão do mesmo conteúdo faz o PUT
+UPLOAD_ORPHAN_AFTER = float(os.getenv("UPLOAD_ORPHAN_AFTER", "900"))
+
+# Derivados das imagens (app/services/derivatives.py), gravados ao lado do
+# original: miniatura WebP/JPEG (lado maior DERIVATIVES_THUMB_SIZE) e cópia
+# DERIVATIVES_EMBED_SIZE x DERIVATIVES_EMBED_SIZE para re-embedding, gerados
+# em DERIVATIVES_WORKERS processos (0 = threads no processo da API)
+DERIVATIVES_ENABLED = _env_bool("DERIVATIVES_ENABLED", True)
+DERIVATIVES_WORKERS = int(os.getenv("DERIVATIVES_WORKERS", "2"))
+DERIVATIVES_THUMB_SIZE = int(os.getenv("DERIVATIVES_THUMB_SIZE", "320"))
+DERIVATIVES_THUMB_FORMAT = os.getenv("DERIVATIVES_THUMB_FORMAT", "webp")
+DERIVATIVES_THUMB_QUALITY = int(os.getenv("DERIVATIVES_THUMB_QUALITY", "80"))
+DERIVATIVES_EMBED_SIZE = int(os.getenv("DERIVATIVES_EMBED_SIZE", "224"))
+
+# Ingestão em massa do catálogo (scripts/ingerir_catalogo.py): imagens por
+# lote do CLIP e por COPY, processos de decodificação e threads de leitura
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+INGEST_DECODE_WORKERS = int(os.getenv("INGEST_DECODE_WORKERS", str(os.cpu_count() or 2)))
+INGEST_IO_THREADS = int(os.getenv("INGEST_IO_THREADS", "16"))
+
+# Re-embedding do catálogo com outro modelo (scripts/reprocessar_embeddings.py):
+# limite de imagens/s para não disputar CPU/banco com a API (0 = sem limite)
+REEMBED_MAX_RATE = float(os.getenv("REEMBED_MAX_RATE", "20"))
@@ -1 +1,2 @@
 from .session import get_db, Base, engine
+from .pool import VectorSearchPool, PoolTimeoutError, apply_session_settings
@@ -0,0 +1,332 @@
+"""
+Versões do modelo dos embeddings do catálogo e troca de modelo.
+
+Cada embedding de implants registra o modelo que o gerou
+(model_version, ex.: "ViT-B-32:openai"). Há duas vagas:
+
+- active: implants.embedding / implants.model_version, servida pela API;
+- next: implants.embedding_next / implants.model_version_next, preenchida
+  em segundo plano pelo re-embedding (scripts/reprocessar_embeddings.py).
+
+A tabela embedding_versions guarda o modelo e a dimensão de cada vaga e o
+checkpoint (último id processado) do re-embedding. Uma linha é "pendente"
+para o modelo novo quando tem embedding ativo e model_version_next
+diferente dele; o re-embedding só processa linhas pendentes e pode ser
+interrompido e retomado a qualquer momento.
+
+Leitura dupla: cada leitor (API, ingestão) usa a coluna da vaga cujo
+modelo é o seu (embedding_column). Enquanto o modelo novo é calculado, a
+API continua no antigo. Quando não resta linha pendente, switch_version
+troca as vagas numa única transação, renomeando colunas e índices (só
+metadados, sem reescrever a tabela): processos já com o modelo novo passam
+a ler `embedding`, e os que ainda rodam o antigo continuam corretos lendo
+`embedding_next` até serem reiniciados.
+"""
+
+import logging
+
+from psycopg import sql
+
+from app.db.vector_index import COLUMN, TABLE, list_indexes
+
+logger = logging.getLogger("raiox-api")
+
+VERSIONS_TABLE = "embedding_versions"
+
+# Vaga -> (coluna do embedding, coluna do modelo)
+SLOTS = {
+    "active": (COLUMN, "model_version"),
+    "next": (f"{COLUMN}_next", "model_version_next"),
+}
+
+CREATE_VERSIONS_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} (
+        slot TEXT PRIMARY KEY CHECK (slot IN ('active', 'next')),
+        model_version TEXT NOT NULL,
+        dimension INTEGER NOT NULL,
+        checkpoint_id INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+UPSERT_SLOT_SQL = f"""
+    INSERT INTO {VERSIONS_TABLE} (slot, model_version, dimension)
+    VALUES (%s, %s, %s)
+    ON CONFLICT (slot) DO UPDATE
+    SET model_version = EXCLUDED.model_version, dimension = EXCLUDED.dimension,
+        checkpoint_id = 0, updated_at = now()
+"""
+
+# Linhas do catálogo ativo ainda sem embedding do modelo da vaga next
+PENDING_CONDITION = f"{COLUMN} IS NOT NULL AND model_version_next IS DISTINCT FROM %(model)s"
+
+UPDATE_NEXT_SQL = f"""
+    UPDATE {TABLE} AS i
+    SET {SLOTS['next'][0]} = d.embedding, model_version_next = %(model)s
+    FROM unnest(%(ids)s::int[], %(embeddings)s::vector[]) AS d(id, embedding)
+    WHERE i.id = d.id
+"""
+
+
+def ensure_schema(conn, current_version, dimension=None):
+    """
+    Cria model_version e embedding_versions em catálogos anteriores às versões.
+
+    As linhas existentes recebem `current_version`, o modelo que gerou os
+    embeddings (o configurado na API, CLIP_MODEL_NAME/CLIP_PRETRAINED), como
+    default da coluna nova: só metadados, sem reescrever a tabela nem os
+    índices vetoriais. Não faz nada quando a vaga active já existe.
+
+    Args:
+        dimension: Dimensão dos embeddings (padrão: a da coluna embedding)
+    """
+    model_column = SLOTS["active"][1]
+    with conn.transaction():
+        if _column_dimension(conn, model_column) is None:
+            conn.execute(
+                sql.SQL("ALTER TABLE {} ADD COLUMN {} TEXT DEFAULT {}").format(
+                    sql.Identifier(TABLE), sql.Identifier(model_column), sql.Literal(current_version)
+                )
+            )
+            # Linhas novas sem model_version explícito ficam NULL, não com o modelo antigo
+            conn.execute(
+                sql.SQL("ALTER TABLE {} ALTER COLUMN {} DROP DEFAULT").format(
+                    sql.Identifier(TABLE), sql.Identifier(model_column)
+                )
+            )
+        conn.execute(CREATE_VERSIONS_SQL)
+        if get_slots(conn).get("active"):
+            return False
+        dimension = dimension or _column_dimension(conn, COLUMN)
+        conn.execute(UPSERT_SLOT_SQL, ("active", current_version, int(dimension)))
+    logger.info(f"Versões de embedding iniciadas: modelo ativo {current_version}")
+    return True
+
+
+def get_slots(conn):
+    """Vagas registradas: {slot: {model_version, dimension, checkpoint_id, column}} ({} sem a tabela)."""
+    if conn.execute("SELECT to_regclass(%s)", (VERSIONS_TABLE,)).fetchone()[0] is None:
+        return {}
+    rows = conn.execute(f"SELECT slot, model_version, dimension, checkpoint_id FROM {VERSIONS_TABLE}").fetchall()
+    return {
+        slot: {"model_version": model, "dimension": dimension, "checkpoint_id": checkpoint, "column": SLOTS[slot][0]}
+        for slot, model, dimension, checkpoint in rows
+    }
+
+
+def embedding_column(conn, model_version):
+    """
+    Coluna com os embeddings de `model_version`.
+
+    Catálogos sem embedding_versions (anteriores às versões) só têm
+    `embedding`. Sem vaga com o modelo, levanta RuntimeError: comparar
+    vetores de modelos diferentes daria resultados sem sentido.
+    """
+    return embedding_slot(conn, model_version)[0]
+
+
+def embedding_slot(conn, model_version):
+    """
+    Como embedding_column, mas devolve também a vaga.
+
+    Returns:
+        Tupla (coluna, vaga); a vaga é None em catálogos sem embedding_versions
+    """
+    slots = get_slots(conn)
+    if not slots:
+        return COLUMN, None
+    for slot in ("active", "next"):
+        if slots.get(slot, {}).get("model_version") == model_version:
+            return SLOTS[slot][0], slot
+    raise RuntimeError(
+        f"Nenhuma versão do catálogo com embeddings de {model_version} "
+        f"(ativo: {slots.get('active', {}).get('model_version')}, "
+        f"próximo: {slots.get('next', {}).get('model_version')})"
+    )
+
+
+def _column_dimension(conn, column):
+    """typmod da coluna (a dimensão, para vector); None se a coluna não existe."""
+    row = conn.execute(
+        """
+        SELECT atttypmod FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attname = %s AND NOT attisdropped
+        """,
+        (TABLE, column),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def start_migration(conn, model_version, dimension, restart=False):
+    """
+    Prepara a vaga next para o modelo novo.
+
+    Se a vaga já é deste modelo, nada muda (o re-embedding continua do
+    checkpoint). Outro modelo na vaga next, ou uma coluna de outra
+    dimensão, é descartado, com seus embeddings e índices, só com
+    restart=True (pode ser o modelo anterior ainda lido por processos
+    antigos após uma troca).
+
+    Returns:
+        Dict da vaga next
+    """
+    with conn.transaction():
+        slots = get_slots(conn)
+        if not slots.get("active"):
+            raise RuntimeError("Versões de embedding não iniciadas (ensure_schema)")
+        if slots["active"]["model_version"] == model_version:
+            raise ValueError(f"{model_version} já é o modelo ativo")
+        current = slots.get("next")
+        column, model_column = SLOTS["next"]
+        if current and current["model_version"] == model_version and _column_dimension(conn, column) == dimension:
+            return current
+        if current and not restart:
+            raise RuntimeError(
+                f"A vaga next contém {current['model_version']}; use restart para descartá-la"
+            )
+        conn.execute(
+            sql.SQL("ALTER TABLE {} DROP COLUMN IF EXISTS {}, DROP COLUMN IF EXISTS {}").format(
+                sql.Identifier(TABLE), sql.Identifier(column), sql.Identifier(model_column)
+            )
+        )
+        conn.execute(
+            sql.SQL("ALTER TABLE {} ADD COLUMN {} vector({}), ADD COLUMN {} TEXT").format(
+                sql.Identifier(TABLE), sql.Identifier(column), sql.Literal(int(dimension)),
+                sql.Identifier(model_column),
+            )
+        )
+        conn.execute(UPSERT_SLOT_SQL, ("next", model_version, int(dimension)))
+    logger.info(f"Vaga next preparada para {model_version} ({dimension}-d)")
+    return get_slots(conn)["next"]
+
+
+def pending_count(conn, model_version):
+    """Linhas do catálogo ainda sem embedding de `model_version`."""
+    query = f"SELECT count(*) FROM {TABLE} WHERE {PENDING_CONDITION}"
+    return conn.execute(query, {"model": model_version}).fetchone()[0]
+
+
+def pending_rows(conn, model_version, after_id=0, before_id=None, limit=256):
+    """
+    Próximas linhas pendentes por id (paginação por chave, sem OFFSET).
+
+    Returns:
+        Lista de (id, image_url)
+    """
+    query = f"SELECT id, image_url FROM {TABLE} WHERE {PENDING_CONDITION} AND id > %(after)s"
+    if before_id is not None:
+        query += " AND id <= %(before)s"
+    query += " ORDER BY id LIMIT %(limit)s"
+    return conn.execute(
+        query, {"model": model_version, "after": after_id, "before": before_id, "limit": limit}
+    ).fetchall()
+
+
+def write_next_batch(conn, model_version, ids, embeddings, checkpoint_id):
+    """Grava embeddings da vaga next e avança o checkpoint, na mesma transação."""
+    with conn.transaction():
+        conn.execute(
+            UPDATE_NEXT_SQL,
+            {"model": model_version, "ids": [int(i) for i in ids], "embeddings": list(embeddings)},
+            binary=True,
+        )
+        conn.execute(
+            f"UPDATE {VERSIONS_TABLE} SET checkpoint_id = %s, updated_at = now() "
+            "WHERE slot = 'next' AND model_version = %s",
+            (int(checkpoint_id), model_version),
+        )
+
+
+def reset_checkpoint(conn):
+    conn.execute(f"UPDATE {VERSIONS_TABLE} SET checkpoint_id = 0, updated_at = now() WHERE slot = 'next'")
+
+
+def _rename_column(conn, old, new):
+    conn.execute(
+        sql.SQL("ALTER TABLE {} RENAME COLUMN {} TO {}").format(
+            sql.Identifier(TABLE), sql.Identifier(old), sql.Identifier(new)
+        )
+    )
+
+
+def _rename_index(conn, old, new):
+    conn.execute(sql.SQL("ALTER INDEX {} RENAME TO {}").format(sql.Identifier(old), sql.Identifier(new)))
+
+
+def _rename_indexes(conn):
+    """Depois da troca das colunas, cada índice recebe o prefixo da coluna em que agora está."""
+    # Prefixo mais longo primeiro: "implants_embedding_" também é prefixo de "implants_embedding_next_"
+    prefixes = sorted((f"{TABLE}_{column}_" for column, _ in SLOTS.values()), key=len, reverse=True)
+    renames = []
+    for column, _ in SLOTS.values():
+        for name, _ in list_indexes(conn, column):
+            prefix = next((prefix for prefix in prefixes if name.startswith(prefix)), None)
+            if prefix is not None and prefix != f"{TABLE}_{column}_":
+                renames.append((name, f"{TABLE}_{column}_{name[len(prefix):]}"))
+    # Nomes temporários curtos: os definitivos podem coincidir com nomes ainda em uso
+    for number, (name, _) in enumerate(renames):
+        _rename_index(conn, name, f"{TABLE}_swap_{number}_idx")
+    for number, (_, new_name) in enumerate(renames):
+        _rename_index(conn, f"{TABLE}_swap_{number}_idx", new_name)
+    return len(renames)
+
+
+def switch_version(conn):
+    """
+    Promove a vaga next a ativa (e a ativa a next), atomicamente.
+
+    Recusa a troca enquanto houver linha pendente. A verificação é repetida
+    com a tabela bloqueada, então nenhuma ingestão concorrente entra entre a
+    contagem e a troca; o bloqueio dura só a troca de nomes.
+
+    Returns:
+        Dict com os modelos antes/depois e os índices renomeados
+    """
+    slots = get_slots(conn)
+    if not slots.get("next"):
+        raise RuntimeError("Nenhuma troca de modelo em andamento (vaga next vazia)")
+    model_version = slots["next"]["model_version"]
+    if pending_count(conn, model_version):
+        raise RuntimeError(f"Ainda há linhas sem embedding de {model_version}")
+
+    with conn.transaction():
+        conn.execute(sql.SQL("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE").format(sql.Identifier(TABLE)))
+        pending = pending_count(conn, model_version)
+        if pending:
+            raise RuntimeError(f"{pending} linhas sem embedding de {model_version}")
+        # embedding <-> embedding_next e model_version <-> model_version_next
+        for first, second in zip(SLOTS["active"], SLOTS["next"]):
+            _rename_column(conn, first, f"{first}_swap")
+            _rename_column(conn, second, first)
+            _rename_column(conn, f"{first}_swap", second)
+        indexes = _rename_indexes(conn)
+        conn.execute(
+            f"""
+            UPDATE {VERSIONS_TABLE} AS v
+            SET model_version = o.model_version, dimension = o.dimension, checkpoint_id = 0, updated_at = now()
+            FROM {VERSIONS_TABLE} AS o
+            WHERE o.slot <> v.slot
+            """
+        )
+    logger.info(
+        f"Modelo dos embeddings trocado: {slots['active']['model_version']} -> {model_version} "
+        f"({indexes} índices renomeados)"
+    )
+    return {
+        "previous": slots["active"]["model_version"],
+        "active": model_version,
+        "renamed_indexes": indexes,
+    }
+
+
+def discard_next(conn):
+    """Remove a vaga next (ex.: o modelo anterior, depois que todos os processos trocaram)."""
+    column, model_column = SLOTS["next"]
+    with conn.transaction():
+        conn.execute(
+            sql.SQL("ALTER TABLE {} DROP COLUMN IF EXISTS {}, DROP COLUMN IF EXISTS {}").format(
+                sql.Identifier(TABLE), sql.Identifier(column), sql.Identifier(model_column)
+            )
+        )
+        conn.execute(f"DELETE FROM {VERSIONS_TABLE} WHERE slot = 'next'")
+    logger.info("Vaga next de embeddings descartada")
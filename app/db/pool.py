@@ -0,0 +1,205 @@
+"""
+Pool de conexões persistentes com o PostgreSQL/pgvector para a busca.
+
+find_similar_implants abria uma conexão psycopg2 por requisição; o setup
+TCP, a autenticação e o fork do backend dominavam a latência do top-3.
+Este pool mantém conexões psycopg 3 vivas (psycopg_pool.ConnectionPool),
+espera por uma conexão livre com timeout em vez de falhar na hora, testa
+conexões ociosas antes de entregá-las e mede espera e checkouts.
+
+Cada conexão nasce com o adaptador nativo do pgvector registrado, de modo que
+embeddings np.ndarray são enviados em formato binário (float32), sem virar
+texto decimal no cliente nem ser reinterpretados pelo servidor.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg
+from psycopg import sql
+from pgvector.psycopg import register_vector
+from psycopg_pool import ConnectionPool, PoolTimeout
+
+logger = logging.getLogger("raiox-api")
+
+# Limites (em ms) dos buckets do histograma de espera por conexão
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000)
+
+
+class PoolTimeoutError(RuntimeError):
+    """Nenhuma conexão ficou livre dentro do timeout do pool."""
+
+
+class PooledConnection(psycopg.Connection):
+    """Conexão psycopg com o estado que o pool precisa acompanhar."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_used = time.monotonic()
+        # Parâmetros de sessão (SET) já aplicados nesta conexão
+        self.session_settings = {}
+
+
+def apply_session_settings(conn, settings):
+    """
+    Aplica parâmetros de sessão (ex.: hnsw.ef_search) que ainda não estão na conexão.
+
+    Os valores ficam em cache na própria conexão, então o custo por requisição
+    é só uma comparação de dicts; o round trip acontece na primeira vez ou
+    quando o valor muda.
+    """
+    pending = {
+        name: str(value)
+        for name, value in settings.items()
+        if conn.session_settings.get(name) != str(value)
+    }
+    if not pending:
+        return
+    calls = sql.SQL(", ").join(
+        sql.SQL("set_config({}, {}, false)").format(sql.Literal(name), sql.Literal(value))
+        for name, value in pending.items()
+    )
+    conn.execute(sql.SQL("SELECT ") + calls)
+    conn.session_settings.update(pending)
+
+
+class VectorSearchPool:
+    """
+    Pool de conexões para consultas vetoriais.
+
+    Args:
+        minconn: Conexões abertas na criação do pool
+        maxconn: Máximo de conexões simultâneas
+        timeout: Espera máxima (s) por uma conexão livre
+        healthcheck_interval: Ociosidade (s) a partir da qual a conexão é testada
+        **connect_kwargs: Parâmetros de conexão (host, dbname, user, ...)
+    """
+
+    def __init__(self, minconn=1, maxconn=8, timeout=5.0, healthcheck_interval=30.0, **connect_kwargs):
+        self.minconn = max(0, int(minconn))
+        self.maxconn = max(1, int(maxconn), self.minconn)
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        # Consultas de leitura: autocommit evita BEGIN/COMMIT extras por requisição
+        self._connect_kwargs = dict(connect_kwargs, autocommit=True)
+
+        self._pool = None
+        self._init_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._checkouts = 0
+        self._in_use = 0
+        self._timeouts = 0
+        self._healthchecks = 0
+        self._healthcheck_failures = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_histogram = {f"<={b}ms": 0 for b in WAIT_BUCKETS_MS}
+        self._wait_histogram[f">{WAIT_BUCKETS_MS[-1]}ms"] = 0
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._init_lock:
+                if self._pool is None:
+                    self._pool = ConnectionPool(
+                        kwargs=self._connect_kwargs,
+                        connection_class=PooledConnection,
+                        min_size=self.minconn,
+                        max_size=self.maxconn,
+                        timeout=self.timeout,
+                        configure=self._configure,
+                        check=self._check,
+                        name="pgvector",
+                        open=True,
+                    )
+                    logger.info(
+                        f"Pool pgvector criado (min={self.minconn}, max={self.maxconn})"
+                    )
+        return self._pool
+
+    def _configure(self, conn):
+        # Adaptador binário do pgvector (np.ndarray <-> vector)
+        register_vector(conn)
+
+    def _check(self, conn):
+        if time.monotonic() - conn.last_used < self.healthcheck_interval:
+            return
+        with self._stats_lock:
+            self._healthchecks += 1
+        try:
+            conn.execute("SELECT 1")
+        except psycopg.Error:
+            with self._stats_lock:
+                self._healthcheck_failures += 1
+            logger.warning("Conexão pgvector inválida descartada do pool")
+            # O pool descarta a conexão e tenta outra
+            raise
+
+    def _record_wait(self, wait):
+        wait_ms = wait * 1000.0
+        with self._stats_lock:
+            self._checkouts += 1
+            self._in_use += 1
+            self._wait_total += wait_ms
+            self._wait_max = max(self._wait_max, wait_ms)
+            for bucket in WAIT_BUCKETS_MS:
+                if wait_ms <= bucket:
+                    self._wait_histogram[f"<={bucket}ms"] += 1
+                    break
+            else:
+                self._wait_histogram[f">{WAIT_BUCKETS_MS[-1]}ms"] += 1
+
+    @contextmanager
+    def connection(self):
+        """
+        Empresta uma conexão do pool.
+
+        A conexão volta ao pool ao sair do bloco; conexões quebradas são
+        descartadas pelo próprio psycopg_pool.
+        """
+        pool = self._get_pool()
+        started = time.perf_counter()
+        try:
+            conn = pool.getconn()
+        except PoolTimeout:
+            with self._stats_lock:
+                self._timeouts += 1
+            raise PoolTimeoutError(
+                f"Nenhuma conexão pgvector livre em {self.timeout}s (max={self.maxconn})"
+            )
+        self._record_wait(time.perf_counter() - started)
+        try:
+            yield conn
+        finally:
+            conn.last_used = time.monotonic()
+            pool.putconn(conn)
+            with self._stats_lock:
+                self._in_use -= 1
+
+    def stats(self):
+        pool_stats = self._pool.get_stats() if self._pool is not None else {}
+        with self._stats_lock:
+            return {
+                "minconn": self.minconn,
+                "maxconn": self.maxconn,
+                "size": pool_stats.get("pool_size", 0),
+                "available": pool_stats.get("pool_available", 0),
+                "in_use": self._in_use,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "healthchecks": self._healthchecks,
+                "healthcheck_failures": self._healthcheck_failures,
+                "connections_lost": pool_stats.get("connections_lost", 0),
+                "wait_ms": {
+                    "avg": (self._wait_total / self._checkouts) if self._checkouts else 0.0,
+                    "max": self._wait_max,
+                    "histogram": dict(self._wait_histogram),
+                },
+            }
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
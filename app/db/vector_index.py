@@ -0,0 +1,267 @@
+"""
+Ciclo de vida dos índices pgvector em implants.embedding.
+
+A busca ordena por `embedding <-> q` (distância L2), então os índices usam a
+classe de operadores vector_l2_ops; com outra classe (cosseno, produto
+interno) o planner ignoraria o índice e voltaria ao scan sequencial.
+
+Criação e remoção usam CONCURRENTLY para não bloquear escritas na tabela;
+a reconstrução cria o índice novo com outro nome, remove o antigo e renomeia,
+de modo que a busca nunca fica sem índice. Os comandos exigem autocommit
+(as conexões do VectorSearchPool já são).
+
+As opções de consulta (hnsw.ef_search, ivfflat.probes) são aplicadas por
+conexão com apply_session_settings (ver app/db/pool.py).
+
+Buscas filtradas por fabricante usam índices parciais (um por fabricante,
+WHERE manufacturer = '...'): o índice global filtraria depois de percorrer
+o grafo e devolveria menos de k linhas para filtros seletivos. O índice
+B-tree em (manufacturer, type) cobre filtros muito seletivos, em que o
+planner prefere ordenar as poucas linhas exatamente.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import re
+import time
+
+from psycopg import sql
+
+logger = logging.getLogger("raiox-api")
+
+TABLE = "implants"
+COLUMN = "embedding"
+OPCLASS = "vector_l2_ops"
+INDEX_TYPES = ("hnsw", "ivfflat")
+FILTER_INDEX = f"{TABLE}_manufacturer_type_idx"
+
+
+def index_name(kind, manufacturer=None, column=COLUMN):
+    if manufacturer is None:
+        return f"{TABLE}_{column}_{kind}_idx"
+    # Identificadores do PostgreSQL têm no máximo 63 bytes (com a coluna
+    # embedding_next, ver copy_indexes). O slug é só legível: o hash do valor
+    # exato distingue fabricantes com o mesmo slug ou sem caractere ASCII,
+    # que o IF NOT EXISTS confundiria com um índice já criado
+    slug = re.sub(r"[^a-z0-9]+", "_", manufacturer.lower()).strip("_")[:16]
+    digest = hashlib.sha1(manufacturer.encode("utf-8")).hexdigest()[:8]
+    return f"{TABLE}_{column}_{kind}_" + "_".join(filter(None, (slug, digest))) + "_idx"
+
+
+def default_ivfflat_lists(rows):
+    """Recomendação do pgvector: linhas/1000 até 1M linhas, sqrt(linhas) acima."""
+    if rows <= 1_000_000:
+        return max(1, rows // 1000)
+    return int(math.sqrt(rows))
+
+
+def list_indexes(conn, column=COLUMN):
+    """Índices existentes sobre a coluna de embedding: [(nome, definição)]."""
+    return conn.execute(
+        """
+        SELECT indexname, indexdef
+        FROM pg_indexes
+        WHERE tablename = %s AND indexdef LIKE %s
+        ORDER BY indexname
+        """,
+        (TABLE, f"%({column} %"),
+    ).fetchall()
+
+
+def _where_manufacturer(manufacturer):
+    if manufacturer is None:
+        return sql.SQL("")
+    return sql.SQL(" WHERE manufacturer = {}").format(sql.Literal(manufacturer))
+
+
+def _index_options(conn, kind, m, ef_construction, lists, manufacturer=None):
+    if kind == "hnsw":
+        return {"m": int(m), "ef_construction": int(ef_construction)}
+    if not lists:
+        rows = conn.execute(
+            sql.SQL("SELECT count(*) FROM {}").format(sql.Identifier(TABLE)) + _where_manufacturer(manufacturer)
+        ).fetchone()[0]
+        lists = default_ivfflat_lists(rows)
+    return {"lists": int(lists)}
+
+
+def create_index(
+    conn, kind, m=16, ef_construction=64, lists=0, name=None, maintenance_work_mem=None, manufacturer=None,
+    column=COLUMN,
+):
+    """
+    Cria o índice HNSW ou IVFFlat com CREATE INDEX CONCURRENTLY.
+
+    Args:
+        conn: Conexão psycopg em autocommit
+        kind: "hnsw" ou "ivfflat"
+        m, ef_construction: Parâmetros do HNSW
+        lists: Listas do IVFFlat (0 = calculado pelo número de linhas)
+        name: Nome do índice (padrão: implants_embedding_<kind>_idx)
+        maintenance_work_mem: Memória da construção (ex.: "1GB"); o build do
+            HNSW fica muito mais lento quando o grafo não cabe nela
+        manufacturer: Cria um índice parcial só com as linhas do fabricante
+        column: Coluna indexada (embedding_next durante a troca de modelo,
+            ver app/db/embedding_versions.py)
+
+    Returns:
+        Dict com nome, opções e tempo de construção
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Tipo de índice desconhecido: {kind}")
+    name = name or index_name(kind, manufacturer, column)
+    options = _index_options(conn, kind, m, ef_construction, lists, manufacturer)
+    if maintenance_work_mem:
+        conn.execute("SELECT set_config('maintenance_work_mem', %s, false)", (maintenance_work_mem,))
+
+    statement = sql.SQL(
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING {method} ({column} {opclass}) WITH ({options}){where}"
+    ).format(
+        name=sql.Identifier(name),
+        table=sql.Identifier(TABLE),
+        method=sql.SQL(kind),
+        column=sql.Identifier(column),
+        opclass=sql.SQL(OPCLASS),
+        options=sql.SQL(", ").join(
+            sql.SQL("{} = {}").format(sql.SQL(key), sql.Literal(value)) for key, value in options.items()
+        ),
+        where=_where_manufacturer(manufacturer),
+    )
+    started = time.perf_counter()
+    conn.execute(statement)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Índice {name} criado em {elapsed:.1f}s ({options})")
+    result = {"name": name, "type": kind, "options": options, "build_seconds": round(elapsed, 3)}
+    if manufacturer is not None:
+        result["manufacturer"] = manufacturer
+    return result
+
+
+def list_manufacturers(conn):
+    """Fabricantes com embeddings no catálogo."""
+    rows = conn.execute(
+        sql.SQL("SELECT DISTINCT manufacturer FROM {} WHERE manufacturer IS NOT NULL AND {} IS NOT NULL ORDER BY 1")
+        .format(sql.Identifier(TABLE), sql.Identifier(COLUMN))
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def create_filter_indexes(conn, kind, **options):
+    """
+    Cria os índices que aceleram buscas filtradas.
+
+    Um B-tree em (manufacturer, type) e um índice vetorial parcial por
+    fabricante. Fabricantes novos exigem rodar de novo (IF NOT EXISTS).
+    Índices parciais criados antes do hash no nome (index_name) não são
+    reconhecidos: remova-os antes com drop_filter_indexes.
+
+    Returns:
+        Lista com o resultado de cada índice criado
+    """
+    conn.execute(
+        sql.SQL("CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} (manufacturer, type)")
+        .format(sql.Identifier(FILTER_INDEX), sql.Identifier(TABLE))
+    )
+    results = [{"name": FILTER_INDEX, "type": "btree"}]
+    for manufacturer in list_manufacturers(conn):
+        results.append(create_index(conn, kind, manufacturer=manufacturer, **options))
+    return results
+
+
+def drop_filter_indexes(conn, kind):
+    """Remove o B-tree de filtros e os índices parciais por fabricante."""
+    names = [FILTER_INDEX] + [
+        name for name, definition in list_indexes(conn)
+        if name != index_name(kind) and name.startswith(f"{TABLE}_{COLUMN}_{kind}_") and " WHERE " in definition
+    ]
+    for name in names:
+        drop_index(conn, name)
+    return names
+
+
+def drop_index(conn, name):
+    """Remove o índice com DROP INDEX CONCURRENTLY (sem erro se não existir)."""
+    conn.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(name)))
+    logger.info(f"Índice {name} removido")
+
+
+def rebuild_index(conn, kind, **options):
+    """
+    Reconstrói o índice (ex.: com novos parâmetros) sem deixar a busca sem índice.
+
+    O novo índice é criado com nome temporário; só depois o antigo é removido
+    e o novo assume o nome padrão.
+    """
+    name = index_name(kind)
+    staging = f"{name}_new"
+    drop_index(conn, staging)
+    result = create_index(conn, kind, name=staging, **options)
+    drop_index(conn, name)
+    conn.execute(sql.SQL("ALTER INDEX {} RENAME TO {}").format(sql.Identifier(staging), sql.Identifier(name)))
+    result["name"] = name
+    return result
+
+
+def copy_indexes(conn, source, target):
+    """
+    Cria em `target` os mesmos índices vetoriais de `source` (tipo, opções e
+    WHERE dos parciais), com CONCURRENTLY.
+
+    Usado antes da troca de modelo: a coluna nova já entra em serviço indexada.
+
+    Returns:
+        Lista de (nome, definição) criados
+    """
+    created = []
+    for name, definition in list_indexes(conn, source):
+        new_name = f"{TABLE}_{target}_" + name[len(f"{TABLE}_{source}_"):]
+        statement = (
+            definition.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY IF NOT EXISTS", 1)
+            .replace(f" {name} ON ", f" {new_name} ON ", 1)
+            .replace(f"({source} ", f"({target} ", 1)
+        )
+        started = time.perf_counter()
+        conn.execute(statement)
+        logger.info(f"Índice {new_name} criado em {time.perf_counter() - started:.1f}s")
+        created.append((new_name, statement))
+    return created
+
+
+def explain_search(conn, query_sql, params):
+    """
+    Executa EXPLAIN (ANALYZE, BUFFERS) da consulta de busca.
+
+    Returns:
+        Dict com os índices usados, se houve scan sequencial, tempos e o plano
+    """
+    plan = conn.execute(
+        sql.SQL("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ")
+        + (sql.SQL(query_sql) if isinstance(query_sql, str) else query_sql),
+        params,
+        binary=True,
+    ).fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    root = plan[0]
+
+    indexes = []
+    seq_scans = []
+
+    def walk(node):
+        if node.get("Index Name"):
+            indexes.append(node["Index Name"])
+        if node.get("Node Type") == "Seq Scan":
+            seq_scans.append(node.get("Relation Name"))
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(root["Plan"])
+    return {
+        "indexes": indexes,
+        "seq_scans": seq_scans,
+        "planning_ms": root.get("Planning Time"),
+        "execution_ms": root.get("Execution Time"),
+        "plan": root["Plan"],
+    }
@@ -6,8 +6,13 @@ Autor: Manus AI
 Data: Junho 2025
 """
 
+import time
+import asyncio
+_import_started = time.perf_counter()
+
 from app.schemas import ImplantSchema
 from app.schemas import WebhookRequest
+from app.schemas import BatchSearchRequest, BatchSearchItem, BatchSearchResponse
 from app.db.session import get_db
 from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Header, Request, Form
 from fastapi.responses import JSONResponse
@@ -19,14 +24,11 @@ from typing import List, Optional
 import hashlib
 from datetime import datetime
 import os
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from app.analise_tracker import AnaliseTracker
 import json
 import logging
-import boto3
-from botocore.exceptions import NoCredentialsError
-import torch
-import open_clip
 from PIL import Image
 import io
 import numpy as np
@@ -34,6 +36,19 @@ from dotenv import load_dotenv
 from pgvector.sqlalchemy import Vector
 
 from app.models import Implant
+from app.core import config
+from app.services.batcher import MicroBatcher
+from app.services.executor import InferenceExecutor
+from app.services.derivatives import DerivativeGenerator
+from app.services.embedding_cache import EmbeddingCache
+from app.services.image_fetch import ImageFetcher, ImageFetchError
+from app.services.result_cache import CachedSearch, NearDuplicateCache
+from app.services.spaces import get_s3_client, object_name_from_url, object_url
+from app.services.object_index import ObjectIndex
+from app.services.upload_spool import UploadSpool
+from app.services.model_loader import ClipModelLoader, ModelLoadError
+from app.services.search_backends import create_search_backend, search_filters
+from app.db.pool import VectorSearchPool
 
 # Carregar variáveis de ambiente
 load_dotenv()
@@ -59,25 +74,157 @@ DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# Configurar DigitalOcean Spaces
-DO_SPACES_KEY = os.getenv("DO_SPACES_KEY")
-DO_SPACES_SECRET = os.getenv("DO_SPACES_SECRET")
-DO_SPACES_BUCKET = os.getenv("DO_SPACES_BUCKET", "raiox-imagens")
-DO_SPACES_REGION = os.getenv("DO_SPACES_REGION", "nyc3")
-DO_SPACES_ENDPOINT = os.getenv("DO_SPACES_ENDPOINT", "https://nyc3.digitaloceanspaces.com" )
-
-s3_client = boto3.client(
-    's3',
-    region_name=DO_SPACES_REGION,
-    endpoint_url=DO_SPACES_ENDPOINT,
-    aws_access_key_id=DO_SPACES_KEY,
-    aws_secret_access_key=DO_SPACES_SECRET
+# Pool de conexões persistentes para a busca vetorial (pgvector)
+vector_pool = VectorSearchPool(
+    minconn=config.VECTOR_DB_POOL_MIN,
+    maxconn=config.VECTOR_DB_POOL_MAX,
+    timeout=config.VECTOR_DB_POOL_TIMEOUT,
+    healthcheck_interval=config.VECTOR_DB_HEALTHCHECK_INTERVAL,
+    host=config.VECTOR_DB_HOST,
+    port=config.VECTOR_DB_PORT,
+    dbname=config.VECTOR_DB_NAME,
+    user=config.VECTOR_DB_USER,
+    password=config.VECTOR_DB_PASSWORD,
+    connect_timeout=config.VECTOR_DB_CONNECT_TIMEOUT,
+)
+vector_search = create_search_backend(
+    config.VECTOR_SEARCH_BACKEND,
+    vector_pool,
+    catalog_dir=config.CATALOG_EXPORT_DIR,
+    reload_interval=config.CATALOG_RELOAD_INTERVAL,
+    hnsw_index_path=config.HNSW_INDEX_PATH,
+    hnsw_ef_search=config.HNSW_EF_SEARCH,
+    pg_session_settings=config.PGVECTOR_SESSION_SETTINGS,
+    model_version=config.EMBEDDING_MODEL_VERSION,
+    version_interval=config.EMBEDDING_VERSION_INTERVAL,
+    pca_candidates=config.PCA_CANDIDATES,
+    pq_nprobe=config.PQ_NPROBE,
+    pq_rerank=config.PQ_RERANK,
+    shard_targets=config.SEARCH_SHARDS,
+    shard_deadline=config.SEARCH_SHARD_DEADLINE,
+)
+
+# Cache de resultados para radiografias quase idênticas, na frente do backend
+result_cache = None
+if config.RESULT_CACHE_ENABLED:
+    result_cache = NearDuplicateCache(
+        threshold=config.RESULT_CACHE_THRESHOLD,
+        ttl=config.RESULT_CACHE_TTL,
+        max_items=config.RESULT_CACHE_MAX_ITEMS,
+        bits=config.RESULT_CACHE_BITS,
+        tables=config.RESULT_CACHE_TABLES,
+    )
+    vector_search = CachedSearch(
+        vector_search, result_cache, version_interval=config.RESULT_CACHE_VERSION_INTERVAL
+    )
+
+# Cliente HTTP compartilhado para baixar imagens por URL (keep-alive, limite de tamanho e timeouts)
+image_fetcher = ImageFetcher(
+    max_bytes=config.IMAGE_FETCH_MAX_BYTES,
+    connect_timeout=config.IMAGE_FETCH_CONNECT_TIMEOUT,
+    read_timeout=config.IMAGE_FETCH_READ_TIMEOUT,
+    total_timeout=config.IMAGE_FETCH_TOTAL_TIMEOUT,
+    max_connections=config.IMAGE_FETCH_MAX_CONNECTIONS,
+    max_keepalive=config.IMAGE_FETCH_MAX_KEEPALIVE,
+    http2=config.IMAGE_FETCH_HTTP2,
+)
+
+# Nomes de objeto por hash do conteúdo: imagens já armazenadas não são reenviadas
+object_index = ObjectIndex(config.OBJECT_INDEX_PATH, prefix=config.UPLOAD_OBJECT_PREFIX)
+
+# Miniaturas e cópias na resolução do CLIP, geradas num pool de processos ao lado do upload
+derivative_generator = None
+derivative_uploads = None
+if config.DERIVATIVES_ENABLED:
+    derivative_generator = DerivativeGenerator(
+        workers=config.DERIVATIVES_WORKERS,
+        thumb_size=config.DERIVATIVES_THUMB_SIZE,
+        thumb_format=config.DERIVATIVES_THUMB_FORMAT,
+        thumb_quality=config.DERIVATIVES_THUMB_QUALITY,
+        embed_size=config.DERIVATIVES_EMBED_SIZE,
+    )
+    # Spool/PUT dos derivados fora da thread de resultados do pool de processos
+    derivative_uploads = ThreadPoolExecutor(max_workers=2, thread_name_prefix="derivative-upload")
+
+# Upload write-behind: as imagens vão para o spool local e o envio ao Spaces sai do caminho da requisição
+upload_spool = None
+if config.UPLOAD_WRITE_BEHIND:
+    upload_spool = UploadSpool(
+        config.UPLOAD_SPOOL_DIR,
+        config.DO_SPACES_BUCKET,
+        concurrency=config.UPLOAD_CONCURRENCY,
+        max_attempts=config.UPLOAD_MAX_ATTEMPTS,
+        retry_base=config.UPLOAD_RETRY_BASE,
+        retry_max=config.UPLOAD_RETRY_MAX,
+        on_uploaded=object_index.mark_stored,
+        on_failed=object_index.mark_failed,
+    )
+
+# Modelo CLIP: carregado sob demanda (modo "background") ou já na importação ("eager")
+clip_loader = ClipModelLoader(
+    config.CLIP_MODEL_NAME,
+    config.CLIP_PRETRAINED,
+    weights_path=config.CLIP_WEIGHTS_PATH or None,
+    cache_dir=config.CLIP_WEIGHTS_CACHE_DIR or None,
+    warmup_batch_size=config.CLIP_WARMUP_BATCH_SIZE,
+    warmup_iterations=config.CLIP_WARMUP_ITERATIONS,
+    backend=config.CLIP_BACKEND,
+    backend_path=config.CLIP_BACKEND_ARTIFACT or None,
+    artifacts_dir=config.CLIP_ARTIFACTS_DIR,
+    onnx_threads=config.CLIP_ONNX_THREADS,
+    quantization=config.CLIP_QUANTIZATION,
+    fast_preprocess=config.CLIP_FAST_PREPROCESS,
+    retry_base=config.CLIP_LOAD_RETRY_BASE,
+    retry_max=config.CLIP_LOAD_RETRY_MAX,
+)
+
+def encode_image_batch(image_inputs):
+    """
+    Executa um único forward pass do CLIP para um lote de tensores,
+    usando o backend de encoder ativo (eager, TorchScript ou ONNX).
+
+    Args:
+        image_inputs: Lista de tensores pré-processados (C, H, W)
+
+    Returns:
+        Lista de embeddings (np.ndarray), um por tensor, na mesma ordem
+    """
+    import torch
+    
+    batch = torch.stack(image_inputs)
+    return list(clip_loader.encoder.encode(batch))
+
+# Micro-batching: agrupa requisições concorrentes em um único forward pass
+clip_batcher = MicroBatcher(
+    encode_image_batch,
+    max_batch_size=config.CLIP_BATCH_MAX_SIZE,
+    max_wait_ms=config.CLIP_BATCH_MAX_WAIT_MS,
+    name="clip",
+)
+
+# Cache de embeddings por hash do conteúdo, invalidado quando o modelo muda
+embedding_cache = None
+if config.EMBEDDING_CACHE_ENABLED:
+    embedding_cache = EmbeddingCache(
+        config.CLIP_MODEL_ID,
+        max_items=config.EMBEDDING_CACHE_MEMORY_ITEMS,
+        db_path=config.EMBEDDING_CACHE_PATH or None,
+        disk_max_items=config.EMBEDDING_CACHE_DISK_MAX_ITEMS,
+    )
+
+# Pools dedicados para tirar o trabalho CPU-bound do event loop
+inference_executor = InferenceExecutor(
+    max_workers=config.INFERENCE_THREADS,
+    process_workers=config.INFERENCE_PROCESS_WORKERS,
+    name="clip-inference",
 )
 
-# Carregar modelo CLIP
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model, preprocess, _ = open_clip.create_model_and_transforms("ViT-B-32", pretrained='openai', device=device)
-logger.info(f"Modelo CLIP carregado no dispositivo: {device}")
+# O pool de processos precisa do pré-processador, disponível só após o load
+clip_loader.on_ready(lambda loader: inference_executor.start_process_pool(loader.image_preprocessor))
+
+clip_loader.record_phase("app_import", time.perf_counter() - _import_started)
+if config.CLIP_STARTUP_MODE == "eager":
+    clip_loader.load()
 
 # Criar aplicação FastAPI
 app = FastAPI(
@@ -99,7 +246,66 @@ app.add_middleware(
 @app.get("/healthcheck")
 def healthcheck():
     """Endpoint para verificar se o serviço está funcionando."""
-    return {"status": "ok", "version": os.getenv("APP_VERSION", "2.0.0")}
+    return {"status": "ok", "version": os.getenv("APP_VERSION", "2.0.0"), "ready": clip_loader.ready}
+
+@app.get("/ready")
+def readiness():
+    """Endpoint de prontidão: 200 somente após o modelo CLIP carregar e aquecer."""
+    report = clip_loader.report()
+    if not clip_loader.ready:
+        return JSONResponse(status_code=503, content=report)
+    return report
+
+@app.on_event("startup")
+def start_model_loading():
+    """No modo "background" o modelo é carregado fora do caminho de startup do uvicorn."""
+    if config.CLIP_STARTUP_MODE == "background":
+        clip_loader.start_background()
+
+@app.on_event("startup")
+def start_upload_spool():
+    """Retoma os envios ao Spaces que ficaram no spool."""
+    if upload_spool is not None:
+        upload_spool.start()
+    fail_orphan_uploads()
+
+@app.on_event("shutdown")
+def shutdown_inference():
+    """Encerra os pools de inferência e o batcher."""
+    inference_executor.shutdown(wait=False)
+    clip_batcher.shutdown()
+    if embedding_cache is not None:
+        embedding_cache.close()
+    if upload_spool is not None:
+        upload_spool.close()
+    if derivative_generator is not None:
+        derivative_generator.shutdown()
+        derivative_uploads.shutdown(wait=True, cancel_futures=True)
+    object_index.close()
+
+@app.on_event("shutdown")
+async def close_image_fetcher():
+    """Fecha as conexões do cliente de download de imagens."""
+    await image_fetcher.close()
+    if hasattr(vector_search, "close"):
+        vector_search.close()
+    vector_pool.close()
+
+@app.get("/metrics")
+def metrics():
+    """Endpoint com contadores de desempenho da inferência."""
+    return {
+        "clip_batcher": clip_batcher.stats() if config.CLIP_BATCHING_ENABLED else {"enabled": False},
+        "inference_executor": inference_executor.stats(),
+        "startup": clip_loader.report(),
+        "vector_search": vector_search.stats(),
+        "embedding_cache": embedding_cache.stats() if embedding_cache is not None else {"enabled": False},
+        "result_cache": result_cache.stats() if result_cache is not None else {"enabled": False},
+        "upload_spool": upload_spool.stats() if upload_spool is not None else {"enabled": False},
+        "object_index": object_index.stats(),
+        "derivatives": derivative_generator.stats() if derivative_generator is not None else {"enabled": False},
+        "image_fetch": image_fetcher.stats(),
+    }
 
 @app.post("/webhook", response_model=List[ImplantSchema])
 async def webhook(request: WebhookRequest, db=Depends(get_db)):
@@ -116,24 +322,23 @@ async def webhook(request: WebhookRequest, db=Depends(get_db)):
     logger.info(f"Recebido webhook para cliente {request.client_id}")
     
     try:
-        # Baixar imagem da URL
-        import requests
-        response = requests.get(request.image_url)
-        if response.status_code != 200:
-            logger.error(f"Erro ao baixar imagem da URL: {response.status_code}")
-            raise HTTPException(status_code=400, detail="Não foi possível baixar a imagem da URL fornecida")
-        
-        image_data = response.content
-        
-        # Fazer upload para DigitalOcean Spaces
-        object_name = f"uploads/{request.client_id}/{os.path.basename(request.image_url)}"
-        spaces_url = upload_to_spaces(io.BytesIO(image_data), object_name)
+        # Baixar imagem da URL (streaming, com limite de tamanho); os filtros são montados durante o download
+        download = asyncio.create_task(image_fetcher.fetch(request.image_url))
+        filters = search_filters(request.manufacturer, request.type, request.implant_ids)
+        try:
+            image_data = await download
+        except ImageFetchError as e:
+            logger.error(f"Erro ao baixar imagem da URL: {str(e)}")
+            raise HTTPException(status_code=e.status_code, detail=f"Não foi possível baixar a imagem da URL fornecida: {str(e)}")
         
-        # Processar imagem com CLIP
-        vector = process_image(image_data)
+        # Gravar no spool para envio ao DigitalOcean Spaces e processar com CLIP, em paralelo
+        spaces_url, vector = await asyncio.gather(
+            store_upload(image_data, request.client_id, "webhook", request.image_url),
+            encode_image_async(image_data),
+        )
         
-        # Encontrar implantes similares
-        similar_implants = find_similar_implants(vector, db)
+        # Encontrar implantes similares (filtros opcionais de fabricante, tipo e ids), fora do event loop
+        similar_implants = await inference_executor.run(lambda: find_similar_implants(vector, db, filters=filters))
         
         # Converter para ImplantSchema
         result = []
@@ -152,18 +357,30 @@ async def webhook(request: WebhookRequest, db=Depends(get_db)):
         logger.info(f"Processamento concluído para cliente {request.client_id}")
         return result
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro no processamento do webhook: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro no processamento: {str(e)}")
 
 @app.post("/upload", response_model=List[ImplantSchema])
-async def upload_image(file: UploadFile = File(...), client_id: str = Header(alias="X-Client-ID"), db=Depends(get_db)):
+async def upload_image(
+    file: UploadFile = File(...),
+    client_id: str = Header(alias="X-Client-ID"),
+    manufacturer: Optional[str] = Form(None),
+    type: Optional[str] = Form(None),
+    implant_ids: Optional[str] = Form(None),
+    db=Depends(get_db)
+):
     """
     Endpoint para upload de imagens.
     
     Args:
         file: Arquivo de imagem enviado pelo cliente
         client_id: ID do cliente (obrigatório no header)
+        manufacturer: Filtro opcional de fabricante
+        type: Filtro opcional de tipo
+        implant_ids: Filtro opcional de ids, separados por vírgula
         db: Sessão do banco de dados (injetada pelo FastAPI)
         
     Returns:
@@ -173,20 +390,20 @@ async def upload_image(file: UploadFile = File(...), client_id: str = Header(ali
         raise HTTPException(status_code=400, detail="Header client_id é obrigatório")
     
     logger.info(f"Recebido upload de imagem para cliente {client_id}")
+    filters = search_filters(manufacturer, type, parse_id_list(implant_ids))
     
     try:
         # Ler conteúdo do arquivo
         image_data = await file.read()
         
-        # Fazer upload para DigitalOcean Spaces
-        object_name = f"uploads/{client_id}/{file.filename}"
-        spaces_url = upload_to_spaces(io.BytesIO(image_data), object_name)
+        # Gravar no spool para envio ao DigitalOcean Spaces (objeto nomeado pelo hash do conteúdo)
+        spaces_url = await store_upload(image_data, client_id, "upload", file.filename, file.content_type)
         
         # Processar imagem com CLIP
-        vector = process_image(image_data)
+        vector = await encode_image_async(image_data)
         
-        # Encontrar implantes similares
-        similar_implants = find_similar_implants(vector, db)
+        # Encontrar implantes similares (checkout do pool e consulta fora do event loop)
+        similar_implants = await inference_executor.run(lambda: find_similar_implants(vector, db, filters=filters))
         
         # Converter para ImplantSchema
         result = []
@@ -205,10 +422,88 @@ async def upload_image(file: UploadFile = File(...), client_id: str = Header(ali
         logger.info(f"Processamento concluído para cliente {client_id}")
         return result
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro no processamento do upload: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro no processamento: {str(e)}")
 
+@app.post("/search/batch", response_model=BatchSearchResponse)
+async def search_batch(request: Request):
+    """
+    Busca de implantes similares para várias radiografias em uma chamada.
+    
+    Aceita multipart/form-data (campos `files` e/ou `image_urls`, repetidos,
+    e `limit`, `manufacturer`, `type`, `implant_ids`) ou JSON no formato
+    BatchSearchRequest; os filtros valem para todas as imagens do lote.
+    As imagens são codificadas em um único forward pass e as N buscas top-k
+    rodam em um único round trip (pgvector) ou produto matricial (busca em
+    memória).
+    Falhas de um item (download, imagem inválida) ficam em `error` do item
+    e não derrubam o lote. As imagens não são gravadas no Spaces.
+    
+    Returns:
+        BatchSearchResponse com um item por imagem, na ordem de entrada
+    """
+    content_type = request.headers.get("content-type", "")
+    sources = []
+    try:
+        if content_type.startswith("application/json"):
+            body = BatchSearchRequest(**(await request.json()))
+            limit = body.limit
+            filters = search_filters(body.manufacturer, body.type, body.implant_ids)
+            sources = [("url", url) for url in body.image_urls]
+        else:
+            form = await request.form()
+            limit = int(form.get("limit") or 3)
+            filters = search_filters(
+                form.get("manufacturer"), form.get("type"), parse_id_list(form.get("implant_ids"))
+            )
+            sources = [("file", upload) for upload in form.getlist("files") if hasattr(upload, "read")]
+            sources += [("url", url) for url in form.getlist("image_urls")]
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Requisição inválida: {str(e)}")
+    
+    if not sources:
+        raise HTTPException(status_code=400, detail="Envie ao menos uma imagem em files ou image_urls")
+    if len(sources) > config.SEARCH_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Máximo de {config.SEARCH_BATCH_MAX_ITEMS} imagens por lote"
+        )
+    limit = max(1, min(limit, 50))
+    
+    logger.info(f"Recebida busca em lote com {len(sources)} imagens")
+    images, errors = await read_batch_sources(sources)
+    vectors = await encode_images_batch_async(images, errors)
+    
+    # Uma única busca para todas as imagens codificadas
+    encoded = [i for i, vector in enumerate(vectors) if vector is not None]
+    results = {}
+    if encoded:
+        try:
+            found = await inference_executor.run(
+                lambda: vector_search.search_many([vectors[i] for i in encoded], limit=limit, filters=filters)
+            )
+            results = dict(zip(encoded, (with_thumbnails(implants) for implants in found)))
+        except Exception as e:
+            logger.error(f"Erro na busca em lote: {str(e)}")
+            for i in encoded:
+                errors[i] = "Erro na busca de implantes similares"
+    
+    items = []
+    for i, (kind, source) in enumerate(sources):
+        items.append(BatchSearchItem(
+            index=i,
+            # UploadFile.filename pode vir vazio (multipart sem filename)
+            source=(source.filename or f"arquivo-{i}") if kind == "file" else source,
+            results=[ImplantSchema(**implant) for implant in results.get(i, [])],
+            error=errors.get(i),
+        ))
+    failed = sum(1 for item in items if item.error)
+    logger.info(f"Busca em lote concluída: {len(items) - failed} ok, {failed} com erro")
+    return BatchSearchResponse(items=items, succeeded=len(items) - failed, failed=failed)
+
 @app.get("/implants", response_model=List[ImplantSchema])
 def get_implants(skip: int = 0, limit: int = 100, db=Depends(get_db)):
     """
@@ -272,6 +567,51 @@ def get_implant(implant_id: int, db=Depends(get_db)):
         )
 
 # Funções auxiliares
+def preprocess_image(image_data):
+    """
+    Decodifica e pré-processa uma imagem para o CLIP.
+    
+    Args:
+        image_data: Dados binários da imagem
+        
+    Returns:
+        Tensor pré-processado (C, H, W)
+    """
+    clip_loader.require(config.CLIP_READY_TIMEOUT)
+    return clip_loader.image_preprocessor(image_data)
+
+def encode_preprocessed(image_input):
+    """
+    Gera o embedding de um tensor já pré-processado.
+    
+    Args:
+        image_input: Tensor pré-processado (C, H, W)
+        
+    Returns:
+        Vetor de embedding da imagem
+    """
+    if config.CLIP_BATCHING_ENABLED:
+        image_embedding = clip_batcher.encode(image_input)
+    else:
+        image_embedding = encode_image_batch([image_input])[0]
+    return image_embedding.flatten()
+
+async def encode_preprocessed_async(image_input):
+    """
+    Versão assíncrona de encode_preprocessed.
+    
+    Com o batcher, a requisição espera o Future do lote no event loop
+    (asyncio.wrap_future): só a thread do batcher roda o forward pass, sem
+    prender uma thread do inference_executor por requisição. Assim o lote
+    não fica limitado a INFERENCE_THREADS e as buscas no pgvector não
+    disputam o pool com requisições paradas na fila do batcher.
+    """
+    if config.CLIP_BATCHING_ENABLED:
+        image_embedding = await asyncio.wrap_future(clip_batcher.submit(image_input))
+    else:
+        image_embedding = (await inference_executor.run(encode_image_batch, [image_input]))[0]
+    return image_embedding.flatten()
+
 def process_image(image_data):
     """
     Processa uma imagem com o modelo CLIP.
@@ -283,18 +623,283 @@ def process_image(image_data):
         Vetor de embedding da imagem
     """
     try:
-        image = Image.open(io.BytesIO(image_data))
-        image_input = preprocess(image).unsqueeze(0).to(device)
-        
-        with torch.no_grad():
-            image_features = model.encode_image(image_input)
-            image_embedding = image_features.cpu().numpy().flatten()
-        
+        cache_key, cached = lookup_cached_embedding(image_data)
+        if cached is not None:
+            return cached
+        return store_embedding(cache_key, encode_preprocessed(preprocess_image(image_data)))
+    except Exception as e:
+        logger.error(f"Erro ao processar imagem com CLIP: {str(e)}")
+        raise
+
+def lookup_cached_embedding(image_data):
+    """
+    Consulta o cache de embeddings pelo hash do conteúdo.
+    
+    Returns:
+        Tupla (chave, embedding ou None); a chave é None com o cache desativado
+    """
+    if embedding_cache is None:
+        return None, None
+    cache_key = embedding_cache.key_for(image_data)
+    return cache_key, embedding_cache.get(cache_key)
+
+def store_embedding(cache_key, image_embedding):
+    """Grava o embedding no cache (se ativo) e o devolve."""
+    if embedding_cache is None or cache_key is None:
         return image_embedding
+    return embedding_cache.put(cache_key, image_embedding)
+
+async def require_model_async():
+    """
+    Espera o modelo CLIP ficar pronto (até CLIP_READY_TIMEOUT) ou responde 503.
+    
+    Se a última tentativa de carregamento falhou, o 503 sai na hora, com o
+    erro real; o loader tenta de novo em segundo plano.
+    """
+    try:
+        ready = await clip_loader.wait_ready_async(config.CLIP_READY_TIMEOUT)
+    except ModelLoadError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if not ready:
+        raise HTTPException(status_code=503, detail="Modelo CLIP ainda está carregando")
+
+async def encode_image_async(image_data):
+    """
+    Versão assíncrona de process_image, executada fora do event loop.
+    
+    Com INFERENCE_PROCESS_WORKERS > 0 a decodificação e o pré-processamento
+    rodam no pool de processos; o forward pass roda na thread do batcher
+    (ou no pool de threads, sem batching).
+    
+    Args:
+        image_data: Dados binários da imagem
+        
+    Returns:
+        Vetor de embedding da imagem
+    """
+    await require_model_async()
+    try:
+        cache_key, cached = await inference_executor.run(lookup_cached_embedding, image_data)
+        if cached is not None:
+            return cached
+        image_input = await preprocess_image_async(image_data)
+        image_embedding = await encode_preprocessed_async(image_input)
+        return await inference_executor.run(store_embedding, cache_key, image_embedding)
     except Exception as e:
         logger.error(f"Erro ao processar imagem com CLIP: {str(e)}")
         raise
 
+async def read_batch_sources(sources):
+    """
+    Lê os arquivos enviados e baixa as URLs do lote em paralelo.
+    
+    Args:
+        sources: Lista de ("file", UploadFile) ou ("url", str)
+        
+    Returns:
+        Tupla (lista de bytes ou None por item, dict índice -> mensagem de erro)
+    """
+    errors = {}
+    
+    async def fetch(i, kind, source):
+        try:
+            if kind == "file":
+                return await source.read()
+            return await image_fetcher.fetch(source, timeout=config.SEARCH_BATCH_FETCH_TIMEOUT)
+        except ImageFetchError as e:
+            errors[i] = str(e)
+            return None
+        except Exception as e:
+            logger.error(f"Erro ao ler item {i} do lote: {str(e)}")
+            errors[i] = "Não foi possível ler a imagem"
+            return None
+    
+    images = await asyncio.gather(*(fetch(i, kind, source) for i, (kind, source) in enumerate(sources)))
+    return list(images), errors
+
+async def preprocess_image_async(image_data):
+    """Pré-processa uma imagem no pool de processos (se configurado) ou de threads."""
+    if inference_executor.has_process_pool:
+        return await inference_executor.run_preprocess(image_data)
+    return await inference_executor.run(preprocess_image, image_data)
+
+async def encode_images_batch_async(images, errors):
+    """
+    Gera os embeddings de um lote de imagens em um único forward pass.
+    
+    Imagens em cache não passam pelo modelo; as demais são pré-processadas
+    em paralelo e codificadas juntas. Imagens que falham entram em `errors`.
+    
+    Args:
+        images: Lista de bytes (None para itens que já falharam)
+        errors: Dict índice -> mensagem de erro, atualizado no lugar
+        
+    Returns:
+        Lista de embeddings (None para itens com erro), na ordem de entrada
+    """
+    await require_model_async()
+    
+    vectors = [None] * len(images)
+    pending = [i for i, image_data in enumerate(images) if image_data is not None]
+    cached = await inference_executor.run(
+        lambda: [lookup_cached_embedding(images[i]) for i in pending]
+    )
+    cache_keys = {}
+    to_encode = []
+    for i, (cache_key, embedding) in zip(pending, cached):
+        if embedding is not None:
+            vectors[i] = embedding
+        else:
+            cache_keys[i] = cache_key
+            to_encode.append(i)
+    
+    inputs = await asyncio.gather(
+        *(preprocess_image_async(images[i]) for i in to_encode), return_exceptions=True
+    )
+    ready = []
+    for i, image_input in zip(to_encode, inputs):
+        if isinstance(image_input, Exception):
+            logger.error(f"Erro ao pré-processar item {i} do lote: {str(image_input)}")
+            errors[i] = "Imagem inválida ou corrompida"
+        else:
+            ready.append((i, image_input))
+    
+    if ready:
+        try:
+            embeddings = await inference_executor.run(encode_image_batch, [item for _, item in ready])
+        except Exception as e:
+            logger.error(f"Erro ao codificar lote com CLIP: {str(e)}")
+            for i, _ in ready:
+                errors[i] = "Erro no processamento da imagem com CLIP"
+            return vectors
+        stored = await inference_executor.run(
+            lambda: [store_embedding(cache_keys[i], embedding.flatten()) for (i, _), embedding in zip(ready, embeddings)]
+        )
+        for (i, _), embedding in zip(ready, stored):
+            vectors[i] = embedding
+    return vectors
+
+async def store_upload(image_data, client_id, origin, original_name=None, content_type=None):
+    """
+    Agenda o envio de uma imagem para o DigitalOcean Spaces.
+    
+    O objeto é nomeado pelo SHA-256 do conteúdo; se o índice local já o
+    conhece, nada é enviado. Com UPLOAD_WRITE_BEHIND a imagem só é gravada
+    no spool local e o envio acontece em segundo plano; sem ele, o upload é
+    feito na hora. Nos dois casos o trabalho de disco/rede roda fora do
+    event loop.
+    
+    Args:
+        image_data: Dados binários da imagem
+        client_id: Cliente da submissão
+        origin: Endpoint de origem ("upload", "webhook", "jotform")
+        original_name: Nome do arquivo ou URL enviada pelo cliente
+        content_type: Content-Type informado pelo cliente (usado se o formato não for reconhecido)
+        
+    Returns:
+        URL do arquivo no Spaces
+    """
+    def store():
+        stored = object_index.register(image_data, client_id, origin, original_name)
+        object_name = stored["object_name"]
+        if not stored["new"]:
+            return object_url(object_name)
+        if upload_spool is not None:
+            try:
+                url = upload_spool.enqueue(image_data, object_name, stored["content_type"] or content_type)
+            except Exception:
+                object_index.mark_failed(object_name)
+                raise
+        else:
+            try:
+                url = upload_to_spaces(io.BytesIO(image_data), object_name)
+            except Exception:
+                object_index.mark_failed(object_name)
+                raise
+            object_index.mark_stored(object_name)
+        schedule_derivatives(image_data, object_name)
+        return url
+    
+    return await asyncio.to_thread(store)
+
+def fail_orphan_uploads():
+    """
+    Marca como "failed" os objetos "pending" que nenhum envio do spool vai concluir.
+
+    Acontece quando o processo cai entre o registro no índice e o spool (ou
+    durante um upload síncrono): os bytes não foram guardados, então não
+    há o que reenviar, mas sem isso o objeto ficaria "pending" para sempre
+    e as próximas submissões do mesmo conteúdo não fariam o PUT.
+    """
+    pending = object_index.pending_objects(older_than=config.UPLOAD_ORPHAN_AFTER)
+    if not pending:
+        return
+    queued = upload_spool.queued(pending) if upload_spool is not None else set()
+    orphans = [name for name in pending if name not in queued]
+    for object_name in orphans:
+        object_index.mark_failed(object_name)
+    if orphans:
+        logger.warning(f"{len(orphans)} objetos sem envio no spool marcados como falha")
+
+def schedule_derivatives(image_data, object_name):
+    """
+    Agenda a geração e o envio dos derivados (miniatura e cópia do CLIP) de um original.
+    
+    O envio roda em derivative_uploads, não no callback do pool de processos:
+    a thread que entrega os resultados do pool não pode esperar disco ou rede.
+    """
+    if derivative_generator is None:
+        return
+    future = derivative_generator.submit(image_data)
+    future.add_done_callback(lambda done: derivative_uploads.submit(store_derivatives, object_name, done))
+
+def store_derivatives(object_name, future):
+    """
+    Envia os derivados gerados (spool ou, sem write-behind, upload direto).
+    
+    Ficam "pending" no índice até o PUT: o spool chama mark_stored ou
+    mark_failed com o nome de cada derivado, e só os enviados aparecem em
+    `thumbnail_url`.
+    """
+    try:
+        derivatives = future.result()
+    except Exception as e:
+        logger.warning(f"Derivados de {object_name} não gerados: {str(e)}")
+        return
+    names = derivative_generator.names(object_name)
+    object_index.record_derivatives(object_name, names, state="pending")
+    for kind, (data, content_type) in derivatives.items():
+        try:
+            if upload_spool is not None:
+                upload_spool.enqueue(data, names[kind], content_type)
+            else:
+                upload_to_spaces(io.BytesIO(data), names[kind])
+                object_index.mark_stored(names[kind])
+        except Exception as e:
+            logger.error(f"Erro ao enviar derivado {names[kind]}: {str(e)}")
+            object_index.mark_failed(names[kind])
+
+def thumbnail_url(image_url):
+    """URL da miniatura de uma imagem do bucket, se o derivado já foi enviado."""
+    thumbnails = with_thumbnails([{"image_url": image_url}])
+    return thumbnails[0].get("thumbnail_url")
+
+def with_thumbnails(implants):
+    """
+    Acrescenta `thumbnail_url` aos implantes cuja imagem tem miniatura enviada.
+    
+    Devolve dicts novos: os resultados podem vir do cache de resultados.
+    """
+    if derivative_generator is None or not implants:
+        return implants
+    object_names = [object_name_from_url(implant.get("image_url")) for implant in implants]
+    found = object_index.derivatives(object_names)
+    result = []
+    for implant, object_name in zip(implants, object_names):
+        thumb = found.get(object_name, {}).get("thumb")
+        result.append(dict(implant, thumbnail_url=object_url(thumb)) if thumb else implant)
+    return result
+
 def upload_to_spaces(file_obj, object_name):
     """
     Faz upload de um arquivo para o DigitalOcean Spaces.
@@ -306,15 +911,17 @@ def upload_to_spaces(file_obj, object_name):
     Returns:
         URL do arquivo no Spaces
     """
+    from botocore.exceptions import NoCredentialsError
+    
     try:
-        s3_client.upload_fileobj(
+        get_s3_client().upload_fileobj(
             file_obj,
-            DO_SPACES_BUCKET,
+            config.DO_SPACES_BUCKET,
             object_name,
             ExtraArgs={'ACL': 'public-read'}
         )
         
-        url = f"{DO_SPACES_ENDPOINT}/{DO_SPACES_BUCKET}/{object_name}"
+        url = object_url(object_name)
         logger.info(f"Arquivo enviado para Spaces: {url}")
         return url
     except NoCredentialsError:
@@ -324,47 +931,28 @@ def upload_to_spaces(file_obj, object_name):
         logger.error(f"Erro ao enviar arquivo para Spaces: {str(e)}")
         raise
 
-def find_similar_implants(query_vector, db, limit=3):
+def parse_id_list(value):
+    """Converte "1,2,3" em [1, 2, 3]; None ou vazio viram None."""
+    if not value:
+        return None
+    try:
+        return [int(item) for item in value.split(",") if item.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="implant_ids deve ser uma lista de inteiros separados por vírgula")
+
+def find_similar_implants(query_vector, db, limit=3, filters=None):
     """
     Encontra implantes similares com base em um vetor de consulta.
+    
+    Síncrona (checkout do pool, round trip e índice de derivados): nos
+    endpoints async, chamar via inference_executor.run.
+    
+    Args:
+        filters: Dict opcional de search_filters (manufacturer, type, ids)
     """
     try:
-        # Usar psycopg2 direto para evitar problemas com SQLAlchemy
-        import psycopg2
-        
-        conn = psycopg2.connect(
-            host="159.65.183.73",
-            database="raiox",
-            user="raiox_user",
-            password="Xc7!rA2v9Z@1pQ3y"
-        )
-        
-        cur = conn.cursor()
-        
-        # Converter array para string PostgreSQL
-        vector_str = "[" + ",".join(map(str, query_vector.tolist())) + "]"
-        
-        cur.execute("""
-            SELECT id, name, manufacturer, image_url
-            FROM implants
-            ORDER BY embedding <-> %s::vector
-            LIMIT %s
-        """, (vector_str, limit))
-        
-        rows = cur.fetchall()
-        
-        implants = []
-        for row in rows:
-            implants.append({
-                "id": row[0],
-                "name": row[1],
-                "manufacturer": row[2],
-                "type": None,
-                "image_url": row[3]
-            })
-        
-        cur.close()
-        conn.close()
+        # Backend configurado: pgvector (pool persistente) ou busca em memória
+        implants = with_thumbnails(vector_search.search(query_vector, limit=limit, filters=filters))
         
         logger.info(f"Encontrados {len(implants)} implantes similares")
         return implants
@@ -407,26 +995,25 @@ async def jotform_webhook(
             "origem": "jotform"
         }
         
-        # Fazer upload para DigitalOcean Spaces na pasta clientes
-        object_name = f"clientes/{client_id}/{file.filename}"
-        spaces_url = upload_to_spaces(io.BytesIO(image_data), object_name)
+        # Gravar no spool para envio ao DigitalOcean Spaces (objeto nomeado pelo hash do conteúdo)
+        spaces_url = await store_upload(image_data, client_id, "jotform", file.filename, file.content_type)
         
         if not spaces_url:
             raise HTTPException(status_code=500, detail="Erro no upload da imagem")
         
-        logger.info(f"Imagem enviada para Spaces: {spaces_url}")
+        logger.info(f"Imagem agendada para o Spaces: {spaces_url}")
         
-        # Processar imagem com CLIP
-        image_pil = Image.open(io.BytesIO(image_data))
-        query_vector = process_image(image_data)
+        # Processar imagem com CLIP (a imagem é decodificada uma única vez)
+        query_vector = await encode_image_async(image_data)
         
         if query_vector is None:
             raise HTTPException(status_code=500, detail="Erro no processamento da imagem com CLIP")
         
         logger.info("Imagem processada com CLIP, buscando implantes similares...")
         
-        # Buscar implantes similares no PostgreSQL
-        similar_implants = find_similar_implants(query_vector, db)
+        # Buscar implantes similares no PostgreSQL (fora do event loop)
+        similar_implants = await inference_executor.run(find_similar_implants, query_vector, db)
+        spaces_thumbnail_url = await inference_executor.run(thumbnail_url, spaces_url)
         
         # Converter para ImplantSchema
         result = []
@@ -457,7 +1044,8 @@ async def jotform_webhook(
                     "caso": {
                         "paciente": paciente,
                         "dente": dente,
-                        "imagem_url": spaces_url
+                        "imagem_url": spaces_url,
+                        "thumbnail_url": spaces_thumbnail_url
                     }
                 },
                 "implantes_similares": [
@@ -465,8 +1053,9 @@ async def jotform_webhook(
                         "name": implant.name if hasattr(implant, "name") else implant.get("name", "N/A"),
                         "brand": implant.manufacturer if hasattr(implant, "manufacturer") else implant.get("manufacturer", "N/A"),
                         "thread": implant.type if hasattr(implant, "type") else implant.get("type", "N/A"),
-                        "similarity": getattr(implant, "similarity", 0.85),
-                        "id": implant.id if hasattr(implant, "id") else implant.get("id", 0)
+                        "similarity": (implant.get("similarity") or 0.85) if isinstance(implant, dict) else getattr(implant, "similarity", 0.85),
+                        "id": implant.id if hasattr(implant, "id") else implant.get("id", 0),
+                        "thumbnail_url": implant.get("thumbnail_url") if isinstance(implant, dict) else None
                     }
                     for implant in similar_implants[:3]
                 ],
@@ -494,6 +1083,8 @@ async def jotform_webhook(
         logger.info(f"Processamento Jotform concluído para {client_id} - Encontrados {len(result)} implantes similares")
         return result
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro no processamento do Jotform: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro no processamento: {str(e)}")
@@ -584,6 +1175,8 @@ def format_resultados_para_formulario(implantes, dados_caso):
         resultado += f"   🏷️  Marca: {marca}\n"
         resultado += f"   🔩 Rosca: {rosca}\n"
         resultado += f"   📊 Acurácia: {acuracia}%\n"
+        if implante.get("thumbnail_url"):
+            resultado += f"   🖼️  Imagem: {implante['thumbnail_url']}\n"
         
         # Emoji baseado na acurácia
         if acuracia >= 90:
@@ -15,6 +15,7 @@ class Implant(Base):
     type = Column(String)
     image_url = Column(String)
     embedding = Column(Vector(512))  # Dimensão do vetor CLIP
+    model_version = Column(String)  # Modelo que gerou o embedding (ex.: "ViT-B-32:openai")
     
     def to_dict(self):
         return {
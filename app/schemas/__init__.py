@@ -1,2 +1,9 @@
 from .webhook import WebhookRequest
 from .implant import ImplantSchema, ImplantBase, ImplantCreate
+from .search import (
+    BatchSearchRequest,
+    BatchSearchItem,
+    BatchSearchResponse,
+    ShardSearchRequest,
+    ShardSearchResponse,
+)
@@ -12,6 +12,11 @@ class ImplantCreate(ImplantBase):
 
 class ImplantSchema(ImplantBase):
     id: int
+    # Preenchidos pela busca por similaridade
+    distance: Optional[float] = None
+    similarity: Optional[float] = None
+    # Miniatura da imagem de referência (quando os derivados já foram gerados)
+    thumbnail_url: Optional[str] = None
 
     class Config:
         orm_mode = True
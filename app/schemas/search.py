@@ -0,0 +1,36 @@
+from pydantic import BaseModel
+from typing import Any, Dict, Optional, List
+
+from .implant import ImplantSchema
+
+class BatchSearchRequest(BaseModel):
+    image_urls: List[str]
+    limit: int = 3
+    # Filtros opcionais, aplicados a todas as imagens do lote
+    manufacturer: Optional[str] = None
+    type: Optional[str] = None
+    implant_ids: Optional[List[int]] = None
+
+class BatchSearchItem(BaseModel):
+    index: int
+    source: str
+    results: List[ImplantSchema] = []
+    # Falha só deste item; os demais itens do lote seguem normalmente
+    error: Optional[str] = None
+
+class BatchSearchResponse(BaseModel):
+    items: List[BatchSearchItem]
+    succeeded: int
+    failed: int
+
+class ShardSearchRequest(BaseModel):
+    # Vetores float32 (N x dimension) em base64, sem a conversão para JSON
+    vectors: str
+    dimension: int
+    limit: int = 3
+    filters: Optional[Dict[str, Any]] = None
+
+class ShardSearchResponse(BaseModel):
+    shard: str
+    results: List[List[ImplantSchema]]
+    elapsed_ms: float
@@ -1,7 +1,11 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 
 class WebhookRequest(BaseModel):
     image_url: str
     client_id: str
     metadata: Optional[dict] = None
+    # Filtros opcionais da busca por similaridade
+    manufacturer: Optional[str] = None
+    type: Optional[str] = None
+    implant_ids: Optional[List[int]] = None
@@ -0,0 +1,4 @@
+from .batcher import MicroBatcher
+from .executor import InferenceExecutor
+from .embedding_cache import EmbeddingCache
+from .model_loader import ClipModelLoader, ModelLoadError, ModelNotReadyError
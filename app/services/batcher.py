@@ -0,0 +1,203 @@
+"""
+Motor de micro-batching para o encoder de imagens CLIP.
+
+Cada requisição enfileira seu tensor já pré-processado; uma thread dedicada
+agrupa os itens e executa um único forward pass quando o lote atinge
+`max_batch_size` ou quando o item mais antigo esperou `max_wait_ms`.
+Cada chamador recebe de volta apenas o seu próprio embedding.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger("raiox-api")
+
+# Limites (em ms) dos buckets do histograma de tempo de espera na fila
+WAIT_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100)
+
+_STOP = object()
+
+
+class _PendingItem:
+    __slots__ = ("payload", "future", "enqueued_at")
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Agrupa chamadas concorrentes de encode em lotes.
+
+    Args:
+        encode_batch: Função que recebe uma lista de payloads e devolve uma
+            sequência de resultados na mesma ordem
+        max_batch_size: Tamanho máximo do lote
+        max_wait_ms: Espera máxima (ms) do primeiro item antes do flush
+        name: Nome usado nos logs e na thread de processamento
+    """
+
+    def __init__(self, encode_batch, max_batch_size=8, max_wait_ms=5.0, name="clip"):
+        self._encode_batch = encode_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._batch_sizes = {}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_histogram = {f"<={b}ms": 0 for b in WAIT_BUCKETS_MS}
+        self._wait_histogram[f">{WAIT_BUCKETS_MS[-1]}ms"] = 0
+        self._encode_total = 0.0
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=f"batcher-{self.name}", daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, payload):
+        """
+        Enfileira um payload para o próximo lote.
+
+        Returns:
+            concurrent.futures.Future com o resultado individual
+        """
+        self._ensure_started()
+        item = _PendingItem(payload)
+        self._queue.put(item)
+        return item.future
+
+    def encode(self, payload, timeout=None):
+        """Versão bloqueante de submit(): espera e devolve o resultado."""
+        return self.submit(payload).result(timeout=timeout)
+
+    def queue_depth(self):
+        """Número de itens aguardando para entrar em um lote."""
+        return self._queue.qsize()
+
+    def shutdown(self, timeout=5.0):
+        """Encerra a thread de processamento após esvaziar a fila."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+            self._process(batch)
+
+    def _process(self, batch):
+        # Itens cancelados pelo chamador (ex.: asyncio.wrap_future de uma
+        # requisição abortada) saem do lote; os demais não podem mais ser cancelados
+        batch = [item for item in batch if item.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        started = time.perf_counter()
+        waits = [started - item.enqueued_at for item in batch]
+        try:
+            results = self._encode_batch([item.payload for item in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f"encode_batch devolveu {len(results)} resultados para {len(batch)} itens"
+                )
+        except Exception as e:
+            logger.error(f"Erro no lote do batcher {self.name}: {str(e)}")
+            with self._stats_lock:
+                self._errors += 1
+            for item in batch:
+                item.future.set_exception(e)
+            return
+
+        elapsed = time.perf_counter() - started
+        for item, result in zip(batch, results):
+            item.future.set_result(result)
+        self._record(len(batch), waits, elapsed)
+
+    def _record(self, size, waits, elapsed):
+        with self._stats_lock:
+            self._batches += 1
+            self._items += size
+            self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+            self._encode_total += elapsed
+            for wait in waits:
+                wait_ms = wait * 1000.0
+                self._wait_total += wait_ms
+                self._wait_max = max(self._wait_max, wait_ms)
+                for bucket in WAIT_BUCKETS_MS:
+                    if wait_ms <= bucket:
+                        self._wait_histogram[f"<={bucket}ms"] += 1
+                        break
+                else:
+                    self._wait_histogram[f">{WAIT_BUCKETS_MS[-1]}ms"] += 1
+
+    def stats(self):
+        """
+        Contadores do batcher.
+
+        Returns:
+            Dict com distribuição de tamanhos de lote e tempos de espera na fila
+        """
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_depth": self.queue_depth(),
+                "batches": self._batches,
+                "items": self._items,
+                "errors": self._errors,
+                "avg_batch_size": (self._items / self._batches) if self._batches else 0.0,
+                "batch_size_distribution": dict(sorted(self._batch_sizes.items())),
+                "queue_wait_ms": {
+                    "avg": (self._wait_total / self._items) if self._items else 0.0,
+                    "max": self._wait_max,
+                    "histogram": dict(self._wait_histogram),
+                },
+                "encode_ms_total": self._encode_total * 1000.0,
+            }
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._reset_stats()
@@ -0,0 +1,171 @@
+"""
+Derivados das radiografias: miniatura comprimida e cópia na resolução do CLIP.
+
+Para cada imagem original são gerados, num pool de processos:
+
+- "thumb": miniatura WebP (ou JPEG, se o Pillow não tiver WebP) com lado
+  maior de `thumb_size`, para páginas de resultado do JotForm e para o
+  `thumbnail_url` da API;
+- "embed": cópia PNG (sem perda) de `embed_size` x `embed_size` com o mesmo
+  Resize + CenterCrop do RadiographPreprocessor. O pré-processamento de um
+  modelo com essa resolução de entrada devolve da cópia o mesmo tensor que
+  do original, então jobs de re-embedding podem ler a cópia pequena.
+
+Os derivados ficam ao lado do original no bucket, com nome derivado do
+nome do objeto (`<base>.thumb.webp`, `<base>.224.png`); o ObjectIndex
+registra quais originais têm derivados.
+"""
+
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from PIL import Image, features
+
+from app.services.preprocessing import REDUCING_GAP, RadiographPreprocessor
+
+logger = logging.getLogger("raiox-api")
+
+THUMB_FORMATS = {"webp": ("WEBP", ".webp", "image/webp"), "jpeg": ("JPEG", ".jpg", "image/jpeg")}
+
+
+def derivative_names(object_name, thumb_extension=".webp", embed_size=224):
+    """Nomes dos derivados de `object_name`: {"thumb": ..., "embed": ...}."""
+    directory, filename = os.path.split(object_name)
+    base = os.path.join(directory, os.path.splitext(filename)[0])
+    return {"thumb": f"{base}.thumb{thumb_extension}", "embed": f"{base}.{embed_size}.png"}
+
+
+def make_derivatives(image_data, thumb_size=320, thumb_format="webp", thumb_quality=80, embed_size=224):
+    """
+    Gera os derivados de uma imagem (executado no pool de processos).
+
+    Returns:
+        Dict tipo -> (bytes, content-type)
+    """
+    preprocessor = RadiographPreprocessor(image_size=embed_size)
+    image = Image.open(io.BytesIO(image_data))
+    if image.format == "JPEG":
+        image.draft("L" if image.mode == "L" else "RGB", (thumb_size, thumb_size))
+    image = preprocessor.to_8bit(image)
+
+    pil_format, _, content_type = THUMB_FORMATS[thumb_format]
+    thumb = image.copy()
+    thumb.thumbnail((thumb_size, thumb_size), Image.BICUBIC, reducing_gap=REDUCING_GAP)
+    thumb_buffer = io.BytesIO()
+    save_args = {"quality": thumb_quality}
+    if pil_format == "WEBP":
+        save_args["method"] = 4
+    else:
+        save_args.update(optimize=True, progressive=True)
+    thumb.save(thumb_buffer, pil_format, **save_args)
+
+    # Decodificação própria: o draft do JPEG precisa ser o mesmo do pré-processamento
+    embed_buffer = io.BytesIO()
+    preprocessor.decode(image_data).save(embed_buffer, "PNG", optimize=True)
+    return {
+        "thumb": (thumb_buffer.getvalue(), content_type),
+        "embed": (embed_buffer.getvalue(), "image/png"),
+    }
+
+
+class DerivativeGenerator:
+    """
+    Pool que gera os derivados fora do event loop e das threads de inferência.
+
+    Args:
+        workers: Processos do pool (0 = duas threads no próprio processo)
+        thumb_size: Lado maior da miniatura
+        thumb_format: "webp" ou "jpeg"
+        thumb_quality: Qualidade da miniatura (1-100)
+        embed_size: Lado da cópia na resolução do CLIP
+    """
+
+    def __init__(self, workers=2, thumb_size=320, thumb_format="webp", thumb_quality=80, embed_size=224):
+        self.workers = max(0, int(workers))
+        self.thumb_size = int(thumb_size)
+        self.thumb_quality = int(thumb_quality)
+        self.embed_size = int(embed_size)
+        if thumb_format not in THUMB_FORMATS:
+            raise ValueError(f"Formato de miniatura desconhecido: {thumb_format} (use webp ou jpeg)")
+        if thumb_format == "webp" and not features.check("webp"):
+            logger.warning("Pillow sem suporte a WebP: miniaturas em JPEG")
+            thumb_format = "jpeg"
+        self.thumb_format = thumb_format
+        self.thumb_extension = THUMB_FORMATS[thumb_format][1]
+
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._generated = 0
+        self._failed = 0
+        self._original_bytes = 0
+        self._derivative_bytes = {"thumb": 0, "embed": 0}
+
+    def names(self, object_name):
+        """Nomes dos derivados de `object_name` com a configuração deste gerador."""
+        return derivative_names(object_name, self.thumb_extension, self.embed_size)
+
+    def _executor(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    if self.workers:
+                        # spawn: o pool é criado com a API já rodando (threads do
+                        # executor, batcher, spool e do modelo); um fork copiaria
+                        # locks tomados por elas. Os filhos só importam este módulo
+                        self._pool = ProcessPoolExecutor(
+                            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                        )
+                    else:
+                        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="derivatives")
+        return self._pool
+
+    def submit(self, image_data):
+        """
+        Agenda a geração dos derivados.
+
+        Returns:
+            Future com o dict tipo -> (bytes, content-type) de make_derivatives
+        """
+        future = self._executor().submit(
+            make_derivatives, image_data, self.thumb_size, self.thumb_format, self.thumb_quality, self.embed_size
+        )
+        future.add_done_callback(lambda done: self._record(len(image_data), done))
+        return future
+
+    def generate(self, image_data):
+        """Gera os derivados e espera o resultado (scripts em lote)."""
+        return self.submit(image_data).result()
+
+    def _record(self, original_size, future):
+        with self._stats_lock:
+            if future.cancelled() or future.exception() is not None:
+                self._failed += 1
+                return
+            self._generated += 1
+            self._original_bytes += original_size
+            for kind, (data, _) in future.result().items():
+                self._derivative_bytes[kind] += len(data)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "workers": self.workers,
+                "thumb_format": self.thumb_format,
+                "thumb_size": self.thumb_size,
+                "embed_size": self.embed_size,
+                "generated": self._generated,
+                "failed": self._failed,
+                "original_bytes": self._original_bytes,
+                "thumb_bytes": self._derivative_bytes["thumb"],
+                "embed_bytes": self._derivative_bytes["embed"],
+                "thumb_ratio": (self._derivative_bytes["thumb"] / self._original_bytes) if self._original_bytes else 0.0,
+            }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
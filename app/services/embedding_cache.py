@@ -0,0 +1,214 @@
+"""
+Cache de embeddings endereçado por conteúdo.
+
+A chave é o SHA-256 dos bytes da imagem somado ao identificador do modelo,
+de modo que reenvios da mesma radiografia (JotForm, retries do /webhook)
+não passam de novo pelo CLIP. São dois níveis:
+
+- memória: LRU limitado por número de itens, por processo;
+- disco: SQLite local, compartilhado entre workers e persistente entre restarts.
+
+Ao abrir o arquivo com um modelo diferente (nome ou tag pretrained), o nível
+em disco é esvaziado automaticamente.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger("raiox-api")
+
+# A cada quantas inserções o limite do nível em disco é verificado
+_DISK_PRUNE_INTERVAL = 256
+
+
+class EmbeddingCache:
+    """
+    Cache de dois níveis (LRU em memória + SQLite) para embeddings CLIP.
+
+    Args:
+        model_id: Identificador do modelo, ex.: "ViT-B-32:openai"
+        max_items: Capacidade do LRU em memória (0 desativa o nível)
+        db_path: Caminho do arquivo SQLite (None desativa o nível em disco)
+        disk_max_items: Limite de itens no disco (0 = sem limite)
+    """
+
+    def __init__(self, model_id, max_items=2048, db_path=None, disk_max_items=0):
+        self.model_id = model_id
+        self.max_items = max(0, int(max_items))
+        self.db_path = db_path
+        self.disk_max_items = max(0, int(disk_max_items))
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._inserts_since_prune = 0
+
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._memory_evictions = 0
+        self._disk_evictions = 0
+        self._invalidations = 0
+
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(db_path, check_same_thread=False, timeout=5.0)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " embedding BLOB NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        row = db.execute("SELECT value FROM meta WHERE key = 'model_id'").fetchone()
+        if row is None or row[0] != self.model_id:
+            if row is not None:
+                logger.info(
+                    f"Modelo mudou ({row[0]} -> {self.model_id}), invalidando cache de embeddings"
+                )
+                self._invalidations += 1
+            db.execute("DELETE FROM embeddings")
+            db.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('model_id', ?)",
+                (self.model_id,),
+            )
+        db.commit()
+        self._db = db
+
+    def key_for(self, image_data):
+        """Chave do cache: SHA-256 de (model_id, bytes da imagem)."""
+        digest = hashlib.sha256(self.model_id.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(image_data)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Busca um embedding no cache.
+
+        Returns:
+            np.ndarray somente-leitura ou None em caso de miss
+        """
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+                self._memory_hits += 1
+                return embedding
+
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT embedding FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+            if row is not None:
+                embedding = np.frombuffer(row[0], dtype=np.float32)
+                with self._lock:
+                    self._disk_hits += 1
+                self._remember(key, embedding)
+                return embedding
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def put(self, key, embedding):
+        """Armazena um embedding nos dois níveis."""
+        embedding = np.ascontiguousarray(embedding, dtype=np.float32).reshape(-1)
+        embedding.setflags(write=False)
+        self._remember(key, embedding)
+
+        if self._db is not None:
+            try:
+                with self._db_lock:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO embeddings (key, embedding, created_at)"
+                        " VALUES (?, ?, ?)",
+                        (key, embedding.tobytes(), time.time()),
+                    )
+                    self._db.commit()
+                    self._inserts_since_prune += 1
+                    if self._inserts_since_prune >= _DISK_PRUNE_INTERVAL:
+                        self._prune_disk()
+            except sqlite3.Error as e:
+                logger.error(f"Erro ao gravar cache de embeddings em disco: {str(e)}")
+        return embedding
+
+    def _remember(self, key, embedding):
+        if not self.max_items:
+            return
+        with self._lock:
+            self._memory[key] = embedding
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+                self._memory_evictions += 1
+
+    def _prune_disk(self):
+        # Chamado com _db_lock adquirido
+        self._inserts_since_prune = 0
+        if not self.disk_max_items:
+            return
+        total = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = total - self.disk_max_items
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                " SELECT key FROM embeddings ORDER BY created_at LIMIT ?)",
+                (excess,),
+            )
+            self._db.commit()
+            with self._lock:
+                self._disk_evictions += excess
+
+    def clear(self):
+        """Esvazia os dois níveis."""
+        with self._lock:
+            self._memory.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+    def stats(self):
+        disk_items = None
+        if self._db is not None:
+            with self._db_lock:
+                disk_items = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        with self._lock:
+            lookups = self._memory_hits + self._disk_hits + self._misses
+            return {
+                "model_id": self.model_id,
+                "memory_items": len(self._memory),
+                "memory_max_items": self.max_items,
+                "disk_items": disk_items,
+                "disk_max_items": self.disk_max_items,
+                "memory_hits": self._memory_hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_ratio": ((self._memory_hits + self._disk_hits) / lookups) if lookups else 0.0,
+                "memory_evictions": self._memory_evictions,
+                "disk_evictions": self._disk_evictions,
+                "invalidations": self._invalidations,
+            }
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
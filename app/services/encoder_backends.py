@@ -0,0 +1,219 @@
+"""
+Backends do encoder de imagens CLIP.
+
+- "eager": PyTorch eager (comportamento original);
+- "torchscript": módulo traçado e congelado com torch.jit;
+- "onnx": ONNX Runtime com o CPUExecutionProvider.
+
+Todos recebem um lote de tensores pré-processados (N, C, H, W) e devolvem
+um np.ndarray float32 (N, D). Os artefatos de TorchScript/ONNX são gerados
+a partir do modelo open_clip por scripts/exportar_encoder_clip.py, que também
+executa a checagem de paridade contra o backend eager.
+"""
+
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger("raiox-api")
+
+BACKENDS = ("eager", "torchscript", "onnx")
+
+# Similaridade de cosseno mínima exigida entre backend exportado e eager
+PARITY_THRESHOLD = 0.999
+
+
+class EagerBackend:
+    """Forward pass direto do modelo open_clip."""
+
+    name = "eager"
+
+    def __init__(self, model, device):
+        self.model = model
+        self.device = device
+
+    def encode(self, batch):
+        import torch
+
+        with torch.no_grad():
+            features = self.model.encode_image(batch.to(self.device))
+        return features.float().cpu().numpy()
+
+
+class TorchScriptBackend:
+    """Encoder traçado com torch.jit e carregado de um arquivo .pt."""
+
+    name = "torchscript"
+
+    def __init__(self, path, device):
+        import torch
+
+        self.device = device
+        self.module = torch.jit.load(path, map_location=device)
+        self.module.eval()
+
+    def encode(self, batch):
+        import torch
+
+        with torch.no_grad():
+            features = self.module(batch.to(self.device))
+        return features.float().cpu().numpy()
+
+
+class OnnxBackend:
+    """Encoder exportado para ONNX e executado pelo ONNX Runtime."""
+
+    name = "onnx"
+
+    def __init__(self, path, threads=0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def encode(self, batch):
+        if hasattr(batch, "numpy"):
+            batch = batch.detach().cpu().numpy()
+        inputs = np.ascontiguousarray(batch, dtype=np.float32)
+        return self.session.run(None, {self.input_name: inputs})[0]
+
+
+def default_artifact_path(directory, model_name, pretrained, backend):
+    """Caminho padrão do artefato exportado para um modelo/backend."""
+    extension = {"torchscript": "pt", "onnx": "onnx"}[backend]
+    safe_name = f"{model_name}-{pretrained}".replace("/", "_")
+    return os.path.join(directory, f"clip-{safe_name}.{extension}")
+
+
+def create_backend(name, model, device, artifact_path=None, onnx_threads=0):
+    """
+    Instancia o backend configurado.
+
+    Args:
+        name: "eager", "torchscript" ou "onnx"
+        model: Modelo open_clip já carregado (usado pelo backend eager)
+        device: Dispositivo do torch
+        artifact_path: Arquivo exportado (TorchScript/ONNX)
+        onnx_threads: Threads intra-op do ONNX Runtime (0 = padrão)
+
+    Returns:
+        Objeto com método encode(batch) -> np.ndarray
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Backend de encoder desconhecido: {name}")
+    if name == "eager":
+        return EagerBackend(model, device)
+    if not artifact_path or not os.path.exists(artifact_path):
+        raise FileNotFoundError(
+            f"Artefato do backend {name} não encontrado: {artifact_path}. "
+            "Gere-o com scripts/exportar_encoder_clip.py"
+        )
+    if name == "torchscript":
+        return TorchScriptBackend(artifact_path, device)
+    return OnnxBackend(artifact_path, threads=onnx_threads)
+
+
+def _image_size(model):
+    size = getattr(model.visual, "image_size", 224)
+    if isinstance(size, int):
+        return (size, size)
+    return tuple(size)
+
+
+def _image_encoder_module(model):
+    import torch
+
+    class ImageEncoder(torch.nn.Module):
+        def __init__(self, clip_model):
+            super().__init__()
+            self.clip_model = clip_model
+
+        def forward(self, images):
+            return self.clip_model.encode_image(images)
+
+    return ImageEncoder(model).eval()
+
+
+def export_torchscript(model, path, batch_size=2):
+    """Traça o encoder de imagens, congela o grafo e salva em `path`."""
+    import torch
+
+    height, width = _image_size(model)
+    example = torch.randn(batch_size, 3, height, width)
+    encoder = _image_encoder_module(model.cpu())
+    with torch.no_grad():
+        traced = torch.jit.trace(encoder, example)
+        traced = torch.jit.freeze(traced)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    traced.save(path)
+    logger.info(f"Encoder TorchScript exportado para {path}")
+    return path
+
+
+def export_onnx(model, path, opset=17, batch_size=2):
+    """Exporta o encoder de imagens para ONNX com eixo de lote dinâmico."""
+    import torch
+
+    height, width = _image_size(model)
+    example = torch.randn(batch_size, 3, height, width)
+    encoder = _image_encoder_module(model.cpu())
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            encoder,
+            example,
+            path,
+            input_names=["images"],
+            output_names=["embeddings"],
+            dynamic_axes={"images": {0: "batch"}, "embeddings": {0: "batch"}},
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    logger.info(f"Encoder ONNX exportado para {path}")
+    return path
+
+
+def cosine_similarities(reference, candidate):
+    """Similaridade de cosseno linha a linha entre duas matrizes (N, D)."""
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    numerator = np.sum(reference * candidate, axis=1)
+    denominator = np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    return numerator / np.maximum(denominator, 1e-12)
+
+
+def check_parity(reference_backend, candidate_backend, batch, threshold=PARITY_THRESHOLD):
+    """
+    Compara os embeddings de dois backends para o mesmo lote.
+
+    Returns:
+        Dict com similaridade mínima/média e se a paridade foi atingida
+
+    Raises:
+        ValueError: se a similaridade mínima ficar abaixo de `threshold`
+    """
+    similarities = cosine_similarities(
+        reference_backend.encode(batch), candidate_backend.encode(batch)
+    )
+    result = {
+        "backend": candidate_backend.name,
+        "samples": int(similarities.shape[0]),
+        "min_cosine": float(similarities.min()),
+        "mean_cosine": float(similarities.mean()),
+        "threshold": threshold,
+    }
+    result["ok"] = result["min_cosine"] >= threshold
+    # Não é assert: com python -O a checagem sumiria e o artefato seria aceito
+    if not result["ok"]:
+        raise ValueError(
+            f"Paridade do backend {candidate_backend.name} abaixo do limite: "
+            f"{result['min_cosine']:.5f} < {threshold}"
+        )
+    return result
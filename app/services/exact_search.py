@@ -0,0 +1,544 @@
+"""
+Busca exata em processo sobre uma matriz de embeddings memory-mapped.
+
+Para catálogos de dezenas de milhares de implantes, um produto
+matriz-vetor (BLAS) é mais rápido que um round trip ao PostgreSQL.
+A coluna implants.embedding é exportada para um .npy float32 contíguo
+(scripts/exportar_catalogo_embeddings.py); cada worker do uvicorn abre o
+arquivo com mmap, então as páginas ficam compartilhadas no page cache.
+
+O ranking usa a mesma distância L2 do operador <-> do pgvector, e os
+resultados trazem `distance` (L2) e `similarity` (cosseno), como no SQL.
+
+Filtros por fabricante, tipo e lista de ids usam sub-índices montados na
+carga: a busca só calcula distâncias para as linhas selecionadas. Como a
+exportação é ordenada por fabricante e tipo, cada grupo é uma fatia
+contígua da matriz e o filtro não copia nada do arquivo mapeado.
+
+Snapshot (formato 2): além da matriz, os metadados são gravados por coluna
+(ids e códigos de fabricante/tipo em .npy, também mapeados; nome e
+image_url como listas no metadata.json) com o modelo dos embeddings
+(model_version) e um checksum SHA-256 do conteúdo. A carga não monta um
+dict por implante: as linhas viram dict só no top-k (CatalogRows), e os
+sub-índices saem dos códigos com NumPy. Exportações no formato 1 (lista
+"implants") continuam legíveis.
+
+O diretório do catálogo é um symlink para a exportação atual
+(`{diretório}.snap-<instante>`), trocado atomicamente por install_catalog; a
+carga resolve o link uma vez e lê todos os arquivos da mesma exportação.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger("raiox-api")
+
+EMBEDDINGS_FILE = "embeddings.npy"
+NORMS_FILE = "norms.npy"
+METADATA_FILE = "metadata.json"
+IDS_FILE = "ids.npy"
+CODES_FILE = "{field}_codes.npy"
+
+SNAPSHOT_FORMAT = 2
+
+# Colunas exportadas junto com os embeddings
+METADATA_FIELDS = ("id", "name", "manufacturer", "type", "image_url")
+
+# Colunas com sub-índice por valor (filtros da busca)
+FILTER_FIELDS = ("manufacturer", "type")
+
+# Arquivos de um snapshot (os .npy de colunas não existem no formato 1)
+CATALOG_FILES = (
+    (EMBEDDINGS_FILE, NORMS_FILE, IDS_FILE)
+    + tuple(CODES_FILE.format(field=field) for field in FILTER_FIELDS)
+    + (METADATA_FILE,)
+)
+
+# Sufixo das exportações apontadas pelo symlink do catálogo
+SNAPSHOT_SUFFIX = ".snap-"
+
+_NO_ROWS = np.empty(0, dtype=np.int64)
+
+
+def embedding_to_numpy(value):
+    """Converte o valor lido do pgvector (Vector ou np.ndarray) em float32."""
+    if hasattr(value, "to_numpy"):
+        value = value.to_numpy()
+    return np.asarray(value, dtype=np.float32)
+
+
+class CatalogRows:
+    """
+    Metadados do snapshot por coluna, com a interface de uma lista de dicts.
+
+    Args:
+        ids: np.ndarray int64 de ids (linha -> id)
+        codes: {campo de filtro: np.ndarray int32 de códigos}
+        categories: {campo de filtro: lista de valores (código -> valor)}
+        columns: {"name": lista, "image_url": lista}
+    """
+
+    def __init__(self, ids, codes, categories, columns):
+        self.ids = ids
+        self.codes = codes
+        self.categories = categories
+        self.columns = columns
+
+    def __len__(self):
+        return self.ids.shape[0]
+
+    def __getitem__(self, row):
+        return {
+            "id": int(self.ids[row]),
+            "name": self.columns["name"][row],
+            "manufacturer": self.categories["manufacturer"][self.codes["manufacturer"][row]],
+            "type": self.categories["type"][self.codes["type"][row]],
+            "image_url": self.columns["image_url"][row],
+        }
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def subindexes(self):
+        """Mesmo resultado de build_subindexes, a partir dos códigos."""
+        subindexes = {}
+        for field in FILTER_FIELDS:
+            codes = np.asarray(self.codes[field])
+            # Ordenação estável: as linhas de cada valor ficam em ordem crescente
+            order = np.argsort(codes, kind="stable")
+            counts = np.bincount(codes, minlength=len(self.categories[field]))
+            groups = np.split(order, np.cumsum(counts)[:-1])
+            subindexes[field] = {
+                value: rows.astype(np.int64) for value, rows in zip(self.categories[field], groups) if len(rows)
+            }
+        subindexes["id"] = dict(zip(self.ids.tolist(), range(len(self))))
+        return subindexes
+
+
+def build_subindexes(implants):
+    """
+    Agrupa as linhas do catálogo por valor de cada campo de filtro.
+
+    Returns:
+        Dict campo -> {valor: np.ndarray de linhas} e "id" -> {id: linha}
+    """
+    if isinstance(implants, CatalogRows):
+        return implants.subindexes()
+    groups = {field: {} for field in FILTER_FIELDS}
+    for row, implant in enumerate(implants):
+        for field in FILTER_FIELDS:
+            groups[field].setdefault(implant.get(field), []).append(row)
+    subindexes = {
+        field: {value: np.asarray(rows, dtype=np.int64) for value, rows in values.items()}
+        for field, values in groups.items()
+    }
+    subindexes["id"] = {implant["id"]: row for row, implant in enumerate(implants)}
+    return subindexes
+
+
+def select_rows(subindexes, filters):
+    """
+    Linhas do catálogo que atendem aos filtros (manufacturer, type, ids).
+
+    Returns:
+        None sem filtros; slice quando as linhas são contíguas (sem cópia da
+        matriz memory-mapped); senão np.ndarray ordenado de linhas
+    """
+    if not filters:
+        return None
+    rows = None
+    for field in FILTER_FIELDS:
+        if filters.get(field) is None:
+            continue
+        matched = subindexes[field].get(filters[field], _NO_ROWS)
+        rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+    if filters.get("ids") is not None:
+        by_id = subindexes["id"]
+        matched = np.asarray(sorted({by_id[i] for i in filters["ids"] if i in by_id}), dtype=np.int64)
+        rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+    if rows is None:
+        return None
+    if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+        return slice(int(rows[0]), int(rows[-1]) + 1)
+    return rows
+
+
+def _category_order(value):
+    # None (sem fabricante/tipo) primeiro; demais em ordem alfabética
+    return (value is not None, value or "")
+
+
+def snapshot_checksum(embeddings, ids, codes, categories, columns):
+    """SHA-256 do conteúdo do snapshot (matriz, colunas e categorias)."""
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+    digest.update(np.ascontiguousarray(ids, dtype=np.int64).tobytes())
+    for field in FILTER_FIELDS:
+        digest.update(np.ascontiguousarray(codes[field], dtype=np.int32).tobytes())
+    digest.update(
+        json.dumps({"categories": categories, "columns": columns}, sort_keys=True, ensure_ascii=False).encode()
+    )
+    return digest.hexdigest()
+
+
+def _snapshot_version(directory):
+    try:
+        with open(os.path.join(directory, METADATA_FILE)) as f:
+            return json.load(f).get("version")
+    except (OSError, ValueError):
+        return None
+
+
+def install_catalog(staging, directory):
+    """
+    Publica o snapshot de `staging` em `directory` trocando um symlink.
+
+    `staging` vira `{directory}.snap-<instante>` e o link `directory` passa a
+    apontar para ele com os.replace: um worker vê a exportação anterior ou a
+    nova, nunca o diretório ausente. Arquivos derivados (projeção PCA, índice
+    PQ) da exportação anterior são mantidos quando a versão dos embeddings é
+    a mesma; de outra versão, ficam com ela e precisam ser reconstruídos. Só
+    a exportação atual e a anterior ficam no disco.
+
+    Um `directory` que ainda é um diretório comum (instalações antigas) é
+    convertido uma vez, com uma janela curta sem catálogo.
+    """
+    directory = os.path.abspath(directory)
+    parent, base = os.path.split(directory)
+    previous = os.path.realpath(directory) if os.path.islink(directory) else None
+    if previous is None and os.path.isdir(directory):
+        previous = f"{directory}{SNAPSHOT_SUFFIX}legacy-{os.getpid()}"
+        os.rename(directory, previous)
+        os.symlink(os.path.basename(previous), directory)
+
+    version = _snapshot_version(staging)
+    if previous and version and _snapshot_version(previous) == version:
+        for name in os.listdir(previous):
+            if name in CATALOG_FILES or os.path.exists(os.path.join(staging, name)):
+                continue
+            try:
+                os.link(os.path.join(previous, name), os.path.join(staging, name))
+            except OSError:
+                shutil.copy2(os.path.join(previous, name), os.path.join(staging, name))
+
+    target = f"{directory}{SNAPSHOT_SUFFIX}{time.time_ns()}-{os.getpid()}"
+    os.rename(staging, target)
+    # Link relativo: o diretório pai pode ser copiado/montado em outro caminho
+    link = f"{directory}.link-{os.getpid()}"
+    os.symlink(os.path.basename(target), link)
+    os.replace(link, directory)
+
+    # Workers com a exportação anterior aberta seguem com ela até recarregar
+    keep = {target, previous}
+    for name in os.listdir(parent):
+        path = os.path.join(parent, name)
+        if name.startswith(f"{base}{SNAPSHOT_SUFFIX}") and path not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def export_catalog(rows, directory, model_version=None):
+    """
+    Grava o snapshot do catálogo no formato lido por MmapExactSearch.
+
+    Os arquivos são escritos em um diretório temporário e publicados por
+    install_catalog, para que workers nunca leiam uma exportação pela metade.
+
+    Args:
+        rows: Iterável de (id, name, manufacturer, type, image_url, embedding),
+            de preferência ordenado por manufacturer, type (filtros sem cópia)
+        directory: Diretório de destino
+        model_version: Modelo que gerou os embeddings (implants.model_version)
+
+    Returns:
+        Número de implantes exportados
+    """
+    values = {field: [] for field in METADATA_FIELDS}
+    vectors = []
+    for row in rows:
+        for field, value in zip(METADATA_FIELDS, row[:5]):
+            values[field].append(value)
+        vectors.append(embedding_to_numpy(row[5]))
+    if not vectors:
+        raise ValueError("Catálogo vazio: nada a exportar")
+    embeddings = np.ascontiguousarray(np.stack(vectors), dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1).astype(np.float32)
+    ids = np.asarray(values["id"], dtype=np.int64)
+    categories, codes = {}, {}
+    for field in FILTER_FIELDS:
+        categories[field] = sorted(set(values[field]), key=_category_order)
+        position = {value: code for code, value in enumerate(categories[field])}
+        codes[field] = np.asarray([position[value] for value in values[field]], dtype=np.int32)
+    columns = {"name": values["name"], "image_url": values["image_url"]}
+    # Identifica a exportação: arquivos derivados (projeções) guardam a versão de origem
+    version = hashlib.sha256(embeddings.tobytes()).hexdigest()[:16]
+
+    directory = os.path.abspath(directory)
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    staging = f"{directory}.tmp-{os.getpid()}"
+    os.makedirs(staging, exist_ok=True)
+    np.save(os.path.join(staging, EMBEDDINGS_FILE), embeddings)
+    np.save(os.path.join(staging, NORMS_FILE), norms)
+    np.save(os.path.join(staging, IDS_FILE), ids)
+    for field in FILTER_FIELDS:
+        np.save(os.path.join(staging, CODES_FILE.format(field=field)), codes[field])
+    with open(os.path.join(staging, METADATA_FILE), "w") as f:
+        json.dump(
+            {
+                "format": SNAPSHOT_FORMAT,
+                "dimension": int(embeddings.shape[1]),
+                "rows": int(embeddings.shape[0]),
+                "version": version,
+                "model_version": model_version,
+                "checksum": snapshot_checksum(embeddings, ids, codes, categories, columns),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "categories": categories,
+                "columns": columns,
+            },
+            f,
+            ensure_ascii=False,
+        )
+
+    install_catalog(staging, directory)
+    logger.info(f"Catálogo exportado para {directory}: {len(ids)} implantes")
+    return len(ids)
+
+
+def load_metadata(directory, mmap_mode="r"):
+    """
+    Lê metadata.json de um snapshot.
+
+    Returns:
+        Dict do metadata.json em que "implants" é sempre uma sequência de
+        dicts por linha (CatalogRows no formato 2, a lista no formato 1) e
+        "directory" é o diretório lido, com o symlink do catálogo resolvido
+    """
+    directory = os.path.realpath(directory)
+    with open(os.path.join(directory, METADATA_FILE)) as f:
+        metadata = json.load(f)
+    if metadata.get("format", 1) >= 2:
+        metadata["implants"] = CatalogRows(
+            np.load(os.path.join(directory, IDS_FILE), mmap_mode=mmap_mode),
+            {
+                field: np.load(os.path.join(directory, CODES_FILE.format(field=field)), mmap_mode=mmap_mode)
+                for field in FILTER_FIELDS
+            },
+            metadata["categories"],
+            metadata["columns"],
+        )
+    metadata["directory"] = directory
+    return metadata
+
+
+def verify_snapshot(directory, model_version=None):
+    """
+    Confere o checksum (e, se informado, o modelo) de um snapshot.
+
+    Lê todos os arquivos: é para a instalação/cópia do snapshot, não para
+    cada carga de worker.
+
+    Raises:
+        ValueError: Snapshot corrompido, sem checksum ou de outro modelo
+    """
+    metadata = load_metadata(directory, mmap_mode=None)
+    if "checksum" not in metadata:
+        raise ValueError(f"Snapshot sem checksum (formato {metadata.get('format', 1)}) em {directory}")
+    if model_version and metadata.get("model_version") != model_version:
+        raise ValueError(f"Snapshot de {metadata.get('model_version')}, esperado {model_version}")
+    implants = metadata["implants"]
+    embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE))
+    checksum = snapshot_checksum(embeddings, implants.ids, implants.codes, implants.categories, implants.columns)
+    if checksum != metadata["checksum"]:
+        raise ValueError(f"Checksum do snapshot não confere em {directory}")
+    return metadata
+
+
+class MmapExactSearch:
+    """
+    Backend de busca exata top-k com NumPy sobre um catálogo memory-mapped.
+
+    Args:
+        directory: Diretório gerado por export_catalog
+        reload_interval: Intervalo mínimo (s) entre verificações de nova exportação
+        model_version: Modelo das consultas; snapshots de outro modelo são
+            recusados (None = não verifica)
+    """
+
+    name = "exact"
+
+    def __init__(self, directory, reload_interval=30.0, model_version=None):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.model_version = model_version
+        self._lock = threading.Lock()
+        self._embeddings = None
+        self._norms = None
+        self._implants = None
+        self._subindexes = None
+        self._version = None
+        self._snapshot_model = None
+        self._loaded_mtime = None
+        self._last_check = 0.0
+        self._searches = 0
+        self._search_total = 0.0
+
+    def _metadata_path(self):
+        return os.path.join(self.directory, METADATA_FILE)
+
+    def _watch_paths(self):
+        # Arquivos cujos mtimes indicam uma nova exportação
+        return (self._metadata_path(),)
+
+    def _watch_mtimes(self):
+        return tuple(os.path.getmtime(path) for path in self._watch_paths())
+
+    def _load_companions(self, metadata):
+        """
+        Arquivos derivados do catálogo (índices, projeções) carregados junto dele.
+
+        Subclasses devolvem {atributo: valor}; os atributos são trocados sob o
+        mesmo lock que o catálogo. Um ValueError mantém o catálogo anterior.
+        Arquivos do diretório do catálogo devem ser lidos de
+        metadata["directory"] (a exportação carregada, com o link resolvido).
+        """
+        return {}
+
+    def load(self):
+        """(Re)abre os arquivos do catálogo."""
+        mtime = self._watch_mtimes()
+        metadata = load_metadata(self.directory)
+        directory = metadata["directory"]
+        snapshot_model = metadata.get("model_version")
+        if self.model_version and snapshot_model and snapshot_model != self.model_version:
+            raise ValueError(f"Catálogo exportado com {snapshot_model}, a API usa {self.model_version}")
+        embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r")
+        norms = np.load(os.path.join(directory, NORMS_FILE), mmap_mode="r")
+        implants = metadata["implants"]
+        if embeddings.shape[0] != len(implants) or norms.shape[0] != len(implants):
+            raise ValueError(f"Catálogo inconsistente em {self.directory}")
+        subindexes = build_subindexes(implants)
+        companions = self._load_companions(metadata)
+        with self._lock:
+            self._embeddings = embeddings
+            self._norms = norms
+            self._implants = implants
+            self._subindexes = subindexes
+            for name, value in companions.items():
+                setattr(self, name, value)
+            self._version = metadata.get("version")
+            self._snapshot_model = snapshot_model
+            self._loaded_mtime = mtime
+        logger.info(f"Catálogo em memória carregado: {len(implants)} implantes")
+
+    def _ensure_loaded(self):
+        now = time.monotonic()
+        if self._embeddings is not None and now - self._last_check < self.reload_interval:
+            return
+        self._last_check = now
+        try:
+            mtime = self._watch_mtimes()
+        except OSError:
+            if self._embeddings is None:
+                raise
+            return
+        if mtime != self._loaded_mtime:
+            try:
+                self.load()
+            except (OSError, ValueError) as e:
+                if self._embeddings is None:
+                    raise
+                # Exportação pela metade ou arquivos derivados desatualizados:
+                # segue com o catálogo anterior e tenta de novo no próximo intervalo
+                logger.warning(f"Recarga do catálogo ignorada: {e}")
+
+    def catalog_version(self):
+        """Identifica o catálogo carregado: muda a cada exportação ou índice novo."""
+        self._ensure_loaded()
+        with self._lock:
+            return f"{self._version}:{self._loaded_mtime}"
+
+    @property
+    def size(self):
+        self._ensure_loaded()
+        return len(self._implants)
+
+    def _top_k(self, norms, implants, scores, query_norm, limit, rows=None):
+        # ||x - q||² = ||x||² - 2 x·q + ||q||²
+        distances = norms * norms - 2.0 * scores + query_norm * query_norm
+        k = min(limit, distances.shape[0])
+        if k <= 0:
+            return []
+        candidates = np.argpartition(distances, k - 1)[:k]
+        candidates = candidates[np.argsort(distances[candidates], kind="stable")]
+        results = []
+        for index in candidates:
+            # Posição no subconjunto filtrado -> linha do catálogo
+            if rows is None:
+                row = index
+            elif isinstance(rows, slice):
+                row = rows.start + index
+            else:
+                row = rows[index]
+            implant = dict(implants[row])
+            implant["distance"] = float(np.sqrt(max(float(distances[index]), 0.0)))
+            denominator = float(norms[index]) * query_norm
+            implant["similarity"] = float(scores[index]) / denominator if denominator else 0.0
+            results.append(implant)
+        return results
+
+    def search(self, query_vector, limit=3, filters=None):
+        """
+        Top-k exato por distância L2.
+
+        Args:
+            query_vector: Embedding da consulta
+            limit: Quantidade de resultados
+            filters: Dict opcional com manufacturer, type e/ou ids
+
+        Returns:
+            Lista de dicts no formato do ImplantSchema, com distance e similarity
+        """
+        return self.search_many([query_vector], limit=limit, filters=filters)[0]
+
+    def search_many(self, query_vectors, limit=3, filters=None):
+        """Top-k exato para várias consultas com um único produto matricial."""
+        started = time.perf_counter()
+        self._ensure_loaded()
+        with self._lock:
+            embeddings, norms, implants = self._embeddings, self._norms, self._implants
+            subindexes = self._subindexes
+        queries = np.ascontiguousarray(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        if queries.shape[0] == 0:
+            return []
+        rows = select_rows(subindexes, filters)
+        if rows is not None:
+            embeddings, norms = embeddings[rows], norms[rows]
+        scores = queries @ embeddings.T
+        query_norms = np.linalg.norm(queries, axis=1)
+        results = [
+            self._top_k(norms, implants, scores[i], float(query_norms[i]), limit, rows)
+            for i in range(queries.shape[0])
+        ]
+        with self._lock:
+            self._searches += queries.shape[0]
+            self._search_total += time.perf_counter() - started
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.name,
+                "directory": self.directory,
+                "implants": len(self._implants) if self._implants is not None else 0,
+                "model_version": self._snapshot_model,
+                "searches": self._searches,
+                "avg_ms": (self._search_total / self._searches * 1000.0) if self._searches else 0.0,
+            }
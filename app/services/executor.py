@@ -0,0 +1,163 @@
+"""
+Camada de execução da inferência fora do event loop do asyncio.
+
+O pré-processamento e o forward pass do CLIP são CPU-bound e síncronos;
+executá-los diretamente dentro de um endpoint `async def` trava o event loop
+do uvicorn (healthcheck incluso). Este módulo oferece um pool de threads
+dedicado para o torch e, opcionalmente, um pool de processos para a
+decodificação/pré-processamento das imagens.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger("raiox-api")
+
+# Estado por processo do pool de pré-processamento
+_worker_preprocess = None
+
+
+def _init_preprocess_worker(preprocess):
+    """Inicializador dos processos filhos: guarda o pré-processador de imagens."""
+    global _worker_preprocess
+    _worker_preprocess = preprocess
+
+
+def preprocess_in_worker(image_data):
+    """
+    Decodifica e pré-processa uma imagem dentro de um processo do pool.
+
+    Args:
+        image_data: Dados binários da imagem
+
+    Returns:
+        Tensor pré-processado (C, H, W)
+    """
+    return _worker_preprocess(image_data)
+
+
+class InferenceExecutor:
+    """
+    Pools dedicados para trabalho CPU-bound da inferência.
+
+    Args:
+        max_workers: Número de threads para o torch
+        process_workers: Número de processos para pré-processamento (0 desativa)
+        preprocess: Pré-processador (bytes -> tensor) enviado aos processos filhos
+        name: Prefixo dos nomes das threads
+    """
+
+    def __init__(self, max_workers=4, process_workers=0, preprocess=None, name="inference"):
+        self.max_workers = max(1, int(max_workers))
+        self.process_workers = max(0, int(process_workers))
+        self._threads = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix=name
+        )
+        self._processes = None
+        if preprocess is not None:
+            self.start_process_pool(preprocess)
+
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @property
+    def has_process_pool(self):
+        return self._processes is not None
+
+    def _track(self, fn, enqueued_at, ticket):
+        def wrapper(*args):
+            wait = time.perf_counter() - enqueued_at
+            with self._lock:
+                if ticket["abandoned"]:
+                    # Quem pediu já desistiu (ex.: cliente desconectou) e liberou a vaga na fila
+                    return None
+                ticket["started"] = True
+                self._queued -= 1
+                self._running += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+        return wrapper
+
+    def start_process_pool(self, preprocess):
+        """
+        Cria o pool de processos de pré-processamento (se configurado).
+
+        Chamado quando o pré-processador fica disponível, isto é,
+        depois que o modelo termina de carregar.
+        """
+        if not self.process_workers or self._processes is not None:
+            return
+        self._processes = ProcessPoolExecutor(
+            max_workers=self.process_workers,
+            initializer=_init_preprocess_worker,
+            initargs=(preprocess,),
+        )
+
+    async def run(self, fn, *args):
+        """Executa `fn(*args)` no pool de threads e aguarda o resultado."""
+        loop = asyncio.get_running_loop()
+        ticket = {"started": False, "abandoned": False}
+        with self._lock:
+            self._queued += 1
+        try:
+            result = await loop.run_in_executor(
+                self._threads, self._track(fn, time.perf_counter(), ticket), *args
+            )
+        except BaseException as e:
+            with self._lock:
+                if not ticket["started"]:
+                    # Cancelada antes de pegar uma thread: o wrapper não vai decrementar a fila
+                    ticket["abandoned"] = True
+                    self._queued -= 1
+                if isinstance(e, Exception):
+                    self._failed += 1
+            raise
+        with self._lock:
+            self._completed += 1
+        return result
+
+    async def run_preprocess(self, image_data):
+        """Pré-processa uma imagem no pool de processos."""
+        if self._processes is None:
+            raise RuntimeError("Pool de processos de pré-processamento não configurado")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._processes, preprocess_in_worker, image_data)
+
+    def queue_depth(self):
+        """Tarefas submetidas que ainda aguardam uma thread livre."""
+        with self._lock:
+            return self._queued
+
+    def stats(self):
+        with self._lock:
+            started = self._completed + self._failed + self._running
+            return {
+                "threads": self.max_workers,
+                "process_workers": self.process_workers if self._processes else 0,
+                "queue_depth": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "failed": self._failed,
+                "queue_wait_ms": {
+                    "avg": (self._wait_total / started * 1000.0) if started else 0.0,
+                    "max": self._wait_max * 1000.0,
+                },
+            }
+
+    def shutdown(self, wait=True):
+        self._threads.shutdown(wait=wait)
+        if self._processes is not None:
+            self._processes.shutdown(wait=wait)
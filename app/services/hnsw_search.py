@@ -0,0 +1,203 @@
+"""
+Busca aproximada (HNSW) em processo sobre o catálogo exportado.
+
+Com centenas de milhares de imagens no catálogo, nem o scan linear do
+pgvector nem o produto matricial da busca exata mantêm a latência constante.
+O índice HNSW (hnswlib, dependência opcional) é construído a partir do
+catálogo exportado por scripts/exportar_catalogo_embeddings.py, gravado em
+disco (HNSW_INDEX_PATH) e carregado por cada worker; os workers recarregam
+quando o catálogo ou o arquivo do índice muda. Os rótulos do índice são
+linhas do catálogo: um índice construído para outra exportação (mesmo com o
+mesmo número de linhas) é recusado pela versão gravada nos parâmetros.
+
+Parâmetros:
+- M: vizinhos por nó (memória e qualidade do grafo);
+- ef_construction: largura da busca na construção (tempo de build e recall);
+- ef_search: largura da busca na consulta (latência vs recall), ajustável
+  sem reconstruir o índice.
+
+O espaço é L2, o mesmo do operador <-> do pgvector; os resultados trazem
+`distance` (L2) e `similarity` (cosseno), como os demais backends.
+
+Buscas com filtro (fabricante, tipo, ids) não passam pelo grafo: filtrar
+depois do HNSW devolveria menos de k resultados quando o filtro é seletivo.
+Elas usam a busca exata sobre o sub-índice do filtro, que já é uma fração
+do catálogo.
+"""
+
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from app.services.exact_search import EMBEDDINGS_FILE, METADATA_FILE, MmapExactSearch
+
+logger = logging.getLogger("raiox-api")
+
+
+def _import_hnswlib():
+    try:
+        import hnswlib
+    except ImportError:
+        raise RuntimeError("Backend hnsw requer o pacote hnswlib (pip install hnswlib)")
+    return hnswlib
+
+
+def params_path(index_path):
+    """Arquivo com os parâmetros de construção gravado ao lado do índice."""
+    return f"{index_path}.json"
+
+
+def build_hnsw_index(catalog_dir, index_path, m=16, ef_construction=200, num_threads=-1):
+    """
+    Constrói o índice HNSW a partir do catálogo exportado e grava em disco.
+
+    O arquivo é escrito em um caminho temporário e trocado por rename, para
+    que workers nunca carreguem um índice pela metade.
+
+    Args:
+        catalog_dir: Diretório gerado por export_catalog
+        index_path: Arquivo de destino do índice
+        m: Parâmetro M do HNSW
+        ef_construction: ef usado na construção
+        num_threads: Threads da construção (-1 = todos os núcleos)
+
+    Returns:
+        Dict com os parâmetros e o tempo de construção
+    """
+    hnswlib = _import_hnswlib()
+    with open(os.path.join(catalog_dir, METADATA_FILE)) as f:
+        catalog_version = json.load(f).get("version")
+    embeddings = np.load(os.path.join(catalog_dir, EMBEDDINGS_FILE), mmap_mode="r")
+    count, dimension = embeddings.shape
+
+    started = time.perf_counter()
+    index = hnswlib.Index(space="l2", dim=int(dimension))
+    index.init_index(max_elements=int(count), ef_construction=int(ef_construction), M=int(m))
+    # Os rótulos são as linhas do catálogo, alinhadas com metadata.json
+    index.add_items(np.asarray(embeddings), np.arange(count), num_threads=num_threads)
+    elapsed = time.perf_counter() - started
+
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    params = {
+        "catalog_version": catalog_version,
+        "m": int(m),
+        "ef_construction": int(ef_construction),
+        "count": int(count),
+        "dimension": int(dimension),
+        "build_seconds": round(elapsed, 3),
+    }
+    staging = f"{index_path}.tmp-{os.getpid()}"
+    index.save_index(staging)
+    with open(params_path(staging), "w") as f:
+        json.dump(params, f)
+    # Parâmetros antes do índice: o worker observa o mtime do índice
+    os.replace(params_path(staging), params_path(index_path))
+    os.replace(staging, index_path)
+    logger.info(f"Índice HNSW gravado em {index_path}: {count} vetores em {elapsed:.1f}s")
+    return params
+
+
+class HnswSearch(MmapExactSearch):
+    """
+    Backend de busca aproximada com hnswlib.
+
+    Reaproveita o catálogo memory-mapped da busca exata para metadados,
+    normas e similaridade de cosseno; o índice só decide os candidatos.
+
+    Args:
+        directory: Diretório gerado por export_catalog
+        index_path: Arquivo gerado por build_hnsw_index
+        ef_search: ef usado nas consultas
+        reload_interval: Intervalo mínimo (s) entre verificações de novo índice
+        model_version: Modelo das consultas (ver MmapExactSearch)
+    """
+
+    name = "hnsw"
+
+    def __init__(self, directory, index_path, ef_search=64, reload_interval=30.0, model_version=None):
+        super().__init__(directory, reload_interval=reload_interval, model_version=model_version)
+        self.index_path = index_path
+        self.ef_search = int(ef_search)
+        self._index = None
+        self._params = {}
+
+    def _watch_paths(self):
+        # Uma nova exportação sozinha também dispara o reload (e é recusada
+        # até o índice ser reconstruído para ela)
+        return (self._metadata_path(), self.index_path)
+
+    def _load_companions(self, metadata):
+        hnswlib = _import_hnswlib()
+        with open(params_path(self.index_path)) as f:
+            params = json.load(f)
+        if params.get("catalog_version") != metadata.get("version"):
+            raise ValueError("Índice HNSW construído para outra exportação do catálogo: reconstrua o índice")
+        index = hnswlib.Index(space="l2", dim=int(params["dimension"]))
+        index.load_index(self.index_path, max_elements=int(params["count"]))
+        index.set_ef(self.ef_search)
+        # Consultas já rodam em threads do executor; sem paralelismo interno
+        index.set_num_threads(1)
+
+        if index.get_current_count() != len(metadata["implants"]):
+            raise ValueError(
+                f"Índice HNSW desatualizado ({index.get_current_count()} vetores, "
+                f"catálogo com {len(metadata['implants'])}): reconstrua o índice"
+            )
+        logger.info(f"Índice HNSW carregado (M={params['m']}, ef_search={self.ef_search})")
+        return {"_index": index, "_params": params}
+
+    def set_ef_search(self, ef_search):
+        """Ajusta o ef das consultas sem recarregar o índice."""
+        self.ef_search = int(ef_search)
+        with self._lock:
+            if self._index is not None:
+                self._index.set_ef(self.ef_search)
+
+    def search_many(self, query_vectors, limit=3, filters=None):
+        """Top-k aproximado para várias consultas em uma chamada ao índice."""
+        if filters:
+            return super().search_many(query_vectors, limit=limit, filters=filters)
+        started = time.perf_counter()
+        self._ensure_loaded()
+        with self._lock:
+            index, embeddings, norms, implants = self._index, self._embeddings, self._norms, self._implants
+        queries = np.ascontiguousarray(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        if queries.shape[0] == 0:
+            return []
+        k = min(limit, len(implants))
+        if k <= 0:
+            return [[] for _ in range(queries.shape[0])]
+        # O hnswlib usa max(ef, k) internamente: limit > ef_search continua correto
+        labels, squared = index.knn_query(queries, k=k)
+
+        query_norms = np.linalg.norm(queries, axis=1)
+        results = []
+        for i in range(queries.shape[0]):
+            rows = labels[i]
+            scores = np.asarray(embeddings[rows]) @ queries[i]
+            items = []
+            for row, score, distance in zip(rows, scores, squared[i]):
+                implant = dict(implants[row])
+                implant["distance"] = float(np.sqrt(max(float(distance), 0.0)))
+                denominator = float(norms[row]) * float(query_norms[i])
+                implant["similarity"] = float(score) / denominator if denominator else 0.0
+                items.append(implant)
+            results.append(items)
+        with self._lock:
+            self._searches += queries.shape[0]
+            self._search_total += time.perf_counter() - started
+        return results
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats.update({
+                "index_path": self.index_path,
+                "ef_search": self.ef_search,
+                "m": self._params.get("m"),
+                "ef_construction": self._params.get("ef_construction"),
+            })
+        return stats
@@ -0,0 +1,148 @@
+"""
+Download de imagens por URL (/webhook, /search/batch) sem travar o event loop.
+
+Um único httpx.AsyncClient por processo mantém as conexões abertas entre
+requisições (keep-alive) e usa HTTP/2 quando o pacote h2 está instalado; ele
+é criado junto com o ImageFetcher, porque a carga do contexto SSL é síncrona
+e travaria o event loop na primeira requisição. O corpo é lido em streaming
+e o download é interrompido assim que passa de `max_bytes` (ou antes, pelo
+Content-Length), com timeouts de conexão e de leitura por chunk e um prazo
+total para servidores que enviam devagar.
+"""
+
+import asyncio
+import logging
+import time
+
+import httpx
+
+logger = logging.getLogger("raiox-api")
+
+
+class ImageFetchError(Exception):
+    """Falha no download; `status_code` é o código HTTP sugerido para a resposta da API."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class ImageFetcher:
+    """
+    Cliente HTTP compartilhado para baixar imagens.
+
+    Args:
+        max_bytes: Tamanho máximo da imagem
+        connect_timeout: Timeout (s) para abrir a conexão
+        read_timeout: Timeout (s) entre dois chunks do corpo
+        total_timeout: Prazo (s) do download inteiro
+        max_connections: Conexões simultâneas do pool
+        max_keepalive: Conexões ociosas mantidas abertas
+        http2: Usa HTTP/2 quando o pacote h2 estiver instalado
+    """
+
+    def __init__(
+        self, max_bytes=20 * 2**20, connect_timeout=5.0, read_timeout=10.0, total_timeout=30.0,
+        max_connections=100, max_keepalive=20, http2=True,
+    ):
+        self.max_bytes = int(max_bytes)
+        self.connect_timeout = float(connect_timeout)
+        self.read_timeout = float(read_timeout)
+        self.total_timeout = float(total_timeout)
+        self.max_connections = int(max_connections)
+        self.max_keepalive = int(max_keepalive)
+        self.http2 = bool(http2) and _http2_available()
+        if http2 and not self.http2:
+            logger.info("Pacote h2 não instalado: download de imagens em HTTP/1.1")
+
+        self._client = self._create_client()
+        self._downloads = 0
+        self._bytes = 0
+        self._errors = {}
+        self._seconds = 0.0
+
+    def _create_client(self):
+        return httpx.AsyncClient(
+            http2=self.http2,
+            follow_redirects=True,
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_keepalive),
+        )
+
+    async def fetch(self, url, timeout=None):
+        """
+        Baixa uma imagem.
+
+        Args:
+            url: URL da imagem
+            timeout: Prazo total (s); padrão `total_timeout`
+
+        Returns:
+            Bytes da imagem
+
+        Raises:
+            ImageFetchError: HTTP diferente de 200 (400), imagem maior que
+                `max_bytes` (413), prazo ou timeout esgotado (504) ou erro de rede (400)
+        """
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(timeout or self.total_timeout):
+                data = await self._download(url)
+        except ImageFetchError as e:
+            self._count_error(e.status_code)
+            raise
+        except (TimeoutError, httpx.TimeoutException):
+            self._count_error(504)
+            raise ImageFetchError("Tempo esgotado ao baixar a imagem", status_code=504)
+        except httpx.HTTPError as e:
+            self._count_error(400)
+            raise ImageFetchError(f"Erro de rede ao baixar a imagem: {str(e)}")
+        self._downloads += 1
+        self._bytes += len(data)
+        self._seconds += time.perf_counter() - started
+        return data
+
+    async def _download(self, url):
+        if self._client is None:
+            self._client = self._create_client()
+        async with self._client.stream("GET", url) as response:
+            if response.status_code != 200:
+                raise ImageFetchError(f"Não foi possível baixar a imagem (HTTP {response.status_code})")
+            declared = response.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > self.max_bytes:
+                raise ImageFetchError(self._too_large_message(), status_code=413)
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) > self.max_bytes:
+                    raise ImageFetchError(self._too_large_message(), status_code=413)
+            return bytes(body)
+
+    def _too_large_message(self):
+        return f"Imagem maior que o limite de {self.max_bytes // 2**20} MB"
+
+    def _count_error(self, status_code):
+        self._errors[status_code] = self._errors.get(status_code, 0) + 1
+
+    def stats(self):
+        return {
+            "http2": self.http2,
+            "max_bytes": self.max_bytes,
+            "downloads": self._downloads,
+            "bytes": self._bytes,
+            "avg_download_ms": (self._seconds / self._downloads * 1000.0) if self._downloads else 0.0,
+            "errors": {str(code): count for code, count in sorted(self._errors.items())},
+        }
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,371 @@
+"""
+Ingestão em massa do catálogo de implantes.
+
+Lê imagens de referência de um diretório local ou de um prefixo do Spaces
+e grava implants com o embedding do mesmo modelo usado por process_image:
+
+- leitura (disco ou Spaces) em um pool de threads;
+- decodificação e pré-processamento em um pool de processos;
+- um forward pass do CLIP por lote (`batch_size` imagens);
+- gravação por COPY binário, um lote por transação.
+
+O lote seguinte é lido e decodificado enquanto o atual passa pelo CLIP e
+pelo COPY. Cada lote grava, na mesma transação, as chaves de origem em
+implant_ingest_log: uma ingestão interrompida recomeça exatamente do
+primeiro lote não confirmado, sem duplicar implantes.
+
+Metadados: o caminho relativo define fabricante/tipo/nome
+(`<fabricante>/<tipo>/<nome>.jpg`); um manifesto CSV (colunas key, name,
+manufacturer, type, image_url) sobrescreve o que vier do caminho.
+
+Cada linha grava o model_version do modelo usado, na coluna do catálogo
+com embeddings desse modelo (ver app/db/embedding_versions.py). A etapa
+leitura -> decodificação -> CLIP (EmbeddingPipeline) também é usada pelo
+re-embedding (app/services/reembedding.py).
+"""
+
+import csv
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import httpx
+from psycopg import sql
+
+from app.core import config
+from app.db.embedding_versions import SLOTS, embedding_column, ensure_schema
+from app.services.executor import _init_preprocess_worker, preprocess_in_worker
+from app.services.spaces import get_s3_client, object_url
+
+logger = logging.getLogger("raiox-api")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+
+INGEST_LOG_TABLE = "implant_ingest_log"
+
+CREATE_INGEST_LOG_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {INGEST_LOG_TABLE} (
+        source TEXT NOT NULL,
+        key TEXT NOT NULL,
+        implant_id INTEGER NOT NULL,
+        ingested_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (source, key)
+    )
+"""
+
+COPY_IMPLANTS_TEMPLATE = (
+    "COPY implants (id, name, manufacturer, type, image_url, {column}, {model_column}) FROM STDIN WITH (FORMAT BINARY)"
+)
+COPY_INGEST_LOG_SQL = f"COPY {INGEST_LOG_TABLE} (source, key, implant_id) FROM STDIN WITH (FORMAT BINARY)"
+
+# Ids reservados de uma vez para o lote: o COPY grava id explícito e o log aponta para ele
+RESERVE_IDS_SQL = "SELECT nextval(pg_get_serial_sequence('implants', 'id')) FROM generate_series(1, %s)"
+
+
+def metadata_from_key(key):
+    """Fabricante, tipo e nome a partir de "<fabricante>/<tipo>/<nome>.ext"."""
+    parts = key.split("/")
+    return {
+        "name": os.path.splitext(parts[-1])[0],
+        "manufacturer": parts[0] if len(parts) >= 2 else None,
+        "type": parts[1] if len(parts) >= 3 else None,
+    }
+
+
+def load_manifest(path):
+    """Manifesto CSV: key -> {name, manufacturer, type, image_url} (só colunas preenchidas)."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return {
+            row["key"]: {field: value for field, value in row.items() if field != "key" and value}
+            for row in csv.DictReader(f)
+        }
+
+
+def _is_image(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def iter_local_images(root, url_base=None, manifest=None):
+    """
+    Imagens de um diretório local, em ordem estável (necessária para retomar).
+
+    Args:
+        root: Diretório raiz
+        url_base: Prefixo de image_url (ex.: URL pública já publicada); None = sem URL
+        manifest: Dict de load_manifest
+    """
+    root = os.path.abspath(root)
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        for name in sorted(files):
+            if not _is_image(name):
+                continue
+            path = os.path.join(directory, name)
+            key = os.path.relpath(path, root).replace(os.sep, "/")
+            item = dict(metadata_from_key(key), key=key, path=path)
+            item["image_url"] = f"{url_base.rstrip('/')}/{key}" if url_base else None
+            item.update((manifest or {}).get(key, {}))
+            yield item
+
+
+def iter_spaces_images(prefix, bucket=None, manifest=None):
+    """Imagens sob um prefixo do Spaces (list_objects_v2 é ordenado por chave)."""
+    bucket = bucket or config.DO_SPACES_BUCKET
+    prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+    paginator = get_s3_client().get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for entry in page.get("Contents", []):
+            if not _is_image(entry["Key"]):
+                continue
+            key = entry["Key"][len(prefix):]
+            item = dict(metadata_from_key(key), key=key, bucket=bucket, object=entry["Key"])
+            item["image_url"] = object_url(entry["Key"], bucket)
+            item.update((manifest or {}).get(key, {}))
+            yield item
+
+
+def read_item(item):
+    """Bytes da imagem de um item: arquivo local ("path"), Spaces ("bucket"/"object") ou URL ("url")."""
+    if "path" in item:
+        with open(item["path"], "rb") as f:
+            return f.read()
+    if "url" in item:
+        response = httpx.get(item["url"], timeout=30.0, follow_redirects=True)
+        response.raise_for_status()
+        return response.content
+    return get_s3_client().get_object(Bucket=item["bucket"], Key=item["object"])["Body"].read()
+
+
+def source_item(source, key):
+    """
+    Item de read_item para uma chave do log de ingestão.
+
+    Só para as origens padrão de scripts/ingerir_catalogo.py ("local:<dir>",
+    "spaces:<bucket>/<prefixo>"); outras devolvem None.
+    """
+    if source.startswith("local:"):
+        return {"key": key, "path": os.path.join(source[len("local:"):], key)}
+    if source.startswith("spaces:"):
+        bucket, _, prefix = source[len("spaces:"):].partition("/")
+        return {"key": key, "bucket": bucket, "object": f"{prefix}/{key}" if prefix else key}
+    return None
+
+
+def ensure_ingest_log(conn):
+    conn.execute(CREATE_INGEST_LOG_SQL)
+
+
+def ingested_keys(conn, source):
+    """Chaves já confirmadas de uma origem (ponto de retomada)."""
+    rows = conn.execute(f"SELECT key FROM {INGEST_LOG_TABLE} WHERE source = %s", (source,)).fetchall()
+    return {row[0] for row in rows}
+
+
+def write_batch(conn, source, items, embeddings, model_version, column="embedding"):
+    """
+    Grava um lote em implants e no log de ingestão, numa única transação.
+
+    Args:
+        model_version: Modelo que gerou os embeddings
+        column: Coluna de embedding do modelo (embedding_column)
+
+    Returns:
+        Ids atribuídos, na ordem dos itens
+    """
+    model_column = dict(SLOTS.values())[column]
+    copy_sql = sql.SQL(COPY_IMPLANTS_TEMPLATE).format(
+        column=sql.Identifier(column), model_column=sql.Identifier(model_column)
+    )
+    with conn.transaction():
+        ids = [row[0] for row in conn.execute(RESERVE_IDS_SQL, (len(items),)).fetchall()]
+        with conn.cursor() as cur:
+            with cur.copy(copy_sql) as copy:
+                copy.set_types(["int4", "text", "text", "text", "text", "vector", "text"])
+                for implant_id, item, embedding in zip(ids, items, embeddings):
+                    copy.write_row((
+                        implant_id, item["name"], item.get("manufacturer"), item.get("type"),
+                        item.get("image_url"), embedding, model_version,
+                    ))
+            with cur.copy(COPY_INGEST_LOG_SQL) as copy:
+                copy.set_types(["text", "text", "int4"])
+                for implant_id, item in zip(ids, items):
+                    copy.write_row((source, item["key"], implant_id))
+    return ids
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class EmbeddingPipeline:
+    """
+    Leitura -> decodificação -> CLIP em lote, com o lote seguinte lido e
+    decodificado enquanto o atual passa pelo CLIP e pela gravação.
+
+    Args:
+        encode_batch: Função (lista de tensores) -> lista de embeddings
+        preprocess: Pré-processador bytes -> tensor (o mesmo da API)
+        decode_workers: Processos de decodificação (0 = nas threads de leitura)
+        io_threads: Threads de leitura
+    """
+
+    def __init__(self, encode_batch, preprocess, decode_workers=2, io_threads=16):
+        self.encode_batch = encode_batch
+        self.preprocess = preprocess
+        self.decode_workers = max(0, int(decode_workers))
+        self.io_threads = max(1, int(io_threads))
+        self.stages = {"prepare_wait": 0.0, "encode": 0.0}
+        self.failed = 0
+
+    def _prepare(self, processes, item):
+        data = read_item(item)
+        if processes is not None:
+            return processes.submit(preprocess_in_worker, data).result()
+        return self.preprocess(data)
+
+    def _submit(self, threads, processes, batch):
+        return [(item, threads.submit(self._prepare, processes, item)) for item in batch]
+
+    def _collect(self, futures):
+        items, tensors = [], []
+        for item, future in futures:
+            try:
+                tensors.append(future.result())
+                items.append(item)
+            except Exception as e:
+                # Falha só desta imagem: fica pendente e é tentada de novo na próxima execução
+                logger.warning(f"Imagem ignorada ({item['key']}): {str(e)}")
+                self.failed += 1
+        return items, tensors
+
+    def embed(self, batches):
+        """
+        Gera (itens, embeddings) para cada lote; itens que falharam ficam de fora.
+
+        Args:
+            batches: Iterável de listas de itens (com "key" e a origem para read_item)
+        """
+        processes = None
+        if self.decode_workers:
+            processes = ProcessPoolExecutor(
+                max_workers=self.decode_workers,
+                initializer=_init_preprocess_worker,
+                initargs=(self.preprocess,),
+            )
+        threads = ThreadPoolExecutor(max_workers=self.io_threads, thread_name_prefix="ingest")
+        try:
+            batches = iter(batches)
+            current = next(batches, None)
+            futures = self._submit(threads, processes, current) if current else None
+            while futures is not None:
+                following = next(batches, None)
+                next_futures = self._submit(threads, processes, following) if following else None
+
+                stage = time.perf_counter()
+                batch_items, tensors = self._collect(futures)
+                self.stages["prepare_wait"] += time.perf_counter() - stage
+                if batch_items:
+                    stage = time.perf_counter()
+                    embeddings = [embedding.flatten() for embedding in self.encode_batch(tensors)]
+                    self.stages["encode"] += time.perf_counter() - stage
+                    yield batch_items, embeddings
+                futures = next_futures
+        finally:
+            threads.shutdown(wait=True, cancel_futures=True)
+            if processes is not None:
+                processes.shutdown(wait=True, cancel_futures=True)
+
+
+class CatalogIngestion:
+    """
+    Pipeline de ingestão: leitura -> decodificação -> CLIP em lote -> COPY.
+
+    Args:
+        pool: VectorSearchPool (conexões com o adaptador do pgvector)
+        encode_batch: Função (lista de tensores) -> lista de embeddings
+        preprocess: Pré-processador bytes -> tensor (o mesmo da API)
+        source: Identificador da origem no log (ex.: "local:/dados/ref", "spaces:raiox-imagens/ref")
+        batch_size: Imagens por forward pass e por COPY
+        decode_workers: Processos de decodificação (0 = nas threads de leitura)
+        io_threads: Threads de leitura
+        model_version: Modelo de encode_batch (padrão: EMBEDDING_MODEL_VERSION)
+    """
+
+    def __init__(
+        self, pool, encode_batch, preprocess, source, batch_size=256, decode_workers=2, io_threads=16,
+        model_version=None,
+    ):
+        self.pool = pool
+        self.source = source
+        self.batch_size = max(1, int(batch_size))
+        self.model_version = model_version or config.EMBEDDING_MODEL_VERSION
+        self.pipeline = EmbeddingPipeline(encode_batch, preprocess, decode_workers, io_threads)
+        self._write = 0.0
+        self._counts = {"skipped": 0, "ingested": 0, "batches": 0}
+
+    def run(self, items, limit=None, progress=None):
+        """
+        Ingere os itens ainda não confirmados para esta origem.
+
+        Args:
+            items: Iterável de itens (iter_local_images / iter_spaces_images)
+            limit: Máximo de imagens novas nesta execução
+            progress: Função opcional chamada com o relatório parcial após cada lote
+
+        Returns:
+            Dict com contadores, tempos por etapa e imagens/s
+        """
+        started = time.perf_counter()
+        with self.pool.connection() as conn:
+            ensure_ingest_log(conn)
+            ensure_schema(conn, self.model_version)
+            done = ingested_keys(conn, self.source)
+            column = embedding_column(conn, self.model_version)
+
+        def pending():
+            remaining = limit
+            for item in items:
+                if item["key"] in done:
+                    self._counts["skipped"] += 1
+                    continue
+                if remaining is not None:
+                    if remaining <= 0:
+                        return
+                    remaining -= 1
+                yield item
+
+        for batch_items, embeddings in self.pipeline.embed(_batches(pending(), self.batch_size)):
+            stage = time.perf_counter()
+            with self.pool.connection() as conn:
+                write_batch(conn, self.source, batch_items, embeddings, self.model_version, column)
+            self._write += time.perf_counter() - stage
+            self._counts["ingested"] += len(batch_items)
+            self._counts["batches"] += 1
+            if progress is not None:
+                progress(self.report(time.perf_counter() - started))
+        report = self.report(time.perf_counter() - started)
+        logger.info(
+            f"Ingestão de {self.source}: {report['ingested']} implantes em {report['seconds']}s "
+            f"({report['images_per_second']} imagens/s)"
+        )
+        return report
+
+    def report(self, elapsed):
+        stages = dict(self.pipeline.stages, write=self._write)
+        return dict(
+            self._counts,
+            failed=self.pipeline.failed,
+            source=self.source,
+            model_version=self.model_version,
+            seconds=round(elapsed, 2),
+            images_per_second=round(self._counts["ingested"] / elapsed, 1) if elapsed else 0.0,
+            stages_s={name: round(value, 2) for name, value in stages.items()},
+        )
@@ -0,0 +1,344 @@
+"""
+Carregamento preguiçoso do modelo CLIP com warm-up e relatório de startup.
+
+Em vez de executar `open_clip.create_model_and_transforms` na importação de
+app.main, o modelo é carregado (de preferência a partir de um cache local de
+pesos) em uma thread de fundo e aquecido com um lote fictício. A prontidão só
+é sinalizada depois do warm-up, e o tempo de cada fase fica registrado.
+
+Se o carregamento em segundo plano falha, ele é repetido com espera
+exponencial (retry_base, retry_max); entre as tentativas o status é
+"failed" e quem espera o modelo recebe ModelLoadError na hora, com o erro
+real, em vez de esperar o timeout inteiro.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger("raiox-api")
+
+STATUS_PENDING = "pending"
+STATUS_LOADING = "loading"
+STATUS_WARMING = "warming"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+
+
+class ModelNotReadyError(RuntimeError):
+    """O modelo ainda não terminou de carregar/aquecer."""
+
+
+class ModelLoadError(ModelNotReadyError):
+    """A última tentativa de carregar o modelo falhou (nova tentativa agendada)."""
+
+
+class ClipModelLoader:
+    """
+    Dono do modelo CLIP e do seu ciclo de carregamento.
+
+    Args:
+        model_name: Arquitetura open_clip, ex.: "ViT-B-32"
+        pretrained: Tag de pesos do open_clip, ex.: "openai"
+        weights_path: Arquivo local de pesos; se existir, tem prioridade sobre a tag
+        cache_dir: Diretório de cache dos pesos baixados pelo open_clip
+        warmup_batch_size: Tamanho do lote fictício do warm-up
+        warmup_iterations: Quantidade de forward passes de warm-up
+        backend: Backend do encoder ("eager", "torchscript" ou "onnx")
+        backend_path: Artefato exportado usado pelos backends não-eager
+        artifacts_dir: Diretório do artefato quando backend_path não é informado
+        onnx_threads: Threads intra-op do ONNX Runtime (0 = padrão)
+        quantization: "none" (fp32) ou "int8" (quantização dinâmica em CPU)
+        fast_preprocess: Usa o RadiographPreprocessor em vez da transformação do open_clip
+        retry_base: Espera (s) após a primeira falha do carregamento em segundo plano; dobra a cada falha
+        retry_max: Espera máxima (s) entre tentativas
+    """
+
+    def __init__(self, model_name, pretrained, weights_path=None, cache_dir=None,
+                 warmup_batch_size=1, warmup_iterations=1, backend="eager",
+                 backend_path=None, artifacts_dir=None, onnx_threads=0,
+                 quantization="none", fast_preprocess=True, retry_base=5.0, retry_max=300.0):
+        self.model_name = model_name
+        self.pretrained = pretrained
+        self.weights_path = weights_path
+        self.cache_dir = cache_dir
+        self.warmup_batch_size = max(1, int(warmup_batch_size))
+        self.warmup_iterations = max(0, int(warmup_iterations))
+        self.backend = backend
+        self.backend_path = backend_path
+        self.artifacts_dir = artifacts_dir
+        self.onnx_threads = onnx_threads
+        self.quantization = quantization
+        self.fast_preprocess = fast_preprocess
+        self.retry_base = max(0.0, float(retry_base))
+        self.retry_max = max(self.retry_base, float(retry_max))
+
+        self.model = None
+        self.encoder = None
+        self.preprocess = None
+        self.image_preprocessor = None
+        self.device = None
+        self.status = STATUS_PENDING
+        self.error = None
+
+        self._phases = OrderedDict()
+        self._created_at = time.time()
+        self._ready_at = None
+        self._ready = threading.Event()
+        self._load_lock = threading.Lock()
+        self._thread = None
+        self._callbacks = []
+        self._attempts = 0
+        self._next_retry_at = None
+        self._retry_now = threading.Event()
+        # Espera por mudança de estado (pronto ou falha), síncrona e assíncrona
+        self._state = threading.Condition()
+        self._waiters = []
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def record_phase(self, name, seconds):
+        """Registra a duração (em segundos) de uma fase de startup."""
+        self._phases[name] = round(seconds * 1000.0, 1)
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_phase(name, time.perf_counter() - started)
+
+    def on_ready(self, callback):
+        """Registra uma função chamada (com o loader) quando o modelo ficar pronto."""
+        self._callbacks.append(callback)
+        if self.ready:
+            callback(self)
+
+    def load(self):
+        """Carrega e aquece o modelo de forma síncrona (idempotente)."""
+        with self._load_lock:
+            if self.ready:
+                return
+            self._attempts += 1
+            try:
+                self._load()
+            except Exception as e:
+                self.status = STATUS_FAILED
+                self.error = str(e)
+                logger.error(f"Erro ao carregar modelo CLIP: {str(e)}")
+                self._notify()
+                raise
+            self.error = None
+            self._notify()
+
+    def _notify(self):
+        """Acorda quem espera o modelo (pronto ou falha)."""
+        with self._state:
+            self._state.notify_all()
+            waiters, self._waiters = self._waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_resolve, waiter)
+
+    def _load(self):
+        self.status = STATUS_LOADING
+        with self.phase("import_torch"):
+            import torch
+            import open_clip
+
+        with self.phase("load_model"):
+            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+            pretrained = self.pretrained
+            if self.weights_path and os.path.exists(self.weights_path):
+                pretrained = self.weights_path
+            self.model, _, self.preprocess = open_clip.create_model_and_transforms(
+                self.model_name,
+                pretrained=pretrained,
+                device=self.device,
+                cache_dir=self.cache_dir,
+            )
+            self.model.eval()
+
+            from app.services.preprocessing import RadiographPreprocessor, TransformPreprocessor
+
+            if self.fast_preprocess:
+                self.image_preprocessor = RadiographPreprocessor.for_model(self.model)
+            else:
+                self.image_preprocessor = TransformPreprocessor(self.preprocess)
+        logger.info(f"Modelo CLIP carregado no dispositivo: {self.device}")
+
+        if self.quantization != "none":
+            self._quantize()
+
+        with self.phase("build_backend"):
+            from app.services.encoder_backends import create_backend, default_artifact_path
+
+            if self.backend != "eager" and not self.backend_path and self.artifacts_dir:
+                self.backend_path = default_artifact_path(
+                    self.artifacts_dir, self.model_name, self.pretrained, self.backend
+                )
+            self.encoder = create_backend(
+                self.backend,
+                self.model,
+                self.device,
+                artifact_path=self.backend_path,
+                onnx_threads=self.onnx_threads,
+            )
+        logger.info(f"Backend do encoder CLIP: {self.encoder.name}")
+
+        self.status = STATUS_WARMING
+        with self.phase("warmup"):
+            self.warmup()
+
+        self.status = STATUS_READY
+        self._ready_at = time.time()
+        self._ready.set()
+        logger.info(f"Startup do modelo CLIP concluído: {dict(self._phases)}")
+        for callback in self._callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.error(f"Erro em callback de prontidão do modelo: {str(e)}")
+
+    def _quantize(self):
+        from app.services.quantization import QUANTIZATION_MODES, quantize_image_encoder
+
+        if self.quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Modo de quantização desconhecido: {self.quantization}")
+        if self.device != "cpu":
+            logger.warning("Quantização INT8 só é suportada em CPU; usando o modelo fp32")
+            self.quantization = "none"
+            return
+        if self.backend != "eager":
+            logger.warning(
+                f"Quantização INT8 aplica-se ao backend eager; o backend {self.backend} usa o próprio artefato"
+            )
+        with self.phase("quantize"):
+            quantize_image_encoder(self.model)
+
+    def warmup(self):
+        """Executa forward passes com um lote fictício para aquecer kernels e alocadores."""
+        if not self.warmup_iterations:
+            return
+        import io
+
+        import torch
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new("L", (512, 256)).save(buffer, format="JPEG")
+        dummy = self.image_preprocessor(buffer.getvalue())
+        batch = torch.stack([dummy] * self.warmup_batch_size)
+        for _ in range(self.warmup_iterations):
+            self.encoder.encode(batch)
+
+    def start_background(self):
+        """Inicia o carregamento em uma thread de fundo."""
+        if self._thread is not None or self.ready:
+            return
+        self._thread = threading.Thread(target=self._load_quietly, name="clip-loader", daemon=True)
+        self._thread.start()
+
+    def _load_quietly(self):
+        while not self.ready:
+            try:
+                self.load()
+            except Exception:
+                # Erro já registrado em load(); o status "failed" aparece no relatório
+                delay = min(self.retry_max, self.retry_base * 2 ** (self._attempts - 1))
+                delay *= random.uniform(0.8, 1.2)
+                self._next_retry_at = time.time() + delay
+                logger.info(f"Nova tentativa de carregar o modelo CLIP em {delay:.0f}s")
+                self._retry_now.wait(delay)
+                self._retry_now.clear()
+                self._next_retry_at = None
+
+    def retry_now(self):
+        """Antecipa a próxima tentativa de carregamento após uma falha."""
+        self._retry_now.set()
+
+    def _check_failed(self):
+        if self.status == STATUS_FAILED:
+            raise ModelLoadError(f"Falha ao carregar o modelo CLIP: {self.error}")
+
+    def wait_ready(self, timeout=None):
+        """
+        Bloqueia até o modelo ficar pronto. Retorna False se expirar.
+
+        Raises:
+            ModelLoadError: A última tentativa de carregamento falhou
+        """
+        with self._state:
+            self._state.wait_for(lambda: self.ready or self.status == STATUS_FAILED, timeout)
+        if self.ready:
+            return True
+        self._check_failed()
+        return False
+
+    async def wait_ready_async(self, timeout=None):
+        """Versão assíncrona de wait_ready: espera no event loop, sem ocupar threads."""
+        if self.ready:
+            return True
+        self._check_failed()
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        with self._state:
+            settled = self.ready or self.status == STATUS_FAILED
+            if not settled:
+                self._waiters.append((loop, waiter))
+        if not settled:
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except TimeoutError:
+                pass
+            finally:
+                with self._state:
+                    if (loop, waiter) in self._waiters:
+                        self._waiters.remove((loop, waiter))
+        if self.ready:
+            return True
+        self._check_failed()
+        return False
+
+    def require(self, timeout=None):
+        """Garante que o modelo está pronto ou levanta ModelNotReadyError (ModelLoadError após falha)."""
+        if not self.wait_ready(timeout):
+            raise ModelNotReadyError(f"Modelo CLIP não está pronto (status: {self.status})")
+
+    def report(self):
+        """
+        Relatório de startup.
+
+        Returns:
+            Dict com status, tempo de cada fase (ms) e tempo total até a prontidão
+        """
+        return {
+            "status": self.status,
+            "ready": self.ready,
+            "model": f"{self.model_name}:{self.pretrained}",
+            "device": self.device,
+            "backend": self.backend,
+            "quantization": self.quantization,
+            "phases_ms": dict(self._phases),
+            "total_ms": round(sum(self._phases.values()), 1),
+            "time_to_ready_s": (
+                round(self._ready_at - self._created_at, 2) if self._ready_at else None
+            ),
+            "error": self.error,
+            "attempts": self._attempts,
+            "next_retry_in_s": (
+                round(max(0.0, self._next_retry_at - time.time()), 1) if self._next_retry_at else None
+            ),
+        }
+
+
+def _resolve(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
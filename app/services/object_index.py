@@ -0,0 +1,296 @@
+"""
+Nomes endereçados por conteúdo para os objetos enviados ao Spaces.
+
+O nome do objeto é derivado do SHA-256 dos bytes da imagem
+(`{prefixo}/ab/abcdef....png`), não do client_id nem do nome original do
+arquivo: reenvios da mesma radiografia apontam para o mesmo objeto e
+arquivos diferentes com o mesmo nome não se sobrescrevem.
+
+Um índice SQLite local, compartilhado pelos workers, guarda os hashes já
+enviados (ou com envio em andamento no spool), de modo que duplicatas não
+geram PUT nenhum, a relação de cada submissão (cliente, origem, nome
+original) com o objeto que ela usa e os derivados (miniatura, cópia na
+resolução do CLIP) de cada original. Um derivado agendado fica "pending"
+até o PUT (mark_stored) e só então é devolvido por derivatives().
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("raiox-api")
+
+# Assinaturas dos formatos aceitos: (prefixo, extensão, content-type)
+_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", ".png", "image/png"),
+    (b"\xff\xd8\xff", ".jpg", "image/jpeg"),
+    (b"GIF8", ".gif", "image/gif"),
+    (b"BM", ".bmp", "image/bmp"),
+    (b"II*\x00", ".tif", "image/tiff"),
+    (b"MM\x00*", ".tif", "image/tiff"),
+)
+
+
+def sniff_image_type(data):
+    """
+    Extensão e content-type pelo conteúdo (não pelo nome do arquivo).
+
+    Returns:
+        Tupla (extensão, content-type); ("", None) para formatos desconhecidos
+    """
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp", "image/webp"
+    for signature, extension, content_type in _SIGNATURES:
+        if data.startswith(signature):
+            return extension, content_type
+    return "", None
+
+
+def content_object_name(digest, extension="", prefix="uploads/sha256"):
+    """Nome do objeto no Spaces para o SHA-256 `digest`."""
+    return f"{prefix}/{digest[:2]}/{digest}{extension}"
+
+
+class ObjectIndex:
+    """
+    Índice local dos objetos endereçados por conteúdo e das submissões.
+
+    Args:
+        db_path: Caminho do arquivo SQLite
+        prefix: Prefixo dos nomes de objeto no bucket
+    """
+
+    def __init__(self, db_path, prefix="uploads/sha256"):
+        self.db_path = db_path
+        self.prefix = prefix.strip("/")
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=10.0, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS objects ("
+            " sha256 TEXT PRIMARY KEY,"
+            " object_name TEXT NOT NULL UNIQUE,"
+            " size INTEGER NOT NULL,"
+            " content_type TEXT,"
+            " state TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " stored_at REAL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS submissions ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " client_id TEXT,"
+            " origin TEXT NOT NULL,"
+            " original_name TEXT,"
+            " sha256 TEXT NOT NULL REFERENCES objects (sha256),"
+            " created_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS submissions_client_idx ON submissions (client_id, created_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS submissions_sha256_idx ON submissions (sha256)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS derivatives ("
+            " object_name TEXT NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " derivative_name TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " state TEXT NOT NULL DEFAULT 'stored',"
+            " PRIMARY KEY (object_name, kind))"
+        )
+        derivative_columns = {row[1] for row in self._db.execute("PRAGMA table_info(derivatives)")}
+        if "state" not in derivative_columns:
+            # Índices anteriores só registravam derivados já enviados
+            self._db.execute("ALTER TABLE derivatives ADD COLUMN state TEXT NOT NULL DEFAULT 'stored'")
+        self._db.execute("CREATE INDEX IF NOT EXISTS derivatives_name_idx ON derivatives (derivative_name)")
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._new_objects = 0
+        self._duplicates = 0
+        self._duplicate_bytes = 0
+
+    def register(self, data, client_id=None, origin="upload", original_name=None):
+        """
+        Registra uma submissão e reserva o objeto do seu conteúdo.
+
+        Args:
+            data: Bytes da imagem
+            client_id: Cliente que enviou
+            origin: Endpoint/origem da submissão ("upload", "webhook", "jotform")
+            original_name: Nome do arquivo ou URL de origem
+
+        Returns:
+            Dict com object_name, content_type, sha256, submission_id e `new`
+            (True se o objeto ainda não existe e precisa ser enviado)
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        extension, content_type = sniff_image_type(data)
+        object_name = content_object_name(digest, extension, self.prefix)
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                new = self._db.execute(
+                    "INSERT OR IGNORE INTO objects (sha256, object_name, size, content_type, state, created_at)"
+                    " VALUES (?, ?, ?, ?, 'pending', ?)",
+                    (digest, object_name, len(data), content_type, now),
+                ).rowcount == 1
+                if not new:
+                    # Mantém o nome já usado pelo objeto (ex.: prefixo antigo)
+                    object_name, content_type, state = self._db.execute(
+                        "SELECT object_name, content_type, state FROM objects WHERE sha256 = ?", (digest,)
+                    ).fetchone()
+                    if state == "failed":
+                        # O envio anterior foi desistido: esta submissão envia de novo
+                        self._db.execute("UPDATE objects SET state = 'pending' WHERE sha256 = ?", (digest,))
+                        new = True
+                submission_id = self._db.execute(
+                    "INSERT INTO submissions (client_id, origin, original_name, sha256, created_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (client_id, origin, original_name, digest, now),
+                ).lastrowid
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        with self._stats_lock:
+            if new:
+                self._new_objects += 1
+            else:
+                self._duplicates += 1
+                self._duplicate_bytes += len(data)
+        if not new:
+            logger.info(f"Imagem já armazenada ({object_name}): upload ignorado")
+        return {
+            "object_name": object_name,
+            "content_type": content_type,
+            "sha256": digest,
+            "submission_id": submission_id,
+            "new": new,
+        }
+
+    def mark_stored(self, object_name):
+        """Marca o objeto (original ou derivado) como presente no bucket (chamado após o PUT)."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE objects SET state = 'stored', stored_at = ? WHERE object_name = ?",
+                (time.time(), object_name),
+            )
+            self._db.execute("UPDATE derivatives SET state = 'stored' WHERE derivative_name = ?", (object_name,))
+
+    def mark_failed(self, object_name):
+        """Marca o envio do objeto como desistido: a próxima submissão do mesmo conteúdo faz o PUT."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE objects SET state = 'failed' WHERE object_name = ? AND state = 'pending'", (object_name,)
+            )
+            self._db.execute(
+                "UPDATE derivatives SET state = 'failed' WHERE derivative_name = ? AND state = 'pending'",
+                (object_name,),
+            )
+
+    def pending_objects(self, older_than=0.0):
+        """
+        Nomes dos objetos e derivados ainda "pending" registrados há mais de `older_than` segundos.
+
+        Usado no startup para achar envios que nunca chegaram ao spool (ver
+        mark_failed): o índice não guarda os bytes, então eles não podem
+        ser reenviados daqui.
+        """
+        cutoff = time.time() - older_than
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT object_name FROM objects WHERE state = 'pending' AND created_at < ?"
+                " UNION SELECT derivative_name FROM derivatives WHERE state = 'pending' AND created_at < ?",
+                (cutoff, cutoff),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def record_derivatives(self, object_name, names, state="stored"):
+        """
+        Registra os derivados de um original (dict tipo -> nome do objeto derivado).
+
+        Args:
+            state: "stored" se já estão no bucket; "pending" se o envio foi
+                agendado (passam a "stored" em mark_stored)
+        """
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO derivatives (object_name, kind, derivative_name, created_at, state)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(object_name, kind, name, now, state) for kind, name in names.items()],
+            )
+
+    def derivatives(self, object_names):
+        """
+        Derivados já enviados de vários originais.
+
+        Returns:
+            Dict nome do original -> {tipo: nome do derivado}, só para originais com derivados
+        """
+        object_names = list({name for name in object_names if name})
+        if not object_names:
+            return {}
+        placeholders = ",".join("?" * len(object_names))
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT object_name, kind, derivative_name FROM derivatives"
+                f" WHERE object_name IN ({placeholders}) AND state = 'stored'",
+                object_names,
+            ).fetchall()
+        found = {}
+        for object_name, kind, derivative_name in rows:
+            found.setdefault(object_name, {})[kind] = derivative_name
+        return found
+
+    def submissions(self, client_id=None, limit=100):
+        """Submissões mais recentes (de um cliente, se informado) com o objeto de cada uma."""
+        query = (
+            "SELECT s.id, s.client_id, s.origin, s.original_name, s.created_at, o.object_name, o.sha256, o.state"
+            " FROM submissions s JOIN objects o ON o.sha256 = s.sha256"
+        )
+        params = ()
+        if client_id is not None:
+            query += " WHERE s.client_id = ?"
+            params = (client_id,)
+        query += " ORDER BY s.id DESC LIMIT ?"
+        with self._lock:
+            rows = self._db.execute(query, params + (limit,)).fetchall()
+        fields = ("id", "client_id", "origin", "original_name", "created_at", "object_name", "sha256", "state")
+        return [dict(zip(fields, row)) for row in rows]
+
+    def stats(self):
+        with self._lock:
+            objects = dict(self._db.execute("SELECT state, COUNT(*) FROM objects GROUP BY state").fetchall())
+            stored_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+            submissions = self._db.execute("SELECT COUNT(*) FROM submissions").fetchone()[0]
+            derivatives = self._db.execute(
+                "SELECT COUNT(DISTINCT object_name) FROM derivatives WHERE state = 'stored'"
+            ).fetchone()[0]
+            derivatives_pending = self._db.execute(
+                "SELECT COUNT(*) FROM derivatives WHERE state = 'pending'"
+            ).fetchone()[0]
+        with self._stats_lock:
+            registered = self._new_objects + self._duplicates
+            return {
+                "objects_stored": objects.get("stored", 0),
+                "objects_pending": objects.get("pending", 0),
+                "objects_failed": objects.get("failed", 0),
+                "object_bytes": stored_bytes,
+                "submissions": submissions,
+                "objects_with_derivatives": derivatives,
+                "derivatives_pending": derivatives_pending,
+                "new_objects": self._new_objects,
+                "duplicates": self._duplicates,
+                "duplicate_ratio": (self._duplicates / registered) if registered else 0.0,
+                "upload_bytes_saved": self._duplicate_bytes,
+            }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
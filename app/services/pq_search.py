@@ -0,0 +1,327 @@
+"""
+Índice comprimido por quantização de produto (IVF-PQ) para o catálogo.
+
+Cada worker do uvicorn já carrega o modelo CLIP; uma cópia float32 do
+catálogo (2 KB por vetor de 512 dimensões) pesa em droplets pequenos. Aqui
+cada embedding vira M bytes: o vetor é dividido em M subespaços e cada
+pedaço é trocado pelo índice (uint8) do centróide mais próximo do codebook
+daquele subespaço.
+
+Com nlist > 0 (IVF-PQ), um k-means grosso divide o catálogo em listas, os
+códigos quantizam o resíduo em relação ao centróide da lista, e a consulta
+só percorre as `nprobe` listas mais próximas. Com nlist = 0 a busca é PQ
+plana (todos os códigos).
+
+A distância é assimétrica (ADC): a consulta fica em float32, uma tabela
+(M x 256) de distâncias parciais é calculada por lista visitada e a
+distância de cada código é a soma de M consultas à tabela. Só os melhores
+candidatos (`rerank`, no mínimo k) são lidos do embeddings.npy
+memory-mapped para devolver distance/similarity exatas.
+
+Arquivos (no diretório do catálogo, gravados após a exportação):
+    pq_codebooks.npy   (M, 256, D/M) float32
+    pq_codes.npy       (N, M) uint8, agrupados por lista
+    pq_rows.npy        (N,) int32, linha do catálogo de cada código
+    pq_offsets.npy     (nlist + 1,) int64, início de cada lista em pq_codes
+    pq_centroids.npy   (nlist, D) float32 (só IVF-PQ)
+    pq.json            parâmetros e versão da exportação de origem
+"""
+
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from app.services.exact_search import EMBEDDINGS_FILE, METADATA_FILE, MmapExactSearch
+
+logger = logging.getLogger("raiox-api")
+
+CODEBOOKS_FILE = "pq_codebooks.npy"
+CODES_FILE = "pq_codes.npy"
+ROWS_FILE = "pq_rows.npy"
+OFFSETS_FILE = "pq_offsets.npy"
+CENTROIDS_FILE = "pq_centroids.npy"
+PQ_METADATA_FILE = "pq.json"
+
+# Códigos de 8 bits: 256 centróides por subespaço
+CODEBOOK_SIZE = 256
+# Pontos de treino mínimos por centróide para um k-means estável
+MIN_POINTS_PER_CENTROID = 39
+
+
+def _squared_distances(x, centroids):
+    return (
+        np.sum(x * x, axis=1, keepdims=True)
+        - 2.0 * (x @ centroids.T)
+        + np.sum(centroids * centroids, axis=1)
+    )
+
+
+def assign(x, centroids, chunk_rows=16384):
+    """Índice do centróide mais próximo de cada linha de x."""
+    labels = np.empty(x.shape[0], dtype=np.int64)
+    for start in range(0, x.shape[0], chunk_rows):
+        block = np.asarray(x[start:start + chunk_rows], dtype=np.float32)
+        labels[start:start + chunk_rows] = np.argmin(_squared_distances(block, centroids), axis=1)
+    return labels
+
+
+def kmeans(x, k, iterations=20, seed=0):
+    """
+    K-means (Lloyd) em NumPy.
+
+    Clusters vazios são reiniciados com pontos aleatórios, como no FAISS.
+
+    Returns:
+        Centróides (k, D) float32
+    """
+    rng = np.random.default_rng(seed)
+    x = np.asarray(x, dtype=np.float32)
+    centroids = x[rng.choice(x.shape[0], size=k, replace=x.shape[0] < k)].copy()
+    for _ in range(iterations):
+        labels = assign(x, centroids)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, x)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = x[rng.choice(x.shape[0], size=len(empty))]
+    return centroids
+
+
+def train_pq(x, m, iterations=20, seed=0):
+    """Treina um codebook de 256 centróides por subespaço: (M, 256, D/M)."""
+    dimension = x.shape[1]
+    if dimension % m:
+        raise ValueError(f"A dimensão {dimension} não é divisível por M={m}")
+    sub = dimension // m
+    return np.stack([
+        kmeans(x[:, i * sub:(i + 1) * sub], CODEBOOK_SIZE, iterations, seed + i) for i in range(m)
+    ])
+
+
+def encode(x, codebooks):
+    """Códigos PQ (N, M) uint8 de vetores (ou resíduos) float32."""
+    m, _, sub = codebooks.shape
+    codes = np.empty((x.shape[0], m), dtype=np.uint8)
+    for i in range(m):
+        codes[:, i] = assign(x[:, i * sub:(i + 1) * sub], codebooks[i])
+    return codes
+
+
+def distance_tables(queries, codebooks):
+    """Tabelas ADC (Q, M, 256): distância de cada subvetor da consulta a cada centróide."""
+    m, _, sub = codebooks.shape
+    # ||r - c||² = ||r||² - 2 r·c + ||c||², com um matmul em lote por subespaço
+    parts = queries.reshape(queries.shape[0], m, sub).transpose(1, 0, 2)
+    tables = (
+        np.sum(parts * parts, axis=2)[:, :, None]
+        - 2.0 * np.matmul(parts, codebooks.transpose(0, 2, 1))
+        + np.sum(codebooks * codebooks, axis=2)[:, None, :]
+    )
+    return tables.transpose(1, 0, 2)
+
+
+def adc_distances(table, codes):
+    """Distâncias aproximadas (N,) dos códigos para uma tabela (M, 256)."""
+    m = table.shape[0]
+    offsets = np.arange(m, dtype=np.intp) * CODEBOOK_SIZE
+    return np.take(table.ravel(), codes.astype(np.intp) + offsets).sum(axis=1)
+
+
+def _save_npy(path, array):
+    staging = f"{path}.tmp-{os.getpid()}.npy"
+    np.save(staging, array)
+    os.replace(staging, path)
+
+
+def build_pq_index(directory, m=64, nlist=256, train_rows=50000, iterations=20, seed=0):
+    """
+    Treina e grava o índice IVF-PQ do catálogo exportado.
+
+    Args:
+        directory: Diretório gerado por export_catalog
+        m: Subespaços (bytes por vetor)
+        nlist: Listas do IVF (0 = PQ plana); limitado pelo tamanho do catálogo
+        train_rows: Máximo de linhas usadas no treino
+        iterations: Iterações do k-means
+
+    Returns:
+        Dict com o conteúdo de pq.json
+    """
+    with open(os.path.join(directory, METADATA_FILE)) as f:
+        catalog_version = json.load(f).get("version")
+    embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r")
+    count, dimension = embeddings.shape
+    started = time.perf_counter()
+
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(count, size=min(train_rows, count), replace=False))
+    train = np.asarray(embeddings[sample], dtype=np.float32)
+    nlist = min(int(nlist), train.shape[0] // MIN_POINTS_PER_CENTROID)
+
+    if nlist > 0:
+        centroids = kmeans(train, nlist, iterations, seed)
+        train = train - centroids[assign(train, centroids)]
+    else:
+        centroids = None
+    codebooks = train_pq(train, m, iterations, seed)
+
+    # Codifica o catálogo inteiro em blocos, agrupando por lista
+    lists = np.zeros(count, dtype=np.int64)
+    codes = np.empty((count, m), dtype=np.uint8)
+    for start in range(0, count, 65536):
+        block = np.asarray(embeddings[start:start + 65536], dtype=np.float32)
+        if centroids is not None:
+            lists[start:start + len(block)] = assign(block, centroids)
+            block = block - centroids[lists[start:start + len(block)]]
+        codes[start:start + len(block)] = encode(block, codebooks)
+    order = np.argsort(lists, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=max(nlist, 1)))]).astype(np.int64)
+    elapsed = time.perf_counter() - started
+
+    _save_npy(os.path.join(directory, CODEBOOKS_FILE), codebooks.astype(np.float32))
+    _save_npy(os.path.join(directory, CODES_FILE), np.ascontiguousarray(codes[order]))
+    _save_npy(os.path.join(directory, ROWS_FILE), order.astype(np.int32))
+    _save_npy(os.path.join(directory, OFFSETS_FILE), offsets)
+    if centroids is not None:
+        _save_npy(os.path.join(directory, CENTROIDS_FILE), centroids.astype(np.float32))
+
+    info = {
+        "catalog_version": catalog_version,
+        "m": int(m),
+        "nlist": int(nlist),
+        "dimension": int(dimension),
+        "count": int(count),
+        "train_rows": int(len(sample)),
+        "bytes_per_vector": int(m) + 4,
+        "build_seconds": round(elapsed, 3),
+    }
+    metadata_path = os.path.join(directory, PQ_METADATA_FILE)
+    with open(f"{metadata_path}.tmp-{os.getpid()}", "w") as f:
+        json.dump(info, f)
+    os.replace(f"{metadata_path}.tmp-{os.getpid()}", metadata_path)
+    logger.info(f"Índice PQ gravado em {directory}: M={m}, nlist={nlist}, {count} vetores em {elapsed:.1f}s")
+    return info
+
+
+class PqSearch(MmapExactSearch):
+    """
+    Backend de busca IVF-PQ com distância assimétrica.
+
+    Args:
+        directory: Diretório do catálogo com o índice PQ
+        nprobe: Listas visitadas por consulta (IVF-PQ)
+        rerank: Candidatos reavaliados com o vetor exato (mínimo: limit)
+        reload_interval: Intervalo mínimo (s) entre verificações de novo índice
+        model_version: Modelo das consultas (ver MmapExactSearch)
+    """
+
+    name = "pq"
+
+    def __init__(self, directory, nprobe=16, rerank=32, reload_interval=30.0, model_version=None):
+        super().__init__(directory, reload_interval=reload_interval, model_version=model_version)
+        self.nprobe = int(nprobe)
+        self.rerank = int(rerank)
+        self._codebooks = None
+        self._codes = None
+        self._rows = None
+        self._offsets = None
+        self._centroids = None
+        self._pq = {}
+
+    def _watch_paths(self):
+        # O índice é gravado depois da exportação: é ele que dispara o reload
+        return (os.path.join(self.directory, PQ_METADATA_FILE),)
+
+    def _load_companions(self, metadata):
+        directory = metadata["directory"]
+        with open(os.path.join(directory, PQ_METADATA_FILE)) as f:
+            info = json.load(f)
+        if info.get("catalog_version") != metadata.get("version"):
+            raise ValueError("Índice PQ construído para outra exportação do catálogo: reconstrua o índice")
+        codes = np.load(os.path.join(directory, CODES_FILE), mmap_mode="r")
+        if codes.shape[0] != len(metadata["implants"]):
+            raise ValueError(f"Códigos PQ inconsistentes em {self.directory}")
+        centroids = None
+        if info["nlist"] > 0:
+            centroids = np.load(os.path.join(directory, CENTROIDS_FILE))
+        return {
+            "_codebooks": np.load(os.path.join(directory, CODEBOOKS_FILE)),
+            "_codes": codes,
+            "_rows": np.load(os.path.join(directory, ROWS_FILE), mmap_mode="r"),
+            "_offsets": np.load(os.path.join(directory, OFFSETS_FILE)),
+            "_centroids": centroids,
+            "_pq": info,
+        }
+
+    def _candidates(self, query, codebooks, codes, rows, offsets, centroids, count):
+        """Linhas do catálogo com as menores distâncias ADC."""
+        if centroids is None:
+            lists = [(0, query)]
+        else:
+            coarse = _squared_distances(query[None], centroids)[0]
+            probe = min(self.nprobe, len(centroids))
+            lists = [(l, query - centroids[l]) for l in np.argpartition(coarse, probe - 1)[:probe]]
+
+        distances, positions = [], []
+        tables = distance_tables(np.stack([residual for _, residual in lists]), codebooks)
+        for (l, _), table in zip(lists, tables):
+            start, stop = offsets[l], offsets[l + 1]
+            if stop > start:
+                distances.append(adc_distances(table, codes[start:stop]))
+                positions.append(np.arange(start, stop))
+        if not distances:
+            return np.empty(0, dtype=np.int64)
+        distances = np.concatenate(distances)
+        positions = np.concatenate(positions)
+        if count < len(distances):
+            best = np.argpartition(distances, count - 1)[:count]
+            positions = positions[best]
+        return np.sort(np.asarray(rows[positions], dtype=np.int64))
+
+    def search_many(self, query_vectors, limit=3, filters=None):
+        """Top-k aproximado (ADC) para várias consultas."""
+        if filters:
+            # Filtros seletivos esvaziariam as listas visitadas: busca exata no sub-índice
+            return super().search_many(query_vectors, limit=limit, filters=filters)
+        started = time.perf_counter()
+        self._ensure_loaded()
+        with self._lock:
+            embeddings, norms, implants = self._embeddings, self._norms, self._implants
+            codebooks, codes, rows = self._codebooks, self._codes, self._rows
+            offsets, centroids = self._offsets, self._centroids
+        queries = np.ascontiguousarray(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        if queries.shape[0] == 0:
+            return []
+        count = max(self.rerank, limit)
+        query_norms = np.linalg.norm(queries, axis=1)
+
+        results = []
+        for i in range(queries.shape[0]):
+            candidate_rows = self._candidates(queries[i], codebooks, codes, rows, offsets, centroids, count)
+            # Só os candidatos são lidos do mmap, para distance/similarity exatas
+            scores = np.asarray(embeddings[candidate_rows]) @ queries[i]
+            results.append(self._top_k(
+                np.asarray(norms[candidate_rows]), implants, scores, float(query_norms[i]), limit, candidate_rows
+            ))
+        with self._lock:
+            self._searches += queries.shape[0]
+            self._search_total += time.perf_counter() - started
+        return results
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats.update({
+                "m": self._pq.get("m"),
+                "nlist": self._pq.get("nlist"),
+                "nprobe": self.nprobe,
+                "rerank": self.rerank,
+                "bytes_per_vector": self._pq.get("bytes_per_vector"),
+            })
+        return stats
@@ -0,0 +1,144 @@
+"""
+Pipeline rápido de decodificação e pré-processamento de radiografias.
+
+Substitui `Image.open` em resolução total + `preprocess` genérico do open_clip:
+
+- a imagem é decodificada uma única vez, direto dos bytes;
+- JPEGs usam draft mode, que reduz a escala já na decodificação DCT
+  (1/2, 1/4, 1/8) para o menor tamanho ainda >= ao alvo;
+- o redimensionamento recorta só a região central usada pelo CLIP
+  (equivalente a Resize + CenterCrop) com reducing_gap;
+- radiografias em tons de cinza ficam em 1 canal até a normalização;
+  PNGs de 16 bits são esticados para 8 bits (min-max) em vez de saturarem;
+- a normalização escreve direto no array (3, H, W) final, sem cópias
+  intermediárias, e o tensor é criado com torch.from_numpy (zero-copy).
+
+Comparação com o caminho antigo: scripts/benchmark_preprocessamento.py.
+"""
+
+import io
+
+import numpy as np
+from PIL import Image
+
+# Normalização dos pesos "openai" (open_clip.constants)
+OPENAI_DATASET_MEAN = (0.48145466, 0.4578275, 0.40821073)
+OPENAI_DATASET_STD = (0.26862954, 0.26130258, 0.27577711)
+
+_HIGH_BIT_DEPTH_MODES = ("I", "I;16", "I;16B", "I;16L", "I;16N", "F")
+_GRAYSCALE_MODES = ("1", "L", "LA", "La")
+
+# Reduções mais agressivas que isso usam Image.reduce antes do filtro bicúbico
+REDUCING_GAP = 3.0
+
+
+class RadiographPreprocessor:
+    """
+    Converte bytes de imagem no tensor de entrada do CLIP.
+
+    Args:
+        image_size: Lado da imagem de entrada do modelo (224 no ViT-B-32)
+        mean: Média por canal da normalização
+        std: Desvio padrão por canal da normalização
+    """
+
+    def __init__(self, image_size=224, mean=OPENAI_DATASET_MEAN, std=OPENAI_DATASET_STD):
+        self.image_size = int(image_size)
+        mean = np.asarray(mean, dtype=np.float32)
+        std = np.asarray(std, dtype=np.float32)
+        # (x / 255 - mean) / std == x * scale - offset
+        self._scale = (1.0 / (255.0 * std)).astype(np.float32)
+        self._offset = (mean / std).astype(np.float32)
+
+    @classmethod
+    def for_model(cls, model):
+        """Cria o pré-processador com tamanho e normalização do modelo open_clip."""
+        cfg = getattr(model.visual, "preprocess_cfg", None) or {}
+        size = cfg.get("size", getattr(model.visual, "image_size", 224))
+        if isinstance(size, (tuple, list)):
+            size = size[0]
+        return cls(
+            image_size=size,
+            mean=cfg.get("mean", OPENAI_DATASET_MEAN),
+            std=cfg.get("std", OPENAI_DATASET_STD),
+        )
+
+    def decode(self, image_data):
+        """
+        Decodifica e reduz a imagem para image_size x image_size.
+
+        Returns:
+            PIL.Image em modo "L" ou "RGB"
+        """
+        image = Image.open(io.BytesIO(image_data))
+        if image.format == "JPEG":
+            mode = "L" if image.mode == "L" else "RGB"
+            image.draft(mode, (self.image_size, self.image_size))
+        image = self.to_8bit(image)
+        return self.resize_center_crop(image)
+
+    def to_8bit(self, image):
+        """Converte para "L" ou "RGB"; 16 bits e float são esticados para 8 bits (min-max)."""
+        if image.mode in ("L", "RGB"):
+            return image
+        if image.mode in _HIGH_BIT_DEPTH_MODES:
+            pixels = np.asarray(image, dtype=np.float32)
+            low, high = float(pixels.min()), float(pixels.max())
+            if high > low:
+                pixels -= low
+                pixels *= 255.0 / (high - low)
+            else:
+                pixels.fill(0.0)
+            return Image.fromarray(pixels.astype(np.uint8), mode="L")
+        if image.mode in _GRAYSCALE_MODES:
+            return image.convert("L")
+        return image.convert("RGB")
+
+    def resize_center_crop(self, image):
+        width, height = image.size
+        size = self.image_size
+        # Mesma geometria de Resize(size) + CenterCrop(size) do torchvision,
+        # mas só a região central é reamostrada
+        short = min(width, height)
+        left = (width - short) / 2.0
+        top = (height - short) / 2.0
+        box = (left, top, left + short, top + short)
+        if (width, height) == (size, size):
+            return image
+        return image.resize(
+            (size, size), Image.BICUBIC, box=box, reducing_gap=REDUCING_GAP
+        )
+
+    def to_array(self, image):
+        """Normaliza a imagem em um np.ndarray float32 (3, H, W)."""
+        pixels = np.asarray(image, dtype=np.float32)
+        out = np.empty((3,) + pixels.shape[:2], dtype=np.float32)
+        for channel in range(3):
+            source = pixels if pixels.ndim == 2 else pixels[:, :, channel]
+            np.multiply(source, self._scale[channel], out=out[channel])
+            out[channel] -= self._offset[channel]
+        return out
+
+    def preprocess_array(self, image_data):
+        """Bytes da imagem -> np.ndarray float32 (3, H, W)."""
+        return self.to_array(self.decode(image_data))
+
+    def __call__(self, image_data):
+        """Bytes da imagem -> tensor torch (3, H, W), sem cópia do array."""
+        import torch
+
+        return torch.from_numpy(self.preprocess_array(image_data))
+
+
+class TransformPreprocessor:
+    """
+    Caminho antigo: Image.open + transformação do open_clip.
+
+    Mantido para CLIP_FAST_PREPROCESS=false e como referência no benchmark.
+    """
+
+    def __init__(self, transform):
+        self.transform = transform
+
+    def __call__(self, image_data):
+        return self.transform(Image.open(io.BytesIO(image_data)))
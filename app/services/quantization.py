@@ -0,0 +1,44 @@
+"""
+Quantização INT8 dinâmica do encoder de imagens CLIP para CPU.
+
+As camadas nn.Linear do transformer visual (MLP e projeções) passam a usar
+pesos INT8 com ativações quantizadas dinamicamente em tempo de execução.
+Só o encoder de imagens é quantizado; a torre de texto não é usada pela API.
+O impacto em latência, memória e qualidade da busca é medido por
+scripts/benchmark_quantizacao.py.
+"""
+
+import io
+import logging
+
+logger = logging.getLogger("raiox-api")
+
+QUANTIZATION_MODES = ("none", "int8")
+
+
+def quantize_image_encoder(model):
+    """
+    Aplica quantização dinâmica INT8 às camadas lineares de `model.visual`.
+
+    Args:
+        model: Modelo open_clip em CPU (modificado in-place)
+
+    Returns:
+        O mesmo modelo, com a torre visual quantizada
+    """
+    import torch
+    from torch.ao.quantization import quantize_dynamic
+
+    model.visual = quantize_dynamic(model.visual.cpu(), {torch.nn.Linear}, dtype=torch.qint8)
+    model.eval()
+    logger.info("Encoder de imagens CLIP quantizado para INT8 (dinâmico)")
+    return model
+
+
+def serialized_size(module):
+    """Tamanho em bytes do state_dict serializado de um módulo."""
+    import torch
+
+    buffer = io.BytesIO()
+    torch.save(module.state_dict(), buffer)
+    return buffer.tell()
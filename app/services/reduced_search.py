@@ -0,0 +1,221 @@
+"""
+Busca em dois estágios sobre o catálogo exportado: candidatos em espaço PCA
+reduzido e re-rank exato com os embeddings CLIP de 512 dimensões.
+
+A projeção (média e componentes principais) é ajustada offline sobre o
+catálogo (scripts/ajustar_projecao_pca.py) e gravada no próprio diretório do
+catálogo, junto da matriz já projetada. O arquivo pca.json guarda a versão da
+exportação de origem: um catálogo reexportado sem reajustar a projeção é
+recusado e o worker segue com o par anterior.
+
+Na consulta, o vetor é projetado (64/128 dimensões), as distâncias L2
+aproximadas são calculadas contra a matriz reduzida e só os `candidates`
+melhores são re-ranqueados com a distância exata. A matriz de 512 dimensões
+continua memory-mapped, mas só as linhas candidatas são lidas; a parte
+quente em memória é a matriz reduzida (4x a 8x menor).
+"""
+
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from app.services.exact_search import EMBEDDINGS_FILE, METADATA_FILE, MmapExactSearch, select_rows
+
+logger = logging.getLogger("raiox-api")
+
+PROJECTION_FILE = "pca_projection.npz"
+REDUCED_FILE = "pca_reduced.npy"
+REDUCED_NORMS_FILE = "pca_reduced_norms.npy"
+PROJECTION_METADATA_FILE = "pca.json"
+
+
+def fit_pca(embeddings, components, chunk_rows=65536):
+    """
+    Ajusta a PCA pela matriz de covariância, acumulada em blocos.
+
+    Não materializa o catálogo inteiro em float64: serve para matrizes
+    memory-mapped de centenas de milhares de linhas.
+
+    Returns:
+        Tupla (média (D,), componentes (K, D), fração da variância explicada)
+    """
+    count, dimension = embeddings.shape
+    if not 0 < components <= dimension:
+        raise ValueError(f"Número de componentes inválido: {components} (dimensão {dimension})")
+    total = np.zeros(dimension, dtype=np.float64)
+    gram = np.zeros((dimension, dimension), dtype=np.float64)
+    for start in range(0, count, chunk_rows):
+        block = np.asarray(embeddings[start:start + chunk_rows], dtype=np.float64)
+        total += block.sum(axis=0)
+        gram += block.T @ block
+    mean = total / count
+    covariance = gram / count - np.outer(mean, mean)
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    order = np.argsort(eigenvalues)[::-1][:components]
+    explained = float(eigenvalues[order].sum() / eigenvalues.sum())
+    return mean.astype(np.float32), np.ascontiguousarray(eigenvectors[:, order].T, dtype=np.float32), explained
+
+
+def project(vectors, mean, components):
+    """Projeta vetores (N, D) no espaço reduzido (N, K)."""
+    return (np.asarray(vectors, dtype=np.float32) - mean) @ components.T
+
+
+def _save_npy(path, array):
+    staging = f"{path}.tmp-{os.getpid()}.npy"
+    np.save(staging, array)
+    os.replace(staging, path)
+
+
+def write_projection(directory, components=128, chunk_rows=65536):
+    """
+    Ajusta a PCA do catálogo e grava a projeção e a matriz reduzida.
+
+    pca.json é gravado por último: é ele que os workers observam.
+
+    Args:
+        directory: Diretório gerado por export_catalog
+        components: Dimensões do espaço reduzido
+
+    Returns:
+        Dict com o conteúdo de pca.json
+    """
+    with open(os.path.join(directory, METADATA_FILE)) as f:
+        catalog_version = json.load(f).get("version")
+    embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r")
+
+    started = time.perf_counter()
+    mean, basis, explained = fit_pca(embeddings, components, chunk_rows)
+    reduced = np.empty((embeddings.shape[0], components), dtype=np.float32)
+    for start in range(0, embeddings.shape[0], chunk_rows):
+        reduced[start:start + chunk_rows] = project(embeddings[start:start + chunk_rows], mean, basis)
+    reduced_norms = np.linalg.norm(reduced, axis=1).astype(np.float32)
+    elapsed = time.perf_counter() - started
+
+    staging = os.path.join(directory, f"{PROJECTION_FILE}.tmp-{os.getpid()}.npz")
+    np.savez(staging, mean=mean, components=basis)
+    os.replace(staging, os.path.join(directory, PROJECTION_FILE))
+    _save_npy(os.path.join(directory, REDUCED_FILE), reduced)
+    _save_npy(os.path.join(directory, REDUCED_NORMS_FILE), reduced_norms)
+
+    info = {
+        "catalog_version": catalog_version,
+        "components": int(components),
+        "dimension": int(embeddings.shape[1]),
+        "count": int(embeddings.shape[0]),
+        "explained_variance": round(explained, 6),
+        "fit_seconds": round(elapsed, 3),
+    }
+    metadata_path = os.path.join(directory, PROJECTION_METADATA_FILE)
+    with open(f"{metadata_path}.tmp-{os.getpid()}", "w") as f:
+        json.dump(info, f)
+    os.replace(f"{metadata_path}.tmp-{os.getpid()}", metadata_path)
+    logger.info(
+        f"Projeção PCA gravada em {directory}: {components} dimensões, "
+        f"{explained:.1%} da variância"
+    )
+    return info
+
+
+class TwoStageSearch(MmapExactSearch):
+    """
+    Backend de busca em dois estágios (PCA + re-rank exato).
+
+    Args:
+        directory: Diretório do catálogo com a projeção ajustada
+        candidates: Candidatos do estágio reduzido re-ranqueados em 512-d
+        reload_interval: Intervalo mínimo (s) entre verificações de nova projeção
+        model_version: Modelo das consultas (ver MmapExactSearch)
+    """
+
+    name = "pca"
+
+    def __init__(self, directory, candidates=200, reload_interval=30.0, model_version=None):
+        super().__init__(directory, reload_interval=reload_interval, model_version=model_version)
+        self.candidates = int(candidates)
+        self._mean = None
+        self._components = None
+        self._reduced = None
+        self._reduced_norms = None
+        self._projection = {}
+
+    def _watch_paths(self):
+        # A projeção é gravada depois da exportação: é ela que dispara o reload
+        return (os.path.join(self.directory, PROJECTION_METADATA_FILE),)
+
+    def _load_companions(self, metadata):
+        directory = metadata["directory"]
+        with open(os.path.join(directory, PROJECTION_METADATA_FILE)) as f:
+            info = json.load(f)
+        if info.get("catalog_version") != metadata.get("version"):
+            raise ValueError("Projeção PCA ajustada para outra exportação do catálogo: reajuste a projeção")
+        projection = np.load(os.path.join(directory, PROJECTION_FILE))
+        reduced = np.load(os.path.join(directory, REDUCED_FILE), mmap_mode="r")
+        reduced_norms = np.load(os.path.join(directory, REDUCED_NORMS_FILE), mmap_mode="r")
+        if reduced.shape[0] != len(metadata["implants"]):
+            raise ValueError(f"Matriz reduzida inconsistente em {self.directory}")
+        return {
+            "_mean": projection["mean"],
+            "_components": projection["components"],
+            "_reduced": reduced,
+            "_reduced_norms": reduced_norms,
+            "_projection": info,
+        }
+
+    def search_many(self, query_vectors, limit=3, filters=None):
+        """Top-k em dois estágios para várias consultas."""
+        started = time.perf_counter()
+        self._ensure_loaded()
+        with self._lock:
+            embeddings, norms, implants = self._embeddings, self._norms, self._implants
+            subindexes, mean, basis = self._subindexes, self._mean, self._components
+            reduced, reduced_norms = self._reduced, self._reduced_norms
+        queries = np.ascontiguousarray(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        if queries.shape[0] == 0:
+            return []
+
+        rows = select_rows(subindexes, filters)
+        if rows is not None:
+            reduced, reduced_norms = reduced[rows], reduced_norms[rows]
+        if isinstance(rows, slice):
+            rows = np.arange(rows.start, rows.stop)
+
+        # Estágio 1: distâncias aproximadas no espaço reduzido
+        projected = project(queries, mean, basis)
+        coarse = (
+            reduced_norms * reduced_norms
+            - 2.0 * (projected @ reduced.T)
+            + np.sum(projected * projected, axis=1, keepdims=True)
+        )
+        candidates = min(max(self.candidates, limit), coarse.shape[1])
+        query_norms = np.linalg.norm(queries, axis=1)
+
+        results = []
+        for i in range(queries.shape[0]):
+            if candidates < coarse.shape[1]:
+                positions = np.argpartition(coarse[i], candidates - 1)[:candidates]
+            else:
+                positions = np.arange(coarse.shape[1])
+            # Estágio 2: re-rank exato; linhas em ordem crescente leem o mmap em sequência
+            candidate_rows = np.sort(positions if rows is None else rows[positions])
+            scores = np.asarray(embeddings[candidate_rows]) @ queries[i]
+            results.append(self._top_k(
+                np.asarray(norms[candidate_rows]), implants, scores, float(query_norms[i]), limit, candidate_rows
+            ))
+        with self._lock:
+            self._searches += queries.shape[0]
+            self._search_total += time.perf_counter() - started
+        return results
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats.update({
+                "candidates": self.candidates,
+                "components": self._projection.get("components"),
+                "explained_variance": self._projection.get("explained_variance"),
+            })
+        return stats
@@ -0,0 +1,178 @@
+"""
+Re-embedding do catálogo com um novo modelo CLIP.
+
+Processa só as linhas pendentes para o modelo da vaga next
+(app/db/embedding_versions.py), em ordem de id e em lotes: leitura da
+imagem (image_url ou, sem URL, a origem registrada em implant_ingest_log),
+decodificação e CLIP pelo EmbeddingPipeline da ingestão e UPDATE de
+embedding_next com o checkpoint na mesma transação.
+
+Interrompido, o job recomeça do checkpoint. Ao chegar ao fim da tabela,
+volta ao início para as linhas anteriores ao checkpoint que ficaram
+pendentes (falhas de leitura, execuções anteriores). `max_rate` limita as
+imagens/s com pausas entre lotes, para o job rodar ao lado da API sem
+disputar CPU e banco. Com `embedding_copies` (ObjectIndex), imagens do
+bucket com cópia na resolução do CLIP (app/services/derivatives.py) são
+lidas da cópia, não do original.
+"""
+
+import logging
+import time
+
+from app.db.embedding_versions import get_slots, pending_count, pending_rows, reset_checkpoint, write_next_batch
+from app.services.ingestion import INGEST_LOG_TABLE, EmbeddingPipeline, ensure_ingest_log, source_item
+from app.services.spaces import object_name_from_url, object_url
+
+logger = logging.getLogger("raiox-api")
+
+
+class ReEmbedding:
+    """
+    Job de re-embedding das linhas pendentes para `model_version`.
+
+    Args:
+        pool: VectorSearchPool
+        encode_batch: Função (lista de tensores) -> lista de embeddings do modelo novo
+        preprocess: Pré-processador bytes -> tensor do modelo novo
+        model_version: Modelo novo (o da vaga next)
+        batch_size: Linhas por forward pass e por UPDATE
+        decode_workers: Processos de decodificação (0 = nas threads de leitura)
+        io_threads: Threads de leitura
+        max_rate: Limite de imagens/s (0 = sem limite)
+        embedding_copies: ObjectIndex com os derivados "embed"; só passe se a
+            resolução de entrada do modelo novo for a da cópia
+    """
+
+    def __init__(
+        self, pool, encode_batch, preprocess, model_version, batch_size=256, decode_workers=2, io_threads=16,
+        max_rate=0.0, embedding_copies=None,
+    ):
+        self.pool = pool
+        self.model_version = model_version
+        self.batch_size = max(1, int(batch_size))
+        self.max_rate = float(max_rate or 0.0)
+        self.embedding_copies = embedding_copies
+        self.pipeline = EmbeddingPipeline(encode_batch, preprocess, decode_workers, io_threads)
+        self._write = 0.0
+        self._throttled = 0.0
+        self._counts = {"reembedded": 0, "missing_source": 0, "from_embedding_copy": 0, "batches": 0}
+
+    def _source_urls(self, rows):
+        urls = {implant_id: url for implant_id, url in rows if url}
+        if self.embedding_copies is None or not urls:
+            return urls
+        object_names = {implant_id: object_name_from_url(url) for implant_id, url in urls.items()}
+        copies = self.embedding_copies.derivatives(object_names.values())
+        for implant_id, object_name in object_names.items():
+            copy = copies.get(object_name, {}).get("embed")
+            if copy:
+                urls[implant_id] = object_url(copy)
+                self._counts["from_embedding_copy"] += 1
+        return urls
+
+    def _items(self, conn, rows):
+        items = [
+            {"key": f"implant {implant_id}", "id": implant_id, "url": url}
+            for implant_id, url in self._source_urls(rows).items()
+        ]
+        without_url = [implant_id for implant_id, url in rows if not url]
+        if without_url:
+            logged = dict(
+                (implant_id, (source, key))
+                for implant_id, source, key in conn.execute(
+                    f"SELECT implant_id, source, key FROM {INGEST_LOG_TABLE} WHERE implant_id = ANY(%s)",
+                    (without_url,),
+                ).fetchall()
+            )
+            for implant_id in without_url:
+                item = source_item(*logged[implant_id]) if implant_id in logged else None
+                if item is None:
+                    logger.warning(f"Implante {implant_id} sem image_url nem origem de ingestão: não reprocessado")
+                    self._counts["missing_source"] += 1
+                    continue
+                items.append(dict(item, key=f"implant {implant_id}", id=implant_id))
+        return sorted(items, key=lambda item: item["id"])
+
+    def _pending(self, checkpoint, limit):
+        remaining = limit
+        passes = [(checkpoint, None)]
+        if checkpoint:
+            passes.append((0, checkpoint))
+        for number, (after, before) in enumerate(passes):
+            if number:
+                # Fim da tabela: nova passada a partir do início
+                with self.pool.connection() as conn:
+                    reset_checkpoint(conn)
+            while remaining is None or remaining > 0:
+                size = self.batch_size if remaining is None else min(self.batch_size, remaining)
+                with self.pool.connection() as conn:
+                    rows = pending_rows(conn, self.model_version, after, before, size)
+                    if not rows:
+                        break
+                    items = self._items(conn, rows)
+                after = rows[-1][0]
+                if remaining is not None:
+                    remaining -= len(rows)
+                if items:
+                    yield items
+
+    def run(self, limit=None, progress=None):
+        """
+        Reprocessa as linhas pendentes.
+
+        Args:
+            limit: Máximo de linhas nesta execução
+            progress: Função opcional chamada com o relatório parcial após cada lote
+
+        Returns:
+            Dict com contadores, linhas ainda pendentes, tempos por etapa e imagens/s
+        """
+        started = time.perf_counter()
+        with self.pool.connection() as conn:
+            ensure_ingest_log(conn)
+            slot = get_slots(conn).get("next")
+            if not slot or slot["model_version"] != self.model_version:
+                raise RuntimeError(f"A vaga next não é de {self.model_version} (start_migration)")
+            checkpoint = slot["checkpoint_id"]
+        logger.info(f"Re-embedding para {self.model_version} a partir do id {checkpoint}")
+
+        for batch_items, embeddings in self.pipeline.embed(self._pending(checkpoint, limit)):
+            stage = time.perf_counter()
+            with self.pool.connection() as conn:
+                write_next_batch(
+                    conn, self.model_version, [item["id"] for item in batch_items], embeddings,
+                    checkpoint_id=batch_items[-1]["id"],
+                )
+            self._write += time.perf_counter() - stage
+            self._counts["reembedded"] += len(batch_items)
+            self._counts["batches"] += 1
+            if self.max_rate:
+                wait = self._counts["reembedded"] / self.max_rate - (time.perf_counter() - started)
+                if wait > 0:
+                    time.sleep(wait)
+                    self._throttled += wait
+            if progress is not None:
+                progress(self.report(time.perf_counter() - started))
+
+        with self.pool.connection() as conn:
+            pending = pending_count(conn, self.model_version)
+        report = self.report(time.perf_counter() - started, pending=pending)
+        logger.info(
+            f"Re-embedding para {self.model_version}: {report['reembedded']} linhas em {report['seconds']}s, "
+            f"{pending} pendentes"
+        )
+        return report
+
+    def report(self, elapsed, pending=None):
+        stages = dict(self.pipeline.stages, write=self._write, throttled=self._throttled)
+        report = dict(
+            self._counts,
+            failed=self.pipeline.failed,
+            model_version=self.model_version,
+            seconds=round(elapsed, 2),
+            images_per_second=round(self._counts["reembedded"] / elapsed, 1) if elapsed else 0.0,
+            stages_s={name: round(value, 2) for name, value in stages.items()},
+        )
+        if pending is not None:
+            report["pending"] = pending
+        return report
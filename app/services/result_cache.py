@@ -0,0 +1,271 @@
+"""
+Cache de resultados da busca para consultas quase idênticas.
+
+Reexportações, recortes e compressões diferentes da mesma radiografia têm
+bytes diferentes (o EmbeddingCache não acerta), mas embeddings CLIP quase
+iguais. Aqui a chave é um hash sensível à localidade do embedding
+(SimHash: sinal da projeção em hiperplanos aleatórios), em `tables`
+tabelas de `bits` bits. Consultas próximas caem no mesmo balde em pelo
+menos uma tabela com alta probabilidade; o acerto só vale se o cosseno com
+a consulta original for >= `threshold`, com o mesmo limit e filtros.
+
+Entradas expiram após `ttl` segundos, o total é limitado a `max_items`
+(LRU) e o cache inteiro é descartado quando a versão do catálogo informada
+pelo backend (catalog_version) muda.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger("raiox-api")
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+def filters_key(limit, filters):
+    """Parte da chave que não vem do embedding: limit e filtros normalizados."""
+    filters = filters or {}
+    ids = filters.get("ids")
+    return (
+        int(limit),
+        filters.get("manufacturer"),
+        filters.get("type"),
+        tuple(sorted(ids)) if ids is not None else None,
+    )
+
+
+class NearDuplicateCache:
+    """
+    Cache LSH de resultados de find_similar_implants.
+
+    Args:
+        threshold: Cosseno mínimo entre a consulta e a consulta em cache
+        ttl: Validade (s) de cada entrada
+        max_items: Capacidade (LRU)
+        bits: Bits de cada assinatura SimHash
+        tables: Tabelas de hash independentes
+        seed: Semente dos hiperplanos (fixa: assinaturas estáveis entre restarts)
+    """
+
+    def __init__(self, threshold=0.98, ttl=300.0, max_items=4096, bits=16, tables=8, seed=0):
+        self.threshold = float(threshold)
+        self.ttl = float(ttl)
+        self.max_items = max(1, int(max_items))
+        self.bits = int(bits)
+        self.tables = int(tables)
+        self.seed = seed
+        self._planes = None
+        self._weights = 1 << np.arange(self.bits, dtype=np.int64)
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._next_id = 0
+        self._version = None
+
+        self._hits = 0
+        self._misses = 0
+        self._saved = 0.0
+        self._hit_similarity = 0.0
+        self._expirations = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def _signatures(self, unit):
+        if self._planes is None or self._planes.shape[2] != unit.shape[0]:
+            rng = np.random.default_rng(self.seed)
+            self._planes = rng.standard_normal((self.tables, self.bits, unit.shape[0])).astype(np.float32)
+        bits = (self._planes @ unit) > 0
+        return (bits.astype(np.int64) @ self._weights).tolist()
+
+    def _check_version(self, version):
+        # Chamado com _lock adquirido
+        if version == self._version:
+            return
+        if self._entries:
+            logger.info(f"Catálogo mudou ({self._version} -> {version}), invalidando cache de resultados")
+            self._invalidations += 1
+        self._clear()
+        self._version = version
+
+    def _clear(self):
+        self._entries.clear()
+        self._buckets.clear()
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        for bucket in entry["buckets"]:
+            ids = self._buckets.get(bucket)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._buckets[bucket]
+
+    def get(self, query_vector, limit=3, filters=None, version=None):
+        """
+        Resultado em cache de uma consulta quase idêntica.
+
+        Returns:
+            Lista de dicts (cópia) ou None em caso de miss
+        """
+        unit = _unit(query_vector)
+        context = filters_key(limit, filters)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            candidates = set()
+            for table, signature in enumerate(self._signatures(unit)):
+                candidates.update(self._buckets.get((table, signature, context), ()))
+            best, best_similarity = None, self.threshold
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if now - entry["created"] > self.ttl:
+                    self._remove(entry_id)
+                    self._expirations += 1
+                    continue
+                similarity = float(unit @ entry["unit"])
+                if similarity >= best_similarity:
+                    best, best_similarity = entry_id, similarity
+            if best is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(best)
+            entry = self._entries[best]
+            self._hits += 1
+            self._saved += entry["search_seconds"]
+            self._hit_similarity += best_similarity
+            return [dict(item) for item in entry["results"]]
+
+    def put(self, query_vector, limit, filters, results, search_seconds=0.0, version=None):
+        """Armazena o resultado de uma busca."""
+        unit = _unit(query_vector)
+        context = filters_key(limit, filters)
+        with self._lock:
+            self._check_version(version)
+            entry_id = self._next_id
+            self._next_id += 1
+            buckets = [
+                (table, signature, context) for table, signature in enumerate(self._signatures(unit))
+            ]
+            self._entries[entry_id] = {
+                "unit": unit,
+                "results": [dict(item) for item in results],
+                "created": time.monotonic(),
+                "search_seconds": float(search_seconds),
+                "buckets": buckets,
+            }
+            for bucket in buckets:
+                self._buckets.setdefault(bucket, set()).add(entry_id)
+            while len(self._entries) > self.max_items:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def invalidate(self):
+        """Descarta todas as entradas (ex.: após ingestão no catálogo)."""
+        with self._lock:
+            if self._entries:
+                self._invalidations += 1
+            self._clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "items": len(self._entries),
+                "max_items": self.max_items,
+                "threshold": self.threshold,
+                "ttl_s": self.ttl,
+                "bits": self.bits,
+                "tables": self.tables,
+                "catalog_version": self._version,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": (self._hits / lookups) if lookups else 0.0,
+                "saved_search_ms": self._saved * 1000.0,
+                "avg_hit_similarity": (self._hit_similarity / self._hits) if self._hits else None,
+                "expirations": self._expirations,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+            }
+
+
+class CachedSearch:
+    """
+    Backend de busca com o NearDuplicateCache na frente.
+
+    Mesma interface dos backends (search, search_many, stats). A versão do
+    catálogo é consultada no backend no máximo a cada `version_interval`
+    segundos. Resultados parciais (shards fora do prazo) não entram no cache.
+
+    Args:
+        backend: Backend de busca (create_search_backend)
+        cache: NearDuplicateCache
+        version_interval: Intervalo mínimo (s) entre consultas de catalog_version
+    """
+
+    def __init__(self, backend, cache, version_interval=5.0):
+        self.backend = backend
+        self.cache = cache
+        self.version_interval = float(version_interval)
+        self.name = backend.name
+        self._version = None
+        self._last_check = None
+        self._version_lock = threading.Lock()
+
+    def _catalog_version(self):
+        now = time.monotonic()
+        with self._version_lock:
+            if self._last_check is not None and now - self._last_check < self.version_interval:
+                return self._version
+            self._last_check = now
+        try:
+            version = self.backend.catalog_version()
+        except Exception as e:
+            # Sem versão nova, o cache segue com a anterior até o TTL
+            logger.warning(f"Versão do catálogo indisponível: {str(e)}")
+            return self._version
+        with self._version_lock:
+            self._version = version
+        return version
+
+    def _complete(self):
+        complete = getattr(self.backend, "last_search_complete", None)
+        return complete is None or complete()
+
+    def search(self, query_vector, limit=3, filters=None):
+        return self.search_many([query_vector], limit=limit, filters=filters)[0]
+
+    def search_many(self, query_vectors, limit=3, filters=None):
+        version = self._catalog_version()
+        results = [self.cache.get(vector, limit, filters, version) for vector in query_vectors]
+        missing = [i for i, found in enumerate(results) if found is None]
+        if not missing:
+            return results
+        started = time.perf_counter()
+        found = self.backend.search_many([query_vectors[i] for i in missing], limit=limit, filters=filters)
+        # Tempo economizado por acerto futuro: a parte desta busca de cada vetor
+        elapsed = (time.perf_counter() - started) / len(missing)
+        complete = self._complete()
+        for i, items in zip(missing, found):
+            results[i] = items
+            if complete:
+                self.cache.put(query_vectors[i], limit, filters, items, elapsed, version)
+        return results
+
+    def catalog_version(self):
+        return self.backend.catalog_version()
+
+    def close(self):
+        if hasattr(self.backend, "close"):
+            self.backend.close()
+
+    def stats(self):
+        return self.backend.stats()
@@ -0,0 +1,107 @@
+"""
+Seleção do backend de busca usado por find_similar_implants.
+
+Todos os backends expõem a mesma interface:
+    search(query_vector, limit, filters) -> lista de dicts (ImplantSchema + distance/similarity)
+    search_many(query_vectors, limit, filters) -> uma lista de resultados por vetor
+    stats() -> dict de métricas
+
+`filters` é None ou o dict devolvido por search_filters.
+"""
+
+from app.services.exact_search import MmapExactSearch
+from app.services.hnsw_search import HnswSearch
+from app.services.pq_search import PqSearch
+from app.services.reduced_search import TwoStageSearch
+from app.services.sharded_search import ShardedSearch
+from app.services.vector_search import PgVectorSearch
+
+SEARCH_BACKENDS = ("pgvector", "exact", "hnsw", "pca", "pq", "sharded")
+
+
+def search_filters(manufacturer=None, type=None, ids=None):
+    """
+    Normaliza os filtros opcionais da busca.
+
+    Args:
+        manufacturer: Fabricante exato
+        type: Tipo exato
+        ids: Lista de ids de implantes permitidos
+
+    Returns:
+        Dict só com os filtros informados, ou None sem filtros
+    """
+    filters = {}
+    if manufacturer:
+        filters["manufacturer"] = manufacturer
+    if type:
+        filters["type"] = type
+    if ids is not None:
+        filters["ids"] = [int(i) for i in ids]
+    return filters or None
+
+
+def create_search_backend(
+    name,
+    pool,
+    catalog_dir=None,
+    reload_interval=30.0,
+    hnsw_index_path=None,
+    hnsw_ef_search=64,
+    pg_session_settings=None,
+    model_version=None,
+    version_interval=5.0,
+    pca_candidates=200,
+    pq_nprobe=16,
+    pq_rerank=32,
+    shard_targets=None,
+    shard_deadline=0.5,
+):
+    """
+    Instancia o backend de busca configurado.
+
+    Args:
+        name: "pgvector" (SQL), "exact" (NumPy sobre catálogo memory-mapped),
+            "hnsw" (índice aproximado em processo), "pca" (dois estágios),
+            "pq" (códigos IVF-PQ comprimidos) ou "sharded" (shards remotos)
+        pool: VectorSearchPool usado pelo backend pgvector
+        catalog_dir: Diretório do catálogo exportado (backends em processo)
+        reload_interval: Intervalo (s) de verificação de nova exportação
+        hnsw_index_path: Arquivo do índice HNSW (backend hnsw)
+        hnsw_ef_search: ef das consultas HNSW
+        pg_session_settings: Opções de consulta do índice pgvector (backend pgvector)
+        model_version: Modelo dos embeddings de consulta (coluna lida pelo pgvector;
+            snapshots de outro modelo são recusados pelos backends em processo)
+        version_interval: Intervalo (s) de verificação da versão dos embeddings (backend pgvector)
+        pca_candidates: Candidatos re-ranqueados em 512-d (backend pca)
+        pq_nprobe: Listas IVF visitadas por consulta (backend pq)
+        pq_rerank: Candidatos ADC reavaliados com o vetor exato (backend pq)
+        shard_targets: Endereços dos shards (backend sharded)
+        shard_deadline: Prazo (s) de resposta dos shards (backend sharded)
+
+    Returns:
+        Backend de busca
+    """
+    if name not in SEARCH_BACKENDS:
+        raise ValueError(f"Backend de busca desconhecido: {name}")
+    if name == "hnsw":
+        return HnswSearch(
+            catalog_dir, hnsw_index_path, ef_search=hnsw_ef_search, reload_interval=reload_interval,
+            model_version=model_version,
+        )
+    if name == "pca":
+        return TwoStageSearch(
+            catalog_dir, candidates=pca_candidates, reload_interval=reload_interval, model_version=model_version
+        )
+    if name == "sharded":
+        return ShardedSearch(shard_targets, deadline=shard_deadline)
+    if name == "pq":
+        return PqSearch(
+            catalog_dir, nprobe=pq_nprobe, rerank=pq_rerank, reload_interval=reload_interval,
+            model_version=model_version,
+        )
+    if name == "exact":
+        return MmapExactSearch(catalog_dir, reload_interval=reload_interval, model_version=model_version)
+    return PgVectorSearch(
+        pool, session_settings=pg_session_settings, model_version=model_version, version_interval=version_interval
+    )
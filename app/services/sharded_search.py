@@ -0,0 +1,289 @@
+"""
+Busca distribuída em shards do catálogo (scatter-gather).
+
+Quando o catálogo não cabe na RAM de uma máquina, a exportação é dividida
+em shards (por faixa de id ou por fabricante), cada um no formato de
+export_catalog. Cada shard é servido por um processo leve
+(scripts/servir_shard.py, app/shard_server.py) em HTTP local ou socket
+Unix, com qualquer backend em processo (exact, hnsw, pca, pq).
+
+O coordenador (ShardedSearch, dentro da API) envia a consulta a todos os
+shards em paralelo e junta os top-k parciais pela distância L2. Como cada
+shard devolve distâncias exatas do seu pedaço, a junção dá o mesmo top-k
+da busca no catálogo inteiro. Shards que não respondem dentro do prazo
+(`deadline`) ou falham são ignorados: o resultado sai parcial, com aviso
+no log e contadores por shard em stats(); só sem nenhuma resposta a busca
+falha.
+"""
+
+import base64
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import httpx
+import numpy as np
+
+from app.services.exact_search import EMBEDDINGS_FILE, METADATA_FIELDS, export_catalog, load_metadata
+
+logger = logging.getLogger("raiox-api")
+
+SHARD_PARTITIONS = ("id", "manufacturer")
+SHARDS_MANIFEST_FILE = "shards.json"
+UNIX_PREFIX = "unix:"
+
+
+def encode_vectors(vectors):
+    """Vetores float32 (N x D) em base64 para o corpo da requisição."""
+    return base64.b64encode(np.ascontiguousarray(vectors, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def decode_vectors(data, dimension):
+    """Inverso de encode_vectors."""
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32).reshape(-1, dimension)
+
+
+def assign_shards(implants, shards, by="id"):
+    """
+    Divide as linhas do catálogo entre os shards.
+
+    Args:
+        implants: Metadados do catálogo (ordem das linhas)
+        shards: Número de shards
+        by: "id" (faixas de id com o mesmo número de linhas) ou
+            "manufacturer" (fabricantes inteiros, balanceados pelo total de linhas)
+
+    Returns:
+        Lista, por shard, de np.ndarray ordenado de linhas
+    """
+    if by not in SHARD_PARTITIONS:
+        raise ValueError(f"Partição de shards desconhecida: {by}")
+    if by == "id":
+        order = np.argsort([implant["id"] for implant in implants], kind="stable")
+        return [np.sort(part) for part in np.array_split(order, shards)]
+
+    groups = {}
+    for row, implant in enumerate(implants):
+        groups.setdefault(implant.get("manufacturer"), []).append(row)
+    if len(groups) < shards:
+        raise ValueError(f"Só há {len(groups)} fabricantes para {shards} shards")
+    # Maior fabricante primeiro, sempre no shard com menos linhas
+    parts = [[] for _ in range(shards)]
+    for rows in sorted(groups.values(), key=len, reverse=True):
+        min(parts, key=len).extend(rows)
+    return [np.asarray(sorted(rows), dtype=np.int64) for rows in parts]
+
+
+def export_shards(catalog_dir, output_dir, shards, by="id"):
+    """
+    Divide um catálogo exportado em shards (output_dir/shard-NN).
+
+    As linhas mantêm a ordem da exportação (fabricante, tipo, id) dentro de
+    cada shard, então os filtros continuam sendo fatias contíguas.
+
+    Returns:
+        Dict com o conteúdo de shards.json
+    """
+    metadata = load_metadata(catalog_dir)
+    implants = metadata["implants"]
+    embeddings = np.load(os.path.join(catalog_dir, EMBEDDINGS_FILE), mmap_mode="r")
+    parts = assign_shards(implants, shards, by)
+    if any(len(rows) == 0 for rows in parts):
+        raise ValueError(f"Catálogo com {len(implants)} implantes pequeno demais para {shards} shards")
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {"catalog_version": metadata.get("version"), "by": by, "shards": []}
+    for number, rows in enumerate(parts):
+        name = f"shard-{number:02d}"
+        export_catalog(
+            (tuple(implants[row][field] for field in METADATA_FIELDS) + (embeddings[row],) for row in rows),
+            os.path.join(output_dir, name),
+            model_version=metadata.get("model_version"),
+        )
+        ids = [implants[row]["id"] for row in rows]
+        manifest["shards"].append({
+            "name": name,
+            "implants": int(len(rows)),
+            "id_range": [min(ids), max(ids)],
+            "manufacturers": sorted({str(implants[row].get("manufacturer")) for row in rows}),
+        })
+    with open(os.path.join(output_dir, SHARDS_MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    logger.info(f"Catálogo dividido em {shards} shards por {by} em {output_dir}")
+    return manifest
+
+
+def shard_client(target, timeout):
+    """
+    Cliente HTTP de um shard.
+
+    Args:
+        target: "http://host:porta" ou "unix:/caminho/do/socket"
+        timeout: Timeout (s) de conexão e leitura
+    """
+    if target.startswith(UNIX_PREFIX):
+        return httpx.Client(
+            base_url="http://shard",
+            transport=httpx.HTTPTransport(uds=target[len(UNIX_PREFIX):]),
+            timeout=timeout,
+        )
+    return httpx.Client(base_url=target, timeout=timeout)
+
+
+class ShardedSearch:
+    """
+    Coordenador scatter-gather sobre shards remotos.
+
+    Args:
+        targets: Endereços dos shards ("http://host:porta" ou "unix:/socket")
+        deadline: Prazo (s) para cada busca; shards atrasados ficam de fora
+    """
+
+    name = "sharded"
+
+    def __init__(self, targets, deadline=0.5):
+        if not targets:
+            raise ValueError("Nenhum shard configurado (SEARCH_SHARDS)")
+        self.targets = list(targets)
+        self.deadline = float(deadline)
+        self._clients = {target: shard_client(target, self.deadline) for target in self.targets}
+        # Buscas concorrentes (um lote por thread do executor) dividem este pool
+        self._pool = ThreadPoolExecutor(max_workers=4 * len(self.targets), thread_name_prefix="shard")
+        self._lock = threading.Lock()
+        self._searches = 0
+        self._partial = 0
+        self._search_total = 0.0
+        self._last_report = None
+        # Resultado completo ou parcial da última busca de cada thread
+        self._local = threading.local()
+        self._shards = {
+            target: {"answered": 0, "timeouts": 0, "errors": 0, "total_ms": 0.0} for target in self.targets
+        }
+
+    def _query_shard(self, target, payload):
+        started = time.perf_counter()
+        response = self._clients[target].post("/search", json=payload)
+        response.raise_for_status()
+        return response.json()["results"], (time.perf_counter() - started) * 1000.0
+
+    def scatter(self, query_vectors, limit=3, filters=None):
+        """
+        Busca em todos os shards e junta os top-k parciais.
+
+        Returns:
+            Tupla (uma lista de resultados por vetor, relatório dos shards:
+            {"answered": [...], "timeouts": [...], "errors": {shard: erro}})
+        """
+        queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        payload = {
+            "vectors": encode_vectors(queries),
+            "dimension": int(queries.shape[1]),
+            "limit": limit,
+            "filters": filters,
+        }
+        futures = {self._pool.submit(self._query_shard, target, payload): target for target in self.targets}
+        done, pending = wait(futures, timeout=self.deadline)
+
+        report = {"answered": [], "timeouts": [], "errors": {}}
+        partials = []
+        elapsed = {}
+        for future in done:
+            target = futures[future]
+            try:
+                results, elapsed[target] = future.result()
+            except Exception as e:
+                report["errors"][target] = str(e) or type(e).__name__
+                continue
+            report["answered"].append(target)
+            partials.append(results)
+        for future in pending:
+            future.cancel()
+            report["timeouts"].append(futures[future])
+        report["answered"].sort(key=self.targets.index)
+        report["timeouts"].sort(key=self.targets.index)
+
+        with self._lock:
+            for target in report["answered"]:
+                self._shards[target]["answered"] += 1
+                self._shards[target]["total_ms"] += elapsed[target]
+            for target in report["timeouts"]:
+                self._shards[target]["timeouts"] += 1
+            for target in report["errors"]:
+                self._shards[target]["errors"] += 1
+            self._last_report = report
+
+        if not partials:
+            raise RuntimeError(f"Nenhum shard respondeu em {self.deadline}s: {report}")
+        if len(partials) < len(self.targets):
+            logger.warning(
+                f"Busca parcial: {len(partials)}/{len(self.targets)} shards responderam "
+                f"(timeout: {report['timeouts']}, erro: {list(report['errors'])})"
+            )
+        merged = [
+            heapq.nsmallest(limit, (item for shard in partials for item in shard[i]), key=lambda item: item["distance"])
+            for i in range(queries.shape[0])
+        ]
+        return merged, report
+
+    def catalog_version(self):
+        """Versões dos catálogos dos shards; shard fora do ar entra como "?"."""
+        versions = []
+        for target in self.targets:
+            try:
+                response = self._clients[target].get("/healthcheck")
+                response.raise_for_status()
+                versions.append(str(response.json().get("catalog_version")))
+            except (httpx.HTTPError, ValueError):
+                versions.append("?")
+        return "|".join(versions)
+
+    def search_many(self, query_vectors, limit=3, filters=None):
+        """Top-k para várias consultas (uma requisição por shard)."""
+        started = time.perf_counter()
+        if len(query_vectors) == 0:
+            return []
+        results, report = self.scatter(query_vectors, limit=limit, filters=filters)
+        self._local.complete = len(report["answered"]) == len(self.targets)
+        with self._lock:
+            self._searches += len(results)
+            if len(report["answered"]) < len(self.targets):
+                self._partial += len(results)
+            self._search_total += time.perf_counter() - started
+        return results
+
+    def last_search_complete(self):
+        """Se a última busca desta thread teve resposta de todos os shards."""
+        return getattr(self._local, "complete", True)
+
+    def search(self, query_vector, limit=3, filters=None):
+        """Top-k para um vetor de consulta."""
+        return self.search_many([query_vector], limit=limit, filters=filters)[0]
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        for client in self._clients.values():
+            client.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.name,
+                "deadline_s": self.deadline,
+                "searches": self._searches,
+                "partial_searches": self._partial,
+                "avg_ms": (self._search_total / self._searches * 1000.0) if self._searches else None,
+                "last_report": self._last_report,
+                "shards": {
+                    target: {
+                        "answered": counters["answered"],
+                        "timeouts": counters["timeouts"],
+                        "errors": counters["errors"],
+                        "avg_ms": (counters["total_ms"] / counters["answered"]) if counters["answered"] else None,
+                    }
+                    for target, counters in self._shards.items()
+                },
+            }
@@ -0,0 +1,41 @@
+"""
+Acesso ao DigitalOcean Spaces (API S3) compartilhado pela API e pelos scripts.
+"""
+
+import threading
+
+from app.core import config
+
+# Cliente S3 criado sob demanda (importar boto3 custa tempo de startup)
+_s3_client = None
+_s3_lock = threading.Lock()
+
+
+def get_s3_client():
+    """Retorna o cliente S3 do DigitalOcean Spaces, criando-o no primeiro uso."""
+    global _s3_client
+    if _s3_client is None:
+        with _s3_lock:
+            if _s3_client is None:
+                import boto3
+                _s3_client = boto3.client(
+                    's3',
+                    region_name=config.DO_SPACES_REGION,
+                    endpoint_url=config.DO_SPACES_ENDPOINT,
+                    aws_access_key_id=config.DO_SPACES_KEY,
+                    aws_secret_access_key=config.DO_SPACES_SECRET
+                )
+    return _s3_client
+
+
+def object_url(object_name, bucket=None):
+    """URL pública de um objeto do bucket."""
+    return f"{config.DO_SPACES_ENDPOINT}/{bucket or config.DO_SPACES_BUCKET}/{object_name}"
+
+
+def object_name_from_url(url, bucket=None):
+    """Nome do objeto de uma URL gerada por object_url; None para URLs de fora do bucket."""
+    prefix = f"{config.DO_SPACES_ENDPOINT}/{bucket or config.DO_SPACES_BUCKET}/"
+    if url and url.startswith(prefix):
+        return url[len(prefix):]
+    return None
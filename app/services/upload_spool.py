@@ -0,0 +1,331 @@
+"""
+Upload write-behind das radiografias para o DigitalOcean Spaces.
+
+Os endpoints gravam a imagem no spool local (um arquivo por upload, com
+fsync) e registram o envio numa fila SQLite no mesmo diretório; a URL do
+objeto é determinística e volta na hora, sem esperar o PUT. Threads em
+segundo plano enviam os arquivos com concorrência limitada e, em caso de
+erro, reagendam o envio com backoff exponencial.
+
+A fila é durável e compartilhada pelos workers do uvicorn: um envio é
+reservado por `lease` segundos antes de ser executado, de modo que envios
+de um processo que morreu voltam para a fila sozinhos. Depois de
+`max_attempts` tentativas o envio fica como "failed", com o arquivo ainda
+no spool (scripts/reenviar_uploads_spool.py recoloca na fila).
+
+`on_uploaded`/`on_failed` recebem o nome do objeto depois do PUT ou da
+desistência (o ObjectIndex usa para saber quais objetos já estão no bucket).
+"""
+
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+
+from app.services.spaces import get_s3_client, object_url
+
+logger = logging.getLogger("raiox-api")
+
+QUEUE_FILE = "queue.sqlite3"
+DATA_DIR = "data"
+
+# Quantos atrasos de envio concluído entram no p50/p95 das métricas
+_LAG_WINDOW = 1024
+
+
+class UploadSpool:
+    """
+    Spool local + fila durável de uploads para o Spaces.
+
+    Args:
+        directory: Diretório do spool (arquivos e fila SQLite)
+        bucket: Bucket de destino
+        concurrency: Threads de envio neste processo
+        max_attempts: Tentativas antes de marcar o envio como "failed"
+        retry_base: Espera (s) após a primeira falha; dobra a cada tentativa
+        retry_max: Espera máxima (s) entre tentativas
+        lease: Tempo (s) em que um envio reservado fica invisível aos outros workers
+        poll_interval: Intervalo (s) de consulta à fila quando não há aviso local
+        on_uploaded: Função opcional chamada com o nome do objeto após o envio
+        on_failed: Função opcional chamada com o nome do objeto ao desistir do envio
+    """
+
+    def __init__(
+        self, directory, bucket, concurrency=4, max_attempts=8, retry_base=2.0, retry_max=300.0,
+        lease=300.0, poll_interval=5.0, on_uploaded=None, on_failed=None,
+    ):
+        self.directory = directory
+        self.bucket = bucket
+        self.concurrency = max(1, int(concurrency))
+        self.max_attempts = max(1, int(max_attempts))
+        self.retry_base = max(0.0, float(retry_base))
+        self.retry_max = max(self.retry_base, float(retry_max))
+        self.lease = max(1.0, float(lease))
+        self.poll_interval = max(0.1, float(poll_interval))
+        self.on_uploaded = on_uploaded
+        self.on_failed = on_failed
+
+        self._data_dir = os.path.join(directory, DATA_DIR)
+        os.makedirs(self._data_dir, exist_ok=True)
+        self._db = self._open_db(os.path.join(directory, QUEUE_FILE))
+        self._db_lock = threading.Lock()
+
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._enqueued = 0
+        self._uploaded = 0
+        self._uploaded_bytes = 0
+        self._retries = 0
+        self._failed = 0
+        self._lags = deque(maxlen=_LAG_WINDOW)
+        self._lag_max = 0.0
+        self._last_error = None
+
+    @staticmethod
+    def _open_db(path):
+        db = sqlite3.connect(path, check_same_thread=False, timeout=10.0, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS uploads ("
+            " id TEXT PRIMARY KEY,"
+            " object_name TEXT NOT NULL,"
+            " bucket TEXT NOT NULL,"
+            " path TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " content_type TEXT,"
+            " state TEXT NOT NULL DEFAULT 'pending',"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt REAL NOT NULL,"
+            " enqueued_at REAL NOT NULL,"
+            " last_error TEXT)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS uploads_due_idx ON uploads (state, next_attempt)")
+        return db
+
+    def enqueue(self, data, object_name, content_type=None):
+        """
+        Grava a imagem no spool e agenda o envio.
+
+        Args:
+            data: Bytes do arquivo
+            object_name: Nome do objeto no Spaces
+            content_type: Content-Type do objeto (opcional)
+
+        Returns:
+            URL pública que o objeto terá depois do envio
+        """
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(self._data_dir, upload_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        with self._db_lock:
+            self._db.execute(
+                "INSERT INTO uploads (id, object_name, bucket, path, size, content_type, next_attempt, enqueued_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (upload_id, object_name, self.bucket, path, len(data), content_type, now, now),
+            )
+        with self._stats_lock:
+            self._enqueued += 1
+        self._ensure_started()
+        self._wakeup.set()
+        return object_url(object_name, self.bucket)
+
+    def _claim(self):
+        """Reserva o envio vencido mais antigo; None se não houver."""
+        now = time.time()
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id, object_name, bucket, path, size, content_type, attempts, enqueued_at FROM uploads"
+                    " WHERE state = 'pending' AND next_attempt <= ? ORDER BY next_attempt LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE uploads SET attempts = attempts + 1, next_attempt = ? WHERE id = ?",
+                        (now + self.lease, row[0]),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return row
+
+    def _upload(self, row):
+        upload_id, object_name, bucket, path, size, content_type, attempts, enqueued_at = row
+        extra_args = {"ACL": "public-read"}
+        if content_type:
+            extra_args["ContentType"] = content_type
+        with self._stats_lock:
+            self._in_flight += 1
+        try:
+            get_s3_client().upload_file(path, bucket, object_name, ExtraArgs=extra_args)
+        except Exception as e:
+            self._reschedule(upload_id, object_name, attempts + 1, e)
+            return False
+        finally:
+            with self._stats_lock:
+                self._in_flight -= 1
+
+        if self.on_uploaded is not None:
+            self.on_uploaded(object_name)
+        with self._db_lock:
+            self._db.execute("DELETE FROM uploads WHERE id = ?", (upload_id,))
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        lag = time.time() - enqueued_at
+        with self._stats_lock:
+            self._uploaded += 1
+            self._uploaded_bytes += size
+            self._lags.append(lag)
+            self._lag_max = max(self._lag_max, lag)
+        logger.info(f"Arquivo enviado para Spaces: {object_url(object_name, bucket)} ({lag:.2f}s após o spool)")
+        return True
+
+    def _reschedule(self, upload_id, object_name, attempts, error):
+        message = str(error)
+        if attempts >= self.max_attempts:
+            state, next_attempt = "failed", time.time()
+            logger.error(f"Upload de {object_name} desistido após {attempts} tentativas: {message}")
+        else:
+            delay = min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+            state, next_attempt = "pending", time.time() + delay * random.uniform(0.8, 1.2)
+            logger.warning(f"Erro ao enviar {object_name} para Spaces (tentativa {attempts}): {message}")
+        with self._db_lock:
+            self._db.execute(
+                "UPDATE uploads SET state = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+                (state, next_attempt, message, upload_id),
+            )
+        if state == "failed" and self.on_failed is not None:
+            self.on_failed(object_name)
+        with self._stats_lock:
+            self._last_error = message
+            if state == "failed":
+                self._failed += 1
+            else:
+                self._retries += 1
+
+    def process_due(self):
+        """
+        Envia um upload vencido, se houver, na thread atual.
+
+        Returns:
+            True/False para sucesso/falha do envio, None se a fila não tinha envio vencido
+        """
+        row = self._claim()
+        if row is None:
+            return None
+        return self._upload(row)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                if self.process_due() is not None:
+                    continue
+            except Exception as e:
+                logger.error(f"Erro na fila de uploads: {str(e)}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _ensure_started(self):
+        if self._threads or self._stopping.is_set():
+            return
+        with self._start_lock:
+            if not self._threads:
+                for number in range(self.concurrency):
+                    thread = threading.Thread(target=self._run, name=f"upload-spool-{number}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+
+    def start(self):
+        """Inicia as threads de envio (também retoma os envios pendentes de execuções anteriores)."""
+        self._ensure_started()
+        self._wakeup.set()
+
+    def queued(self, object_names):
+        """Subconjunto de `object_names` com envio na fila (pendente ou desistido)."""
+        object_names = list(object_names)
+        found = set()
+        with self._db_lock:
+            # Em blocos: o SQLite limita o número de parâmetros por consulta
+            for start in range(0, len(object_names), 500):
+                chunk = object_names[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                found.update(
+                    row[0] for row in self._db.execute(
+                        f"SELECT DISTINCT object_name FROM uploads WHERE object_name IN ({placeholders})", chunk
+                    )
+                )
+        return found
+
+    def retry_failed(self):
+        """Recoloca na fila os envios marcados como "failed"; devolve quantos."""
+        with self._db_lock:
+            cursor = self._db.execute(
+                "UPDATE uploads SET state = 'pending', attempts = 0, next_attempt = ? WHERE state = 'failed'",
+                (time.time(),),
+            )
+        self._wakeup.set()
+        return cursor.rowcount
+
+    def stats(self):
+        now = time.time()
+        with self._db_lock:
+            queued = {
+                state: (count, size or 0, oldest)
+                for state, count, size, oldest in self._db.execute(
+                    "SELECT state, COUNT(*), SUM(size), MIN(enqueued_at) FROM uploads GROUP BY state"
+                )
+            }
+        pending = queued.get("pending", (0, 0, None))
+        failed = queued.get("failed", (0, 0, None))
+        with self._stats_lock:
+            lags = sorted(self._lags)
+            return {
+                "directory": self.directory,
+                "concurrency": self.concurrency,
+                "pending": pending[0],
+                "failed": failed[0],
+                "spool_bytes": pending[1] + failed[1],
+                "oldest_pending_age_s": round(now - pending[2], 3) if pending[2] is not None else 0.0,
+                "in_flight": self._in_flight,
+                "enqueued": self._enqueued,
+                "uploaded": self._uploaded,
+                "uploaded_bytes": self._uploaded_bytes,
+                "retries": self._retries,
+                "gave_up": self._failed,
+                "upload_lag_s": {
+                    "p50": round(lags[len(lags) // 2], 3) if lags else 0.0,
+                    "p95": round(lags[int(len(lags) * 0.95)], 3) if lags else 0.0,
+                    "max": round(self._lag_max, 3),
+                },
+                "last_error": self._last_error,
+            }
+
+    def close(self, timeout=5.0):
+        """Para as threads; envios não concluídos continuam na fila para o próximo start."""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        with self._db_lock:
+            self._db.close()
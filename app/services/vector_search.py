@@ -0,0 +1,280 @@
+"""
+Busca de implantes similares no PostgreSQL/pgvector.
+
+Usa conexões do VectorSearchPool. O embedding é enviado como parâmetro
+binário pelo adaptador nativo do pgvector, direto do buffer float32 do NumPy,
+e a consulta é preparada no servidor (prepare=True) na primeira execução de
+cada conexão. Buscas em lote mandam todos os vetores em um único round trip.
+As opções de consulta dos índices (hnsw.ef_search, ivfflat.probes) são
+aplicadas por conexão antes da busca.
+
+Filtros de fabricante e tipo entram no SQL como literais, não como
+parâmetros: só assim o planner casa a consulta com os índices parciais por
+fabricante (ver app/db/vector_index.py), inclusive em planos genéricos de
+prepared statements. A lista de ids continua como parâmetro (id = ANY).
+
+Com model_version, a busca lê a coluna que guarda embeddings do modelo da
+API (`embedding` ou, durante uma troca de modelo, `embedding_next`). A
+coluna fica em cache, mas cada busca lê a vaga em embedding_versions no
+mesmo comando SQL (mesmo snapshot e mesmos nomes de coluna): se
+switch_version trocou as vagas, a busca percebe, resolve a coluna de novo
+e repete, sem nunca comparar vetores de modelos diferentes.
+"""
+
+import logging
+import threading
+import time
+
+import numpy as np
+from psycopg import sql
+
+from app.db.embedding_versions import VERSIONS_TABLE, embedding_slot
+from app.db.pool import apply_session_settings
+from app.db.vector_index import COLUMN
+
+logger = logging.getLogger("raiox-api")
+
+# A similaridade de cosseno é calculada só para as linhas do top-k (consulta externa)
+FIND_SIMILAR_TEMPLATE = """
+    SELECT id, name, manufacturer, type, image_url, distance, 1 - (embedding <=> %(q)s) AS similarity
+    FROM (
+        SELECT id, name, manufacturer, type, image_url, {column} AS embedding, {column} <-> %(q)s AS distance
+        FROM implants
+        {where}
+        ORDER BY {column} <-> %(q)s
+        LIMIT %(limit)s
+    ) top
+    ORDER BY distance
+"""
+
+# Contadores de escrita da tabela: mudam a cada INSERT/UPDATE/DELETE em implants
+CATALOG_VERSION_SQL = """
+    SELECT n_tup_ins, n_tup_upd, n_tup_del
+    FROM pg_stat_user_tables
+    WHERE relname = 'implants'
+"""
+
+# Um round trip para N consultas: cada vetor do array faz seu próprio top-k
+FIND_SIMILAR_BATCH_TEMPLATE = """
+    SELECT q.idx, i.id, i.name, i.manufacturer, i.type, i.image_url, i.distance,
+           1 - (i.embedding <=> q.embedding) AS similarity
+    FROM unnest(%(q)s::vector[]) WITH ORDINALITY AS q(embedding, idx)
+    CROSS JOIN LATERAL (
+        SELECT id, name, manufacturer, type, image_url, {column} AS embedding, {column} <-> q.embedding AS distance
+        FROM implants
+        {where}
+        ORDER BY {column} <-> q.embedding
+        LIMIT %(limit)s
+    ) i
+    ORDER BY q.idx, i.distance
+"""
+
+# Busca e modelo da vaga lidos no mesmo comando; a linha da vaga vem mesmo sem resultados
+VERSION_GUARD_TEMPLATE = """
+    SELECT v.model_version, r.*
+    FROM {versions} AS v
+    LEFT JOIN LATERAL ({search}) AS r ON true
+    WHERE v.slot = %(slot)s
+    ORDER BY {order}
+"""
+
+FIND_SIMILAR_SQL = FIND_SIMILAR_TEMPLATE.format(where="", column=COLUMN)
+FIND_SIMILAR_BATCH_SQL = FIND_SIMILAR_BATCH_TEMPLATE.format(where="", column=COLUMN)
+
+
+def build_search_query(template, filters, column=COLUMN):
+    """
+    Monta a consulta de busca com os filtros opcionais.
+
+    Args:
+        template: FIND_SIMILAR_TEMPLATE ou FIND_SIMILAR_BATCH_TEMPLATE
+        filters: Dict opcional com manufacturer, type e/ou ids
+        column: Coluna de embedding consultada (ver embedding_column)
+
+    Returns:
+        Tupla (consulta, parâmetros extras)
+    """
+    conditions = []
+    params = {}
+    for field in ("manufacturer", "type"):
+        if filters and filters.get(field) is not None:
+            conditions.append(sql.SQL("{} = {}").format(sql.Identifier(field), sql.Literal(filters[field])))
+    if filters and filters.get("ids") is not None:
+        conditions.append(sql.SQL("id = ANY(%(ids)s)"))
+        params["ids"] = [int(i) for i in filters["ids"]]
+    if not conditions:
+        return template.format(where="", column=column), params
+    where = sql.SQL("WHERE ") + sql.SQL(" AND ").join(conditions)
+    return sql.SQL(template).format(where=where, column=sql.Identifier(column)), params
+
+
+def row_to_implant(row):
+    """
+    Converte uma linha (id, name, manufacturer, type, image_url, distance, similarity)
+    no dict da API.
+    """
+    return {
+        "id": row[0],
+        "name": row[1],
+        "manufacturer": row[2],
+        "type": row[3],
+        "image_url": row[4],
+        "distance": float(row[5]),
+        "similarity": float(row[6]),
+    }
+
+
+def as_query_vector(query_vector):
+    """Garante um np.ndarray float32 contíguo, sem cópia quando já está no formato."""
+    return np.ascontiguousarray(query_vector, dtype=np.float32).reshape(-1)
+
+
+class PgVectorSearch:
+    """
+    Backend de busca que consulta o pgvector através do pool.
+
+    Args:
+        pool: VectorSearchPool
+        session_settings: Parâmetros de sessão por consulta, ex. {"hnsw.ef_search": 40}
+        model_version: Modelo que gera os embeddings de consulta; a busca lê a
+            coluna com embeddings desse modelo (leitura dupla durante a troca,
+            ver app/db/embedding_versions.py). None = sempre `embedding`
+        version_interval: Intervalo mínimo (s) entre verificações das versões
+            em catálogos sem embedding_versions
+    """
+
+    name = "pgvector"
+
+    def __init__(self, pool, session_settings=None, model_version=None, version_interval=5.0):
+        self.pool = pool
+        self.session_settings = dict(session_settings or {})
+        self.model_version = model_version
+        self.version_interval = float(version_interval)
+        self._lock = threading.Lock()
+        self._searches = 0
+        self._search_total = 0.0
+        self._column = COLUMN
+        self._slot = None
+        self._column_checked = None
+
+    def _embedding_slot(self, conn, refresh=False):
+        """
+        Coluna e vaga do modelo das consultas, em cache.
+
+        Com vaga, o cache vale até uma busca detectar a troca (ver _execute);
+        sem embedding_versions, é verificado de novo a cada version_interval.
+        """
+        if self.model_version is None:
+            return COLUMN, None
+        now = time.monotonic()
+        with self._lock:
+            if not refresh and self._column_checked is not None and (
+                self._slot is not None or now - self._column_checked < self.version_interval
+            ):
+                return self._column, self._slot
+        column, slot = embedding_slot(conn, self.model_version)
+        with self._lock:
+            if column != self._column:
+                logger.info(f"Busca de {self.model_version} passa a ler implants.{column}")
+            self._column = column
+            self._slot = slot
+            self._column_checked = now
+        return column, slot
+
+    def _execute(self, conn, template, order, filters, params):
+        """Executa a busca na coluna do modelo, conferindo a vaga no mesmo comando."""
+        for attempt in range(2):
+            column, slot = self._embedding_slot(conn, refresh=attempt > 0)
+            query, query_params = build_search_query(template, filters, column)
+            query_params.update(params)
+            apply_session_settings(conn, self.session_settings)
+            if slot is None:
+                return conn.execute(query, query_params, prepare=True, binary=True).fetchall()
+            guarded = sql.SQL(VERSION_GUARD_TEMPLATE).format(
+                versions=sql.Identifier(VERSIONS_TABLE),
+                search=query if isinstance(query, sql.Composable) else sql.SQL(query),
+                order=sql.SQL(order),
+            )
+            query_params["slot"] = slot
+            rows = conn.execute(guarded, query_params, prepare=True, binary=True).fetchall()
+            if rows and rows[0][0] == self.model_version:
+                return [row[1:] for row in rows if row[1] is not None]
+            logger.info(f"Vagas de embedding trocadas durante a busca de {self.model_version}: coluna resolvida de novo")
+        raise RuntimeError(f"Vaga de embeddings de {self.model_version} mudou durante a busca")
+
+    def _record(self, queries, elapsed):
+        with self._lock:
+            self._searches += queries
+            self._search_total += elapsed
+
+    def search(self, query_vector, limit=3, filters=None):
+        """
+        Retorna os `limit` implantes mais próximos (distância L2) do vetor.
+
+        Args:
+            query_vector: Embedding da consulta (np.ndarray)
+            limit: Quantidade de resultados
+            filters: Dict opcional com manufacturer, type e/ou ids
+
+        Returns:
+            Lista de dicts no formato do ImplantSchema
+        """
+        started = time.perf_counter()
+        with self.pool.connection() as conn:
+            rows = self._execute(
+                conn, FIND_SIMILAR_TEMPLATE, "r.distance", filters, {"q": as_query_vector(query_vector), "limit": limit}
+            )
+        self._record(1, time.perf_counter() - started)
+        return [row_to_implant(row) for row in rows]
+
+    def search_many(self, query_vectors, limit=3, filters=None):
+        """
+        Executa várias buscas top-k em uma única consulta.
+
+        Args:
+            query_vectors: Sequência de embeddings ou matriz (N, D)
+            limit: Quantidade de resultados por consulta
+            filters: Dict opcional com manufacturer, type e/ou ids (vale para todas)
+
+        Returns:
+            Lista com uma lista de dicts por vetor, na ordem de entrada
+        """
+        vectors = [as_query_vector(vector) for vector in query_vectors]
+        if not vectors:
+            return []
+        started = time.perf_counter()
+        with self.pool.connection() as conn:
+            rows = self._execute(
+                conn, FIND_SIMILAR_BATCH_TEMPLATE, "r.idx, r.distance", filters, {"q": vectors, "limit": limit}
+            )
+        self._record(len(vectors), time.perf_counter() - started)
+
+        results = [[] for _ in vectors]
+        for row in rows:
+            results[row[0] - 1].append(row_to_implant(row[1:]))
+        return results
+
+    def catalog_version(self):
+        """
+        Identifica o estado da tabela implants pelos contadores de escrita e
+        pela coluna de embedding lida.
+
+        As estatísticas do PostgreSQL são publicadas com alguns instantes de
+        atraso após o commit; serve para invalidar caches, não para consistência.
+        """
+        with self.pool.connection() as conn:
+            column = self._embedding_slot(conn, refresh=True)[0]
+            row = conn.execute(CATALOG_VERSION_SQL).fetchone()
+        return ":".join([column] + [str(value) for value in row]) if row else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.name,
+                "searches": self._searches,
+                "avg_ms": (self._search_total / self._searches * 1000.0) if self._searches else 0.0,
+                "session_settings": self.session_settings,
+                "model_version": self.model_version,
+                "embedding_column": self._column,
+                "pool": self.pool.stats(),
+            }
@@ -0,0 +1,49 @@
+"""
+Servidor de um shard do catálogo para a busca distribuída.
+
+Processo leve, sem o modelo CLIP: só recebe vetores já calculados pela API
+e responde com o top-k do seu pedaço do catálogo. Iniciado por
+scripts/servir_shard.py (HTTP local ou socket Unix).
+"""
+
+import logging
+import time
+
+from fastapi import FastAPI
+
+from app.schemas import ShardSearchRequest, ShardSearchResponse
+from app.services.sharded_search import decode_vectors
+
+logger = logging.getLogger("raiox-api")
+
+
+def create_shard_app(search, name, delay=0.0):
+    """
+    Cria o app FastAPI de um shard.
+
+    Args:
+        search: Backend em processo sobre o catálogo do shard
+        name: Nome do shard nas respostas
+        delay: Atraso artificial (s) por busca, para testar o prazo do coordenador
+    """
+    app = FastAPI(title=f"Raiox shard {name}")
+
+    @app.get("/healthcheck")
+    def healthcheck():
+        return {"status": "ok", "shard": name, "catalog_version": search.catalog_version()}
+
+    @app.get("/metrics")
+    def metrics():
+        return search.stats()
+
+    @app.post("/search", response_model=ShardSearchResponse)
+    def shard_search(request: ShardSearchRequest):
+        # Endpoint síncrono: o FastAPI roda a busca NumPy no threadpool
+        started = time.perf_counter()
+        if delay:
+            time.sleep(delay)
+        vectors = decode_vectors(request.vectors, request.dimension)
+        results = search.search_many(vectors, limit=request.limit, filters=request.filters)
+        return {"shard": name, "results": results, "elapsed_ms": (time.perf_counter() - started) * 1000.0}
+
+    return app
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Ajusta a projeção PCA do catálogo para a busca em dois estágios.
+
+Grava, no diretório do catálogo (CATALOG_EXPORT_DIR), a média e os
+componentes principais, a matriz projetada e o pca.json com a versão da
+exportação de origem. Os workers com VECTOR_SEARCH_BACKEND=pca recarregam
+sozinhos. Rode de novo após cada exportação do catálogo.
+
+Uso:
+    python scripts/ajustar_projecao_pca.py
+    python scripts/ajustar_projecao_pca.py --componentes 64
+    python scripts/ajustar_projecao_pca.py --relatorio --dimensoes 64,128 --candidatos 50,100,200,400
+
+Com --relatorio, cada combinação de dimensões e candidatos é ajustada em um
+diretório temporário (sem tocar na projeção em uso) e comparada com a busca
+exata em 512-d: memória da matriz consultada, latência p50/p95 e
+concordância do top-k (lista idêntica e recall@k).
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.core import config
+from app.services.exact_search import CATALOG_FILES, EMBEDDINGS_FILE, MmapExactSearch
+from app.services.reduced_search import TwoStageSearch, write_projection
+
+
+def resumo(tempos_ms):
+    tempos = np.asarray(tempos_ms)
+    return {
+        "p50_ms": round(float(np.percentile(tempos, 50)), 3),
+        "p95_ms": round(float(np.percentile(tempos, 95)), 3),
+    }
+
+
+def consultas_de_teste(diretorio, quantidade):
+    """Linhas do catálogo com ruído leve, como nas demais verificações."""
+    embeddings = np.load(os.path.join(diretorio, EMBEDDINGS_FILE), mmap_mode="r")
+    rng = np.random.default_rng(0)
+    indices = rng.choice(embeddings.shape[0], size=min(quantidade, embeddings.shape[0]), replace=False)
+    ruido = rng.normal(0, 0.01, (len(indices), embeddings.shape[1])).astype(np.float32)
+    return np.asarray(embeddings[np.sort(indices)]) + ruido
+
+
+def medir(busca, consultas, limite):
+    tempos, ids = [], []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        resultado = busca.search(consulta, limit=limite)
+        tempos.append((time.perf_counter() - inicio) * 1000.0)
+        ids.append([item["id"] for item in resultado])
+    return ids, tempos
+
+
+def relatorio(diretorio, dimensoes, candidatos, quantidade, limite):
+    consultas = consultas_de_teste(diretorio, quantidade)
+    exata = MmapExactSearch(diretorio)
+    exata.load()
+    ids_exatos, tempos_exatos = medir(exata, consultas, limite)
+    embeddings = np.load(os.path.join(diretorio, EMBEDDINGS_FILE), mmap_mode="r")
+    linhas, dimensao = embeddings.shape
+
+    saida = {
+        "implantes": int(linhas),
+        "exata": dict(resumo(tempos_exatos), matriz_mb=round(linhas * dimensao * 4 / 2**20, 2)),
+    }
+    temporario = tempfile.mkdtemp(prefix="pca-")
+    try:
+        # O catálogo é ligado por symlink; só a projeção é gravada no temporário
+        for nome in CATALOG_FILES:
+            if os.path.exists(os.path.join(diretorio, nome)):
+                os.symlink(os.path.abspath(os.path.join(diretorio, nome)), os.path.join(temporario, nome))
+        for componentes in dimensoes:
+            info = write_projection(temporario, componentes)
+            for quantos in candidatos:
+                busca = TwoStageSearch(temporario, candidates=quantos)
+                busca.load()
+                ids, tempos = medir(busca, consultas, limite)
+                acertos = sum(len(set(a) & set(b)) for a, b in zip(ids, ids_exatos))
+                saida[f"pca{componentes}/candidatos={quantos}"] = dict(
+                    resumo(tempos),
+                    matriz_mb=round(linhas * componentes * 4 / 2**20, 2),
+                    variancia_explicada=info["explained_variance"],
+                    top_k_identico=round(sum(a == b for a, b in zip(ids, ids_exatos)) / len(ids), 4),
+                    **{f"recall@{limite}": round(acertos / (limite * len(ids)), 4)},
+                )
+    finally:
+        shutil.rmtree(temporario)
+    return saida
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ajusta a projeção PCA da busca em dois estágios")
+    parser.add_argument("--catalogo", default=config.CATALOG_EXPORT_DIR, help="Diretório do catálogo")
+    parser.add_argument("--componentes", type=int, default=config.PCA_COMPONENTS)
+    parser.add_argument("--relatorio", action="store_true", help="Memória e latência vs concordância do top-k")
+    parser.add_argument("--dimensoes", default="64,128", help="Dimensões avaliadas no relatório")
+    parser.add_argument("--candidatos", default="50,100,200,400", help="Candidatos avaliados no relatório")
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--limite", type=int, default=3, help="k do top-k")
+    args = parser.parse_args()
+
+    if args.relatorio:
+        dimensoes = [int(valor) for valor in args.dimensoes.split(",") if valor]
+        candidatos = [int(valor) for valor in args.candidatos.split(",") if valor]
+        saida = relatorio(args.catalogo, dimensoes, candidatos, args.consultas, args.limite)
+    else:
+        saida = write_projection(args.catalogo, args.componentes)
+        print(f"✅ Projeção PCA gravada em {args.catalogo}", file=sys.stderr)
+    print(json.dumps(saida, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Benchmark da busca filtrada (fabricante, tipo, lista de ids) por seletividade.
+
+Para cada cenário de filtro mede, em cada backend disponível:
+- latência p50/p95 da busca top-k;
+- recall@k contra a busca exata com o mesmo filtro (quando há catálogo
+  exportado) e quantas consultas voltaram com menos de k resultados.
+
+Cenários: sem filtro, um fabricante, fabricante + tipo e listas de ids de
+tamanhos decrescentes. A seletividade é a fração do catálogo que passa no
+filtro.
+
+Uso:
+    python scripts/benchmark_busca_filtrada.py
+    python scripts/benchmark_busca_filtrada.py --consultas 200 --backends pgvector,exact
+
+Rode com e sem os índices de filtro (gerenciar_indice_pgvector.py
+criar-filtros) para comparar o pgvector.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.core import config
+from app.db.pool import VectorSearchPool
+from app.services.exact_search import embedding_to_numpy
+from app.services.search_backends import create_search_backend, search_filters
+
+
+def resumo(tempos_ms):
+    tempos = np.asarray(tempos_ms)
+    return {
+        "p50_ms": round(float(np.percentile(tempos, 50)), 3),
+        "p95_ms": round(float(np.percentile(tempos, 95)), 3),
+    }
+
+
+def cenarios(conn, rng):
+    """Filtros de seletividade decrescente, a partir do catálogo real."""
+    fabricante, tipo = conn.execute(
+        """
+        SELECT manufacturer, type FROM implants
+        WHERE embedding IS NOT NULL AND manufacturer IS NOT NULL AND type IS NOT NULL
+        GROUP BY manufacturer, type
+        ORDER BY count(*) DESC
+        LIMIT 1
+        """
+    ).fetchone()
+    ids = [row[0] for row in conn.execute("SELECT id FROM implants WHERE embedding IS NOT NULL").fetchall()]
+    lista = {
+        "sem_filtro": None,
+        f"fabricante={fabricante}": search_filters(manufacturer=fabricante),
+        f"fabricante={fabricante},tipo={tipo}": search_filters(manufacturer=fabricante, type=tipo),
+    }
+    for tamanho in (1000, 100, 10):
+        if tamanho < len(ids):
+            lista[f"ids[{tamanho}]"] = search_filters(ids=rng.choice(ids, size=tamanho, replace=False).tolist())
+    return lista, len(ids)
+
+
+def linhas_no_filtro(conn, filtros):
+    condicoes, parametros = ["embedding IS NOT NULL"], []
+    for campo in ("manufacturer", "type"):
+        if filtros and filtros.get(campo):
+            condicoes.append(f"{campo} = %s")
+            parametros.append(filtros[campo])
+    if filtros and filtros.get("ids") is not None:
+        condicoes.append("id = ANY(%s)")
+        parametros.append(filtros["ids"])
+    return conn.execute(f"SELECT count(*) FROM implants WHERE {' AND '.join(condicoes)}", parametros).fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da busca filtrada por seletividade")
+    parser.add_argument("--consultas", type=int, default=100)
+    parser.add_argument("--limite", type=int, default=3, help="k do top-k")
+    parser.add_argument("--backends", default="pgvector,exact,hnsw")
+    args = parser.parse_args()
+
+    pool = VectorSearchPool(
+        minconn=1,
+        maxconn=2,
+        host=config.VECTOR_DB_HOST,
+        port=config.VECTOR_DB_PORT,
+        dbname=config.VECTOR_DB_NAME,
+        user=config.VECTOR_DB_USER,
+        password=config.VECTOR_DB_PASSWORD,
+    )
+    rng = np.random.default_rng(0)
+    with pool.connection() as conn:
+        lista, total = cenarios(conn, rng)
+        linhas = {nome: linhas_no_filtro(conn, filtros) for nome, filtros in lista.items()}
+        amostra = conn.execute(
+            "SELECT embedding FROM implants WHERE embedding IS NOT NULL ORDER BY random() LIMIT %s",
+            (args.consultas,),
+            binary=True,
+        ).fetchall()
+    # Ruído leve para a consulta não coincidir exatamente com uma linha do catálogo
+    consultas = [embedding_to_numpy(embedding) for (embedding,) in amostra]
+    consultas = [c + rng.normal(0, 0.01, c.shape[0]).astype(np.float32) for c in consultas]
+
+    backends = {}
+    for nome in args.backends.split(","):
+        busca = create_search_backend(
+            nome,
+            pool,
+            catalog_dir=config.CATALOG_EXPORT_DIR,
+            hnsw_index_path=config.HNSW_INDEX_PATH,
+            hnsw_ef_search=config.HNSW_EF_SEARCH,
+            pg_session_settings=config.PGVECTOR_SESSION_SETTINGS,
+        )
+        try:
+            busca.search(consultas[0], limit=args.limite)
+        except Exception as e:
+            print(f"⚠️  Backend {nome} indisponível: {e}", file=sys.stderr)
+            continue
+        backends[nome] = busca
+
+    relatorio = {"implantes": total, "cenarios": {}}
+    for cenario, filtros in lista.items():
+        linha = {"seletividade": round(linhas[cenario] / total, 4)}
+        esperado = min(args.limite, linhas[cenario])
+        resultados = {}
+        for nome, busca in backends.items():
+            tempos, ids = [], []
+            for consulta in consultas:
+                inicio = time.perf_counter()
+                encontrados = busca.search(consulta, limit=args.limite, filters=filtros)
+                tempos.append((time.perf_counter() - inicio) * 1000.0)
+                ids.append([item["id"] for item in encontrados])
+            resultados[nome] = ids
+            linha[nome] = resumo(tempos)
+            linha[nome]["incompletas"] = sum(1 for item in ids if len(item) < esperado)
+        # Recall contra a busca exata com o mesmo filtro
+        if "exact" in resultados:
+            for nome, ids in resultados.items():
+                acertos = sum(len(set(a) & set(b)) for a, b in zip(ids, resultados["exact"]))
+                possiveis = sum(len(b) for b in resultados["exact"]) or 1
+                linha[nome][f"recall@{args.limite}"] = round(acertos / possiveis, 4)
+        relatorio["cenarios"][cenario] = linha
+
+    pool.close()
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark da serialização de embeddings e do tempo de consulta no pgvector.
+
+Compara:
+- caminho texto (antigo): "[" + ",".join(map(str, v.tolist())) + "]" com %s::vector;
+- caminho binário (atual): adaptador nativo do pgvector, float32 em binário;
+- N buscas separadas vs. uma busca em lote (unnest + LATERAL, um round trip).
+
+Uso:
+    python scripts/benchmark_busca_vetorial.py
+    python scripts/benchmark_busca_vetorial.py --consultas 200 --lote 16
+
+A conexão usa as mesmas variáveis DB_* da API (ver app/core/config.py).
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from pgvector import Vector
+
+from app.core import config
+from app.db.pool import VectorSearchPool
+from app.services.vector_search import FIND_SIMILAR_SQL, PgVectorSearch
+
+FIND_SIMILAR_TEXT_SQL = """
+    SELECT id, name, manufacturer, image_url
+    FROM implants
+    ORDER BY embedding <-> %s::vector
+    LIMIT %s
+"""
+
+
+def vetor_texto(vetor):
+    return "[" + ",".join(map(str, vetor.tolist())) + "]"
+
+
+def resumo(tempos_ms):
+    tempos = np.asarray(tempos_ms)
+    return {
+        "p50_ms": round(float(np.percentile(tempos, 50)), 3),
+        "p95_ms": round(float(np.percentile(tempos, 95)), 3),
+        "media_ms": round(float(tempos.mean()), 3),
+    }
+
+
+def cronometrar(funcao, argumentos):
+    tempos = []
+    for argumento in argumentos:
+        inicio = time.perf_counter()
+        funcao(argumento)
+        tempos.append((time.perf_counter() - inicio) * 1000.0)
+    return tempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark texto vs binário na busca pgvector")
+    parser.add_argument("--consultas", type=int, default=100)
+    parser.add_argument("--lote", type=int, default=8, help="Vetores por busca em lote")
+    parser.add_argument("--limite", type=int, default=3, help="k do top-k")
+    parser.add_argument("--dimensao", type=int, default=512)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vetores = rng.normal(size=(args.consultas, args.dimensao)).astype(np.float32)
+
+    relatorio = {
+        "serializacao": {
+            "texto": resumo(cronometrar(vetor_texto, vetores)),
+            "binario": resumo(cronometrar(lambda v: Vector(v).to_binary(), vetores)),
+            "bytes_texto": len(vetor_texto(vetores[0]).encode()),
+            "bytes_binario": len(Vector(vetores[0]).to_binary()),
+        }
+    }
+
+    pool = VectorSearchPool(
+        minconn=1,
+        maxconn=1,
+        host=config.VECTOR_DB_HOST,
+        port=config.VECTOR_DB_PORT,
+        dbname=config.VECTOR_DB_NAME,
+        user=config.VECTOR_DB_USER,
+        password=config.VECTOR_DB_PASSWORD,
+    )
+    busca = PgVectorSearch(pool)
+
+    def consulta_texto(vetor):
+        with pool.connection() as conn:
+            conn.execute(FIND_SIMILAR_TEXT_SQL, (vetor_texto(vetor), args.limite), prepare=True).fetchall()
+
+    def consulta_binaria(vetor):
+        busca.search(vetor, limit=args.limite)
+
+    # Aquecimento: conexão, registro do tipo vector e prepared statements
+    consulta_texto(vetores[0])
+    consulta_binaria(vetores[0])
+
+    relatorio["consulta"] = {
+        "texto": resumo(cronometrar(consulta_texto, vetores)),
+        "binario": resumo(cronometrar(consulta_binaria, vetores)),
+    }
+
+    lotes = [vetores[i:i + args.lote] for i in range(0, len(vetores) - args.lote + 1, args.lote)]
+    relatorio["lote"] = {
+        "vetores_por_lote": args.lote,
+        "buscas_separadas": resumo(cronometrar(lambda lote: [consulta_binaria(v) for v in lote], lotes)),
+        "uma_consulta": resumo(cronometrar(lambda lote: busca.search_many(lote, limit=args.limite), lotes)),
+    }
+
+    # Os dois caminhos precisam devolver o mesmo ranking
+    with pool.connection() as conn:
+        texto = [row[0] for row in conn.execute(
+            FIND_SIMILAR_TEXT_SQL, (vetor_texto(vetores[0]), args.limite)).fetchall()]
+        binario = [row[0] for row in conn.execute(
+            FIND_SIMILAR_SQL, {"q": vetores[0], "limit": args.limite}, binary=True).fetchall()]
+    relatorio["mesmo_resultado"] = texto == binario
+
+    pool.close()
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Benchmark do cold start de um worker com o catálogo em memória.
+
+Compara, cada repetição num processo novo, o tempo até o worker responder
+a primeira busca:
+
+    banco_cursor  catálogo lido do PostgreSQL linha a linha (cursor de servidor)
+    banco_copy    catálogo lido do PostgreSQL com COPY binário
+    snapshot      snapshot local aberto com mmap (MmapExactSearch.load)
+
+Antes de cada medição do snapshot, as páginas dos arquivos são retiradas
+do page cache (posix_fadvise DONTNEED), como num worker recém-criado; use
+--cache-quente para medir com o cache aquecido. O cache do PostgreSQL não
+é controlado aqui.
+
+Uso:
+    python scripts/benchmark_inicializacao_catalogo.py
+    python scripts/benchmark_inicializacao_catalogo.py --diretorio /tmp/catalogo --repeticoes 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.core import config
+from app.services.exact_search import CATALOG_FILES, METADATA_FIELDS, MmapExactSearch, build_subindexes, embedding_to_numpy
+
+MODOS = ("banco_cursor", "banco_copy", "snapshot")
+
+CATALOG_SQL = """
+    SELECT id, name, manufacturer, type, image_url, embedding
+    FROM implants
+    WHERE embedding IS NOT NULL
+    ORDER BY manufacturer, type, id
+"""
+
+
+def conectar():
+    import psycopg
+    from pgvector.psycopg import register_vector
+
+    conn = psycopg.connect(
+        host=config.VECTOR_DB_HOST,
+        port=config.VECTOR_DB_PORT,
+        dbname=config.VECTOR_DB_NAME,
+        user=config.VECTOR_DB_USER,
+        password=config.VECTOR_DB_PASSWORD,
+    )
+    register_vector(conn)
+    return conn
+
+
+def ler_do_banco(modo):
+    """Linhas do catálogo, como um worker que carregasse direto do banco."""
+    with conectar() as conn:
+        if modo == "banco_cursor":
+            with conn.cursor(name="benchmark_inicializacao", binary=True) as cur:
+                cur.itersize = 2000
+                cur.execute(CATALOG_SQL)
+                return list(cur)
+        with conn.cursor() as cur:
+            with cur.copy(f"COPY ({CATALOG_SQL}) TO STDOUT WITH (FORMAT BINARY)") as copy:
+                copy.set_types(["int4", "text", "text", "text", "text", "vector"])
+                return list(copy.rows())
+
+
+def medir(modo, diretorio):
+    """Executado no processo filho: segundos até a primeira busca respondida."""
+    consulta = np.random.default_rng(0).standard_normal(512).astype(np.float32)
+    inicio = time.perf_counter()
+    if modo == "snapshot":
+        busca = MmapExactSearch(diretorio)
+        busca.load()
+        busca.search(consulta, limit=3)
+        implantes = busca.size
+    else:
+        linhas = ler_do_banco(modo)
+        implants = [dict(zip(METADATA_FIELDS, linha[:5])) for linha in linhas]
+        embeddings = np.ascontiguousarray(np.stack([embedding_to_numpy(linha[5]) for linha in linhas]))
+        build_subindexes(implants)
+        distancias = np.linalg.norm(embeddings - consulta, axis=1)
+        np.argpartition(distancias, 2)[:3]
+        implantes = len(implants)
+    return {"segundos": time.perf_counter() - inicio, "implantes": implantes}
+
+
+def esfriar(diretorio):
+    """Retira os arquivos do snapshot do page cache."""
+    for nome in CATALOG_FILES:
+        caminho = os.path.join(diretorio, nome)
+        if not os.path.exists(caminho):
+            continue
+        fd = os.open(caminho, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def resumo(valores):
+    return {
+        "mediana_ms": round(statistics.median(valores) * 1000.0, 1),
+        "min_ms": round(min(valores) * 1000.0, 1),
+        "max_ms": round(max(valores) * 1000.0, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do cold start do catálogo em memória")
+    parser.add_argument("--diretorio", default=config.CATALOG_EXPORT_DIR, help="Diretório do snapshot")
+    parser.add_argument("--repeticoes", type=int, default=5, help="Processos por modo")
+    parser.add_argument("--modos", nargs="+", default=list(MODOS), choices=MODOS, help="Modos medidos")
+    parser.add_argument("--cache-quente", action="store_true", help="Não retira o snapshot do page cache")
+    parser.add_argument("--medir", choices=MODOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.medir:
+        print(json.dumps(medir(args.medir, args.diretorio)))
+        return 0
+
+    saida = {
+        "snapshot_mb": round(
+            sum(
+                os.path.getsize(os.path.join(args.diretorio, nome))
+                for nome in CATALOG_FILES
+                if os.path.exists(os.path.join(args.diretorio, nome))
+            ) / 2**20,
+            2,
+        ),
+        "cache_quente": args.cache_quente,
+    }
+    for modo in args.modos:
+        prontos, processos = [], []
+        for _ in range(args.repeticoes):
+            if modo == "snapshot" and not args.cache_quente:
+                esfriar(args.diretorio)
+            inicio = time.perf_counter()
+            resultado = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--medir", modo, "--diretorio", args.diretorio],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            processos.append(time.perf_counter() - inicio)
+            medida = json.loads(resultado.stdout.strip().splitlines()[-1])
+            prontos.append(medida["segundos"])
+            saida["implantes"] = medida["implantes"]
+        # pronto: da carga à primeira busca; processo: inclui interpretador e imports
+        saida[modo] = {"pronto": resumo(prontos), "processo": resumo(processos)}
+    print(json.dumps(saida, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
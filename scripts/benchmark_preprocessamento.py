@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark do pré-processamento de radiografias.
+
+Compara o caminho antigo (Image.open em resolução total + transformação do
+open_clip) com o RadiographPreprocessor (draft JPEG, recorte central,
+16 bits, normalização zero-copy).
+
+Uso:
+    python scripts/benchmark_preprocessamento.py
+    python scripts/benchmark_preprocessamento.py --imagens /opt/raiox-app/fixtures --repeticoes 20
+
+Sem --imagens, gera radiografias sintéticas no tamanho de uma panorâmica
+(JPEG em tons de cinza, JPEG RGB, PNG 8 bits e PNG 16 bits).
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from app.services.preprocessing import RadiographPreprocessor, TransformPreprocessor
+
+EXTENSOES_IMAGEM = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+
+
+def radiografias_sinteticas(largura=2976, altura=1536):
+    """Gera bytes de radiografias sintéticas em formatos comuns."""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:altura, 0:largura]
+    base = 127 + 60 * np.sin(x / 90.0) * np.cos(y / 70.0) + rng.normal(0, 6, x.shape)
+    cinza = Image.fromarray(base.clip(0, 255).astype(np.uint8), mode="L")
+
+    def salvar(imagem, formato, **kwargs):
+        buffer = io.BytesIO()
+        imagem.save(buffer, format=formato, **kwargs)
+        return buffer.getvalue()
+
+    return {
+        "panoramica_jpeg_L": salvar(cinza, "JPEG", quality=90),
+        "panoramica_jpeg_RGB": salvar(cinza.convert("RGB"), "JPEG", quality=90),
+        "panoramica_png_8bits": salvar(cinza, "PNG"),
+        "panoramica_png_16bits": salvar(
+            Image.fromarray((base.clip(0, 255) * 16).astype(np.uint16)), "PNG"
+        ),
+    }
+
+
+def carregar_imagens(pasta):
+    imagens = {}
+    for nome in sorted(os.listdir(pasta)):
+        if nome.lower().endswith(EXTENSOES_IMAGEM):
+            with open(os.path.join(pasta, nome), "rb") as f:
+                imagens[nome] = f.read()
+    return imagens
+
+
+def cronometrar(funcao, dados, repeticoes):
+    funcao(dados)
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao(dados)
+        tempos.append((time.perf_counter() - inicio) * 1000.0)
+    return float(np.median(tempos)), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do pré-processamento de radiografias")
+    parser.add_argument("--imagens", help="Pasta com radiografias reais")
+    parser.add_argument("--repeticoes", type=int, default=10)
+    parser.add_argument("--tamanho", type=int, default=224, help="Lado da entrada do modelo")
+    args = parser.parse_args()
+
+    import open_clip
+
+    antigo = TransformPreprocessor(open_clip.image_transform(args.tamanho, is_train=False))
+    novo = RadiographPreprocessor(image_size=args.tamanho)
+
+    imagens = carregar_imagens(args.imagens) if args.imagens else radiografias_sinteticas()
+    relatorio = []
+    for nome, dados in imagens.items():
+        with Image.open(io.BytesIO(dados)) as imagem:
+            descricao = f"{imagem.format} {imagem.mode} {imagem.size[0]}x{imagem.size[1]}"
+        ms_antigo, tensor_antigo = cronometrar(antigo, dados, args.repeticoes)
+        ms_novo, tensor_novo = cronometrar(novo, dados, args.repeticoes)
+        a = tensor_antigo.numpy().ravel()
+        b = tensor_novo.numpy().ravel()
+        cosseno = float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+        relatorio.append({
+            "imagem": nome,
+            "formato": descricao,
+            "antigo_ms": round(ms_antigo, 2),
+            "novo_ms": round(ms_novo, 2),
+            "speedup": round(ms_antigo / ms_novo, 2) if ms_novo else None,
+            "cosseno_tensores": round(cosseno, 4),
+        })
+
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+    print(
+        "ℹ️  Em PNGs de 16 bits o cosseno baixo é esperado: o caminho antigo satura "
+        "os valores acima de 255, o novo estica a faixa dinâmica para 8 bits."
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Benchmark do modo quantizado (INT8 dinâmico) contra o modelo fp32 em CPU.
+
+Mede, em um conjunto local de radiografias:
+- latência do encoder (lote de 1 e lote de N), p50/p95;
+- memória: RSS do processo após carregar cada modelo e tamanho dos pesos;
+- qualidade: concordância do top-3 entre fp32 e INT8 na busca por similaridade.
+  Como em produção (EMBEDDING_MODEL_VERSION não inclui a quantização), as
+  consultas INT8 são comparadas ao catálogo fp32; essa é a medida que decide
+  (--min-concordancia). INT8 contra um catálogo INT8 sai só como referência.
+
+Uso:
+    python scripts/benchmark_quantizacao.py --catalogo /opt/raiox-app/fixtures/catalogo
+    python scripts/benchmark_quantizacao.py --catalogo fixtures/catalogo --consultas fixtures/consultas
+
+Sem --consultas, cada imagem do catálogo é usada como consulta contra as
+demais (leave-one-out). Sai com código 1 se a concordância média do top-3
+ficar abaixo de --min-concordancia.
+"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+
+# O benchmark é sobre CPU, mesmo em máquinas com GPU
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import config
+from app.services.encoder_backends import EagerBackend
+from app.services.model_loader import ClipModelLoader
+from app.services.quantization import quantize_image_encoder, serialized_size
+
+EXTENSOES_IMAGEM = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+
+
+def rss_mb():
+    """RSS atual do processo em MB (Linux)."""
+    with open("/proc/self/status") as f:
+        for linha in f:
+            if linha.startswith("VmRSS:"):
+                return int(linha.split()[1]) / 1024.0
+    return 0.0
+
+
+def listar_imagens(pasta):
+    return [
+        os.path.join(pasta, nome)
+        for nome in sorted(os.listdir(pasta))
+        if nome.lower().endswith(EXTENSOES_IMAGEM)
+    ]
+
+
+def preprocessar(preprocess, caminhos):
+    import torch
+    from PIL import Image
+
+    return torch.stack([preprocess(Image.open(caminho)) for caminho in caminhos])
+
+
+def medir_latencia(backend, tensores, tamanho_lote, repeticoes):
+    """Tempos (ms) por chamada de encode com lotes de `tamanho_lote`."""
+    import numpy as np
+
+    lote = tensores[:tamanho_lote]
+    if lote.shape[0] < tamanho_lote:
+        repetir = (tamanho_lote + lote.shape[0] - 1) // lote.shape[0]
+        lote = lote.repeat(repetir, 1, 1, 1)[:tamanho_lote]
+    backend.encode(lote)
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        backend.encode(lote)
+        tempos.append((time.perf_counter() - inicio) * 1000.0)
+    tempos = np.array(tempos)
+    return {
+        "lote": tamanho_lote,
+        "p50_ms": round(float(np.percentile(tempos, 50)), 2),
+        "p95_ms": round(float(np.percentile(tempos, 95)), 2),
+        "ms_por_imagem": round(float(np.median(tempos)) / tamanho_lote, 2),
+    }
+
+
+def embeddings_normalizados(backend, tensores, tamanho_lote=16):
+    import numpy as np
+
+    partes = [backend.encode(tensores[i:i + tamanho_lote]) for i in range(0, len(tensores), tamanho_lote)]
+    matriz = np.concatenate(partes).astype(np.float32)
+    return matriz / np.linalg.norm(matriz, axis=1, keepdims=True)
+
+
+def top_k(consultas, catalogo, k, leave_one_out):
+    import numpy as np
+
+    scores = consultas @ catalogo.T
+    if leave_one_out:
+        np.fill_diagonal(scores, -np.inf)
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def concordancia(top_fp32, top_int8):
+    import numpy as np
+
+    sobreposicao = [len(set(a) & set(b)) / len(a) for a, b in zip(top_fp32, top_int8)]
+    return {
+        "top3_concordancia_media": round(float(np.mean(sobreposicao)), 4),
+        "top3_identico": round(float(np.mean([list(a) == list(b) for a, b in zip(top_fp32, top_int8)])), 4),
+        "top1_identico": round(float(np.mean(top_fp32[:, 0] == top_int8[:, 0])), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fp32 vs INT8 do encoder CLIP")
+    parser.add_argument("--catalogo", required=True, help="Pasta com as imagens de referência")
+    parser.add_argument("--consultas", help="Pasta com radiografias de consulta")
+    parser.add_argument("--lote", type=int, default=8, help="Tamanho do lote no teste de throughput")
+    parser.add_argument("--repeticoes", type=int, default=20)
+    parser.add_argument("--saida", help="Arquivo JSON para gravar o relatório")
+    parser.add_argument(
+        "--min-concordancia", type=float, default=0.9,
+        help="Concordância média mínima do top-3 (consultas INT8 x catálogo fp32)",
+    )
+    args = parser.parse_args()
+
+    import numpy as np
+    import torch
+
+    relatorio = {"modelo": config.CLIP_MODEL_ID, "threads_torch": torch.get_num_threads()}
+    rss_inicial = rss_mb()
+
+    loader = ClipModelLoader(
+        config.CLIP_MODEL_NAME,
+        config.CLIP_PRETRAINED,
+        weights_path=config.CLIP_WEIGHTS_PATH or None,
+        cache_dir=config.CLIP_WEIGHTS_CACHE_DIR or None,
+        warmup_iterations=0,
+    )
+    loader.load()
+    rss_fp32 = rss_mb()
+
+    modelo_int8 = quantize_image_encoder(copy.deepcopy(loader.model))
+    rss_int8 = rss_mb()
+
+    fp32 = EagerBackend(loader.model, "cpu")
+    int8 = EagerBackend(modelo_int8, "cpu")
+
+    relatorio["memoria"] = {
+        "rss_base_mb": round(rss_inicial, 1),
+        "rss_fp32_mb": round(rss_fp32 - rss_inicial, 1),
+        "rss_int8_adicional_mb": round(rss_int8 - rss_fp32, 1),
+        "pesos_visual_fp32_mb": round(serialized_size(loader.model.visual) / 2**20, 1),
+        "pesos_visual_int8_mb": round(serialized_size(modelo_int8.visual) / 2**20, 1),
+    }
+
+    caminhos_catalogo = listar_imagens(args.catalogo)
+    caminhos_consultas = listar_imagens(args.consultas) if args.consultas else caminhos_catalogo
+    if len(caminhos_catalogo) < 4:
+        print("❌ O catálogo precisa de pelo menos 4 imagens")
+        return 1
+    catalogo = preprocessar(loader.preprocess, caminhos_catalogo)
+    consultas = catalogo if not args.consultas else preprocessar(loader.preprocess, caminhos_consultas)
+
+    relatorio["latencia"] = {
+        nome: [
+            medir_latencia(backend, catalogo, 1, args.repeticoes),
+            medir_latencia(backend, catalogo, args.lote, args.repeticoes),
+        ]
+        for nome, backend in (("fp32", fp32), ("int8", int8))
+    }
+
+    cat_fp32 = embeddings_normalizados(fp32, catalogo)
+    cat_int8 = embeddings_normalizados(int8, catalogo)
+    if args.consultas:
+        q_fp32 = embeddings_normalizados(fp32, consultas)
+        q_int8 = embeddings_normalizados(int8, consultas)
+    else:
+        q_fp32, q_int8 = cat_fp32, cat_int8
+
+    leave_one_out = not args.consultas
+    top_fp32 = top_k(q_fp32, cat_fp32, 3, leave_one_out)
+    # Produção: consultas INT8 contra o catálogo gravado em fp32
+    top_int8 = top_k(q_int8, cat_fp32, 3, leave_one_out)
+    top_int8_int8 = top_k(q_int8, cat_int8, 3, leave_one_out)
+    qualidade = concordancia(top_fp32, top_int8)
+    relatorio["qualidade"] = {
+        "consultas": len(caminhos_consultas),
+        "catalogo": len(caminhos_catalogo),
+        "catalogo_comparado": "fp32",
+        "cosseno_fp32_int8_medio": round(float(np.mean(np.sum(q_fp32 * q_int8, axis=1))), 5),
+        **qualidade,
+        "min_concordancia": args.min_concordancia,
+        "aprovado": qualidade["top3_concordancia_media"] >= args.min_concordancia,
+        "referencia_catalogo_int8": concordancia(top_fp32, top_int8_int8),
+    }
+
+    texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    print(texto)
+    if args.saida:
+        with open(args.saida, "w") as f:
+            f.write(texto)
+    return 0 if relatorio["qualidade"]["aprovado"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
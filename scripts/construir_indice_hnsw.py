@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Constrói o índice HNSW do catálogo e mede recall@k vs latência.
+
+O índice é construído a partir do catálogo exportado por
+scripts/exportar_catalogo_embeddings.py e gravado em HNSW_INDEX_PATH; os
+workers com VECTOR_SEARCH_BACKEND=hnsw recarregam sozinhos. Rode de novo
+após cada exportação do catálogo.
+
+Uso:
+    python scripts/construir_indice_hnsw.py
+    python scripts/construir_indice_hnsw.py --m 32 --ef-construction 400
+    python scripts/construir_indice_hnsw.py --relatorio --ef 16,32,64,128,256
+
+Com --relatorio, consultas de teste (linhas do catálogo com ruído leve) são
+respondidas pela busca exata e pelo HNSW com cada ef_search; o relatório
+mostra recall@k e latência p50/p95 de cada configuração.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.core import config
+from app.services.exact_search import EMBEDDINGS_FILE, MmapExactSearch
+from app.services.hnsw_search import HnswSearch, build_hnsw_index
+
+
+def resumo(tempos_ms):
+    tempos = np.asarray(tempos_ms)
+    return {
+        "p50_ms": round(float(np.percentile(tempos, 50)), 3),
+        "p95_ms": round(float(np.percentile(tempos, 95)), 3),
+    }
+
+
+def consultas_de_teste(diretorio, quantidade):
+    embeddings = np.load(os.path.join(diretorio, EMBEDDINGS_FILE), mmap_mode="r")
+    rng = np.random.default_rng(0)
+    indices = rng.choice(embeddings.shape[0], size=min(quantidade, embeddings.shape[0]), replace=False)
+    ruido = rng.normal(0, 0.01, (len(indices), embeddings.shape[1])).astype(np.float32)
+    return np.asarray(embeddings[np.sort(indices)]) + ruido
+
+
+def medir(busca, consultas, limite):
+    tempos = []
+    ids = []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        resultado = busca.search(consulta, limit=limite)
+        tempos.append((time.perf_counter() - inicio) * 1000.0)
+        ids.append([item["id"] for item in resultado])
+    return ids, tempos
+
+
+def relatorio(diretorio, indice, valores_ef, quantidade, limite):
+    consultas = consultas_de_teste(diretorio, quantidade)
+    exata = MmapExactSearch(diretorio)
+    exata.load()
+    ids_exatos, tempos_exatos = medir(exata, consultas, limite)
+
+    linhas = {"exata": resumo(tempos_exatos)}
+    aproximada = HnswSearch(diretorio, indice)
+    aproximada.load()
+    for ef in valores_ef:
+        aproximada.set_ef_search(ef)
+        ids, tempos = medir(aproximada, consultas, limite)
+        acertos = sum(len(set(a) & set(b)) for a, b in zip(ids, ids_exatos))
+        linhas[f"ef_search={ef}"] = dict(
+            resumo(tempos), **{f"recall@{limite}": round(acertos / (limite * len(consultas)), 4)}
+        )
+    return linhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Constrói o índice HNSW do catálogo de implantes")
+    parser.add_argument("--catalogo", default=config.CATALOG_EXPORT_DIR, help="Diretório do catálogo")
+    parser.add_argument("--saida", default=config.HNSW_INDEX_PATH, help="Arquivo do índice")
+    parser.add_argument("--m", type=int, default=config.HNSW_M)
+    parser.add_argument("--ef-construction", type=int, default=config.HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--sem-construir", action="store_true", help="Só gera o relatório")
+    parser.add_argument("--relatorio", action="store_true", help="Recall@k vs latência contra a busca exata")
+    parser.add_argument("--ef", default="16,32,64,128,256", help="Valores de ef_search do relatório")
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--limite", type=int, default=3, help="k do top-k")
+    args = parser.parse_args()
+
+    saida = {}
+    if not args.sem_construir:
+        saida["indice"] = build_hnsw_index(
+            args.catalogo, args.saida, m=args.m, ef_construction=args.ef_construction
+        )
+        print(f"✅ Índice HNSW gravado em {args.saida}", file=sys.stderr)
+    if args.relatorio:
+        valores_ef = [int(valor) for valor in args.ef.split(",") if valor]
+        saida["relatorio"] = relatorio(args.catalogo, args.saida, valores_ef, args.consultas, args.limite)
+    print(json.dumps(saida, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
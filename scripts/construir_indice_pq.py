@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Constrói o índice IVF-PQ (quantização de produto) do catálogo exportado.
+
+Grava, no diretório do catálogo (CATALOG_EXPORT_DIR), os codebooks, os
+códigos uint8 agrupados por lista, os centróides do IVF e o pq.json com a
+versão da exportação de origem. Os workers com VECTOR_SEARCH_BACKEND=pq
+recarregam sozinhos. Rode de novo após cada exportação do catálogo.
+
+Uso:
+    python scripts/construir_indice_pq.py
+    python scripts/construir_indice_pq.py --m 32 --nlist 512
+    python scripts/construir_indice_pq.py --relatorio --subespacos 32,64 --nprobe 8,16,32 --rerank 0,32
+
+Com --relatorio, cada combinação é construída em um diretório temporário
+(sem tocar no índice em uso) e comparada com a busca exata: bytes por
+vetor, memória dos códigos, QPS de consultas unitárias, latência p50/p95 e
+recall@k.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.core import config
+from app.services.exact_search import CATALOG_FILES, EMBEDDINGS_FILE, MmapExactSearch
+from app.services.pq_search import PqSearch, build_pq_index
+
+
+def resumo(tempos_ms):
+    tempos = np.asarray(tempos_ms)
+    return {
+        "qps": round(float(len(tempos) / (tempos.sum() / 1000.0)), 1),
+        "p50_ms": round(float(np.percentile(tempos, 50)), 3),
+        "p95_ms": round(float(np.percentile(tempos, 95)), 3),
+    }
+
+
+def consultas_de_teste(diretorio, quantidade):
+    """Linhas do catálogo com ruído leve, como nas demais verificações."""
+    embeddings = np.load(os.path.join(diretorio, EMBEDDINGS_FILE), mmap_mode="r")
+    rng = np.random.default_rng(0)
+    indices = rng.choice(embeddings.shape[0], size=min(quantidade, embeddings.shape[0]), replace=False)
+    ruido = rng.normal(0, 0.01, (len(indices), embeddings.shape[1])).astype(np.float32)
+    return np.asarray(embeddings[np.sort(indices)]) + ruido
+
+
+def medir(busca, consultas, limite):
+    tempos, ids = [], []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        resultado = busca.search(consulta, limit=limite)
+        tempos.append((time.perf_counter() - inicio) * 1000.0)
+        ids.append([item["id"] for item in resultado])
+    return ids, tempos
+
+
+def relatorio(diretorio, subespacos, nlist, nprobes, reranks, treino, quantidade, limite):
+    consultas = consultas_de_teste(diretorio, quantidade)
+    exata = MmapExactSearch(diretorio)
+    exata.load()
+    ids_exatos, tempos_exatos = medir(exata, consultas, limite)
+    embeddings = np.load(os.path.join(diretorio, EMBEDDINGS_FILE), mmap_mode="r")
+    linhas, dimensao = embeddings.shape
+
+    saida = {
+        "implantes": int(linhas),
+        "exata": dict(
+            resumo(tempos_exatos),
+            bytes_por_vetor=dimensao * 4,
+            matriz_mb=round(linhas * dimensao * 4 / 2**20, 2),
+        ),
+    }
+    temporario = tempfile.mkdtemp(prefix="pq-")
+    try:
+        # O catálogo é ligado por symlink; só o índice é gravado no temporário
+        for nome in CATALOG_FILES:
+            if os.path.exists(os.path.join(diretorio, nome)):
+                os.symlink(os.path.abspath(os.path.join(diretorio, nome)), os.path.join(temporario, nome))
+        for m in subespacos:
+            info = build_pq_index(temporario, m=m, nlist=nlist, train_rows=treino)
+            # Sem IVF o nprobe não muda nada
+            for nprobe in (nprobes if info["nlist"] else [0]):
+                for rerank in reranks:
+                    busca = PqSearch(temporario, nprobe=nprobe, rerank=rerank)
+                    busca.load()
+                    ids, tempos = medir(busca, consultas, limite)
+                    acertos = sum(len(set(a) & set(b)) for a, b in zip(ids, ids_exatos))
+                    saida[f"pq{m}x8/nlist={info['nlist']}/nprobe={nprobe}/rerank={rerank}"] = dict(
+                        resumo(tempos),
+                        bytes_por_vetor=info["bytes_per_vector"],
+                        codigos_mb=round(linhas * info["bytes_per_vector"] / 2**20, 2),
+                        construcao_s=info["build_seconds"],
+                        **{f"recall@{limite}": round(acertos / (limite * len(ids)), 4)},
+                    )
+    finally:
+        shutil.rmtree(temporario)
+    return saida
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Constrói o índice IVF-PQ do catálogo")
+    parser.add_argument("--catalogo", default=config.CATALOG_EXPORT_DIR, help="Diretório do catálogo")
+    parser.add_argument("--m", type=int, default=config.PQ_SUBVECTORS, help="Subespaços (bytes por vetor)")
+    parser.add_argument("--nlist", type=int, default=config.PQ_NLIST, help="Listas do IVF (0 = PQ plana)")
+    parser.add_argument("--treino", type=int, default=50000, help="Máximo de linhas no treino")
+    parser.add_argument("--relatorio", action="store_true", help="Bytes/vetor, QPS e recall vs busca exata")
+    parser.add_argument("--subespacos", default="32,64", help="Subespaços avaliados no relatório")
+    parser.add_argument("--nprobe", default="8,16,32", help="Listas visitadas avaliadas no relatório")
+    parser.add_argument("--rerank", default="0,32", help="Candidatos reavaliados avaliados no relatório")
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--limite", type=int, default=3, help="k do top-k")
+    args = parser.parse_args()
+
+    if args.relatorio:
+        saida = relatorio(
+            args.catalogo,
+            [int(valor) for valor in args.subespacos.split(",") if valor],
+            args.nlist,
+            [int(valor) for valor in args.nprobe.split(",") if valor],
+            [int(valor) for valor in args.rerank.split(",") if valor],
+            args.treino,
+            args.consultas,
+            args.limite,
+        )
+    else:
+        saida = build_pq_index(args.catalogo, m=args.m, nlist=args.nlist, train_rows=args.treino)
+        print(f"✅ Índice PQ gravado em {args.catalogo}", file=sys.stderr)
+    print(json.dumps(saida, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
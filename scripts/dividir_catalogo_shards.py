@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Divide o catálogo exportado em shards para a busca distribuída.
+
+Cada shard (<saida>/shard-NN) tem o formato de
+scripts/exportar_catalogo_embeddings.py e é servido por
+scripts/servir_shard.py. O shards.json resume a divisão (linhas, faixa de
+ids e fabricantes de cada shard). Rode de novo após cada exportação.
+
+Uso:
+    python scripts/dividir_catalogo_shards.py --shards 4
+    python scripts/dividir_catalogo_shards.py --shards 3 --particao manufacturer --saida /opt/raiox-app/cache/shards
+
+Partições:
+    id            Faixas de id com o mesmo número de implantes
+    manufacturer  Fabricantes inteiros por shard, balanceados pelo total de implantes
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import config
+from app.services.sharded_search import SHARD_PARTITIONS, export_shards
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Divide o catálogo exportado em shards")
+    parser.add_argument("--catalogo", default=config.CATALOG_EXPORT_DIR, help="Catálogo exportado")
+    parser.add_argument("--saida", default=config.SHARDS_EXPORT_DIR, help="Diretório dos shards")
+    parser.add_argument("--shards", type=int, required=True)
+    parser.add_argument("--particao", choices=SHARD_PARTITIONS, default="id")
+    args = parser.parse_args()
+
+    manifesto = export_shards(args.catalogo, args.saida, args.shards, by=args.particao)
+    print(f"✅ Catálogo dividido em {args.shards} shards em {args.saida}", file=sys.stderr)
+    print(json.dumps(manifesto, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Exporta a coluna implants.embedding para o snapshot do catálogo em memória.
+
+Gera, em CATALOG_EXPORT_DIR, um embeddings.npy float32 contíguo (N x 512),
+as normas de cada linha e os metadados (id, name, manufacturer, type,
+image_url) por coluna, com o modelo dos embeddings e um checksum do
+conteúdo (ver app/services/exact_search.py). Os workers com backends em
+processo (exact, hnsw, pca, pq) abrem esses arquivos com mmap e recarregam
+sozinhos quando a exportação muda. As linhas saem ordenadas por fabricante
+e tipo, para que os filtros da busca selecionem fatias contíguas da matriz.
+
+A leitura usa COPY ... TO STDOUT em formato binário: os vetores chegam
+como float32, sem conversão para texto.
+
+Uso:
+    python scripts/exportar_catalogo_embeddings.py
+    python scripts/exportar_catalogo_embeddings.py --verificar 50
+    python scripts/exportar_catalogo_embeddings.py --publicar snapshots/catalogo
+
+Com --verificar N, N consultas são comparadas entre o SQL (pgvector) e a
+busca em memória; sai com código 1 se algum top-k divergir. Para copiar o
+snapshot para outras máquinas, veja scripts/importar_snapshot_catalogo.py.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.core import config
+from app.db.embedding_versions import get_slots
+from app.db.pool import VectorSearchPool
+from app.services.exact_search import CATALOG_FILES, MmapExactSearch, export_catalog
+from app.services.spaces import get_s3_client
+from app.services.vector_search import PgVectorSearch
+
+EXPORT_SQL = """
+    COPY (
+        SELECT id, name, manufacturer, type, image_url, embedding
+        FROM implants
+        WHERE embedding IS NOT NULL
+        ORDER BY manufacturer, type, id
+    ) TO STDOUT WITH (FORMAT BINARY)
+"""
+
+
+def ler_catalogo(pool):
+    """Lê o catálogo com COPY binário."""
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            with cur.copy(EXPORT_SQL) as copy:
+                copy.set_types(["int4", "text", "text", "text", "text", "vector"])
+                yield from copy.rows()
+
+
+def modelo_do_catalogo(pool):
+    """Modelo dos embeddings em implants.embedding (a configuração da API em catálogos sem versões)."""
+    with pool.connection() as conn:
+        ativo = get_slots(conn).get("active")
+    return ativo["model_version"] if ativo else config.EMBEDDING_MODEL_VERSION
+
+
+def publicar(diretorio, prefixo, bucket):
+    """Envia o snapshot ao Spaces; metadata.json por último, para importações nunca verem um snapshot pela metade."""
+    cliente = get_s3_client()
+    for nome in CATALOG_FILES:
+        cliente.upload_file(os.path.join(diretorio, nome), bucket, f"{prefixo.strip('/')}/{nome}")
+
+
+def verificar(pool, diretorio, quantidade, limite):
+    """Compara o top-k do SQL e da busca em memória para consultas de teste."""
+    sql = PgVectorSearch(pool)
+    memoria = MmapExactSearch(diretorio)
+    memoria.load()
+    embeddings = np.load(os.path.join(diretorio, "embeddings.npy"), mmap_mode="r")
+    rng = np.random.default_rng(0)
+    indices = rng.choice(embeddings.shape[0], size=min(quantidade, embeddings.shape[0]), replace=False)
+
+    divergencias = 0
+    for indice in indices:
+        # Ruído leve para a consulta não coincidir exatamente com uma linha do catálogo
+        consulta = embeddings[indice] + rng.normal(0, 0.01, embeddings.shape[1]).astype(np.float32)
+        ids_sql = [item["id"] for item in sql.search(consulta, limit=limite)]
+        ids_memoria = [item["id"] for item in memoria.search(consulta, limit=limite)]
+        if ids_sql != ids_memoria:
+            divergencias += 1
+            print(f"⚠️  Divergência na consulta {indice}: SQL={ids_sql} memória={ids_memoria}")
+    return divergencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta os embeddings do catálogo para .npy")
+    parser.add_argument("--saida", default=config.CATALOG_EXPORT_DIR, help="Diretório do catálogo")
+    parser.add_argument("--verificar", type=int, default=0, help="Consultas de verificação contra o SQL")
+    parser.add_argument("--limite", type=int, default=3, help="k do top-k na verificação")
+    parser.add_argument("--publicar", help="Prefixo no Spaces para publicar o snapshot (importar_snapshot_catalogo.py)")
+    parser.add_argument("--bucket", default=config.DO_SPACES_BUCKET, help="Bucket do Spaces")
+    args = parser.parse_args()
+
+    pool = VectorSearchPool(
+        minconn=1,
+        maxconn=2,
+        host=config.VECTOR_DB_HOST,
+        port=config.VECTOR_DB_PORT,
+        dbname=config.VECTOR_DB_NAME,
+        user=config.VECTOR_DB_USER,
+        password=config.VECTOR_DB_PASSWORD,
+    )
+
+    inicio = time.perf_counter()
+    modelo = modelo_do_catalogo(pool)
+    total = export_catalog(ler_catalogo(pool), args.saida, model_version=modelo)
+    print(f"✅ {total} implantes ({modelo}) exportados para {args.saida} em {time.perf_counter() - inicio:.1f}s")
+
+    codigo = 0
+    if args.verificar:
+        divergencias = verificar(pool, args.saida, args.verificar, args.limite)
+        if divergencias:
+            print(f"❌ {divergencias} de {args.verificar} consultas divergiram do SQL")
+            codigo = 1
+        else:
+            print(f"✅ {args.verificar} consultas idênticas ao SQL")
+    if args.publicar and not codigo:
+        publicar(args.saida, args.publicar, args.bucket)
+        print(f"✅ Snapshot publicado em {args.bucket}/{args.publicar.strip('/')}")
+    pool.close()
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
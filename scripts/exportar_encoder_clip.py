@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Exporta o encoder de imagens CLIP para TorchScript ou ONNX e verifica a
+paridade com o backend eager (similaridade de cosseno >= 0.999).
+
+Uso:
+    python scripts/exportar_encoder_clip.py --backend onnx
+    python scripts/exportar_encoder_clip.py --backend torchscript --imagens /opt/raiox-app/fixtures
+
+Depois da exportação, ative o backend com CLIP_BACKEND=onnx (ou torchscript)
+no .env. O artefato é exportado num arquivo temporário e só vai para o
+caminho lido pela API depois da checagem de paridade; sai com código 1 (sem
+tocar no artefato anterior) se ela falhar.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import config
+from app.services.encoder_backends import (
+    PARITY_THRESHOLD,
+    EagerBackend,
+    check_parity,
+    create_backend,
+    default_artifact_path,
+    export_onnx,
+    export_torchscript,
+)
+from app.services.model_loader import ClipModelLoader
+
+EXTENSOES_IMAGEM = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+
+
+def carregar_lote_paridade(preprocess, pasta_imagens, quantidade):
+    """Monta o lote da checagem: imagens reais da pasta ou imagens sintéticas."""
+    import numpy as np
+    import torch
+    from PIL import Image
+
+    imagens = []
+    if pasta_imagens:
+        for nome in sorted(os.listdir(pasta_imagens)):
+            if nome.lower().endswith(EXTENSOES_IMAGEM):
+                imagens.append(Image.open(os.path.join(pasta_imagens, nome)))
+            if len(imagens) >= quantidade:
+                break
+    rng = np.random.default_rng(0)
+    while len(imagens) < quantidade:
+        ruido = rng.integers(0, 256, size=(256, 256), dtype=np.uint8)
+        imagens.append(Image.fromarray(ruido, mode="L"))
+    return torch.stack([preprocess(imagem) for imagem in imagens])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta o encoder CLIP para TorchScript/ONNX")
+    parser.add_argument("--backend", choices=("torchscript", "onnx"), required=True)
+    parser.add_argument("--saida", help="Arquivo de saída (padrão: CLIP_ARTIFACTS_DIR)")
+    parser.add_argument("--imagens", help="Pasta com radiografias para a checagem de paridade")
+    parser.add_argument("--amostras", type=int, default=16, help="Tamanho do lote de paridade")
+    parser.add_argument("--opset", type=int, default=17, help="Opset ONNX")
+    parser.add_argument("--sem-paridade", action="store_true", help="Não executa a checagem")
+    args = parser.parse_args()
+
+    saida = args.saida or default_artifact_path(
+        config.CLIP_ARTIFACTS_DIR, config.CLIP_MODEL_NAME, config.CLIP_PRETRAINED, args.backend
+    )
+
+    loader = ClipModelLoader(
+        config.CLIP_MODEL_NAME,
+        config.CLIP_PRETRAINED,
+        weights_path=config.CLIP_WEIGHTS_PATH or None,
+        cache_dir=config.CLIP_WEIGHTS_CACHE_DIR or None,
+        warmup_iterations=0,
+    )
+    loader.load()
+
+    # A exportação é feita na CPU, que é onde os backends exportados rodam
+    temporario = f"{saida}.tmp-{os.getpid()}"
+    if args.backend == "torchscript":
+        export_torchscript(loader.model, temporario)
+    else:
+        export_onnx(loader.model, temporario, opset=args.opset)
+
+    if not args.sem_paridade:
+        referencia = EagerBackend(loader.model, "cpu")
+        candidato = create_backend(args.backend, loader.model, "cpu", artifact_path=temporario)
+        lote = carregar_lote_paridade(loader.preprocess, args.imagens, args.amostras)
+        try:
+            resultado = check_parity(referencia, candidato, lote, threshold=PARITY_THRESHOLD)
+        except ValueError as e:
+            os.remove(temporario)
+            print(f"❌ {e}")
+            return 1
+        print(f"✅ Paridade OK: {json.dumps(resultado)}")
+
+    os.replace(temporario, saida)
+    print(f"✅ Artefato {args.backend} salvo em {saida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
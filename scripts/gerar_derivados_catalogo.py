@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Gera os derivados (miniatura e cópia na resolução do CLIP) das imagens de
+referência do catálogo que estão no bucket do Spaces.
+
+Para cada implante cujo image_url aponta para o bucket, baixa o original,
+gera os derivados no pool de processos (app/services/derivatives.py), envia
+os dois ao lado do original e registra no índice de objetos local
+(OBJECT_INDEX_PATH). A partir daí a API devolve `thumbnail_url` nos
+resultados e o re-embedding (scripts/reprocessar_embeddings.py) lê a cópia.
+
+Pode ser interrompido e executado de novo: implantes com derivados já
+registrados são pulados (--refazer gera tudo de novo). Rode no mesmo host
+da API, que consulta o mesmo índice local; depois de ingerir imagens novas
+(scripts/ingerir_catalogo.py), execute de novo.
+
+Uso:
+    python scripts/gerar_derivados_catalogo.py
+    python scripts/gerar_derivados_catalogo.py --limite 100 --threads 16 --processos 4
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import config
+from app.db.pool import VectorSearchPool
+from app.services.derivatives import DerivativeGenerator
+from app.services.object_index import ObjectIndex
+from app.services.spaces import get_s3_client, object_name_from_url
+
+LOTE = 500
+
+
+def implantes(pool, bucket, limite):
+    """(id, nome do objeto original ou None fora do bucket) dos implantes com imagem, em ordem de id."""
+    ultimo, lidos = 0, 0
+    while limite is None or lidos < limite:
+        tamanho = LOTE if limite is None else min(LOTE, limite - lidos)
+        with pool.connection() as conn:
+            linhas = conn.execute(
+                "SELECT id, image_url FROM implants WHERE image_url IS NOT NULL AND id > %s ORDER BY id LIMIT %s",
+                (ultimo, tamanho),
+            ).fetchall()
+        if not linhas:
+            return
+        for implant_id, url in linhas:
+            yield implant_id, object_name_from_url(url, bucket)
+        ultimo = linhas[-1][0]
+        lidos += len(linhas)
+
+
+def processar(gerador, indice, bucket, object_name):
+    cliente = get_s3_client()
+    original = cliente.get_object(Bucket=bucket, Key=object_name)["Body"].read()
+    derivados = gerador.generate(original)
+    nomes = gerador.names(object_name)
+    for tipo, (dados, content_type) in derivados.items():
+        cliente.upload_fileobj(
+            io.BytesIO(dados), bucket, nomes[tipo], ExtraArgs={"ACL": "public-read", "ContentType": content_type}
+        )
+    indice.record_derivatives(object_name, nomes)
+    return len(original), {tipo: len(dados) for tipo, (dados, _) in derivados.items()}
+
+
+def processar_lote(threads, gerador, indice, args, pendentes, relatorio):
+    if not args.refazer:
+        existentes = indice.derivatives(object_name for _, object_name in pendentes)
+        relatorio["ja_existentes"] += sum(1 for _, object_name in pendentes if object_name in existentes)
+        pendentes = [(implant_id, nome) for implant_id, nome in pendentes if nome not in existentes]
+    futuros = {
+        threads.submit(processar, gerador, indice, args.bucket, object_name): implant_id
+        for implant_id, object_name in pendentes
+    }
+    for futuro, implant_id in futuros.items():
+        try:
+            original, derivados = futuro.result()
+        except Exception as e:
+            print(f"⚠️  Implante {implant_id}: {e}", file=sys.stderr)
+            relatorio["falhas"] += 1
+            continue
+        relatorio["gerados"] += 1
+        relatorio["bytes_originais"] += original
+        relatorio["bytes_miniaturas"] += derivados["thumb"]
+        relatorio["bytes_copias_clip"] += derivados["embed"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera miniaturas e cópias do CLIP das imagens do catálogo")
+    parser.add_argument("--bucket", default=config.DO_SPACES_BUCKET, help="Bucket do Spaces")
+    parser.add_argument("--processos", type=int, default=config.DERIVATIVES_WORKERS, help="Processos de geração")
+    parser.add_argument("--threads", type=int, default=8, help="Downloads/uploads simultâneos")
+    parser.add_argument("--limite", type=int, help="Máximo de implantes lidos")
+    parser.add_argument("--refazer", action="store_true", help="Gera de novo os derivados já registrados")
+    args = parser.parse_args()
+
+    pool = VectorSearchPool(
+        minconn=1,
+        maxconn=2,
+        host=config.VECTOR_DB_HOST,
+        port=config.VECTOR_DB_PORT,
+        dbname=config.VECTOR_DB_NAME,
+        user=config.VECTOR_DB_USER,
+        password=config.VECTOR_DB_PASSWORD,
+    )
+    indice = ObjectIndex(config.OBJECT_INDEX_PATH, prefix=config.UPLOAD_OBJECT_PREFIX)
+    gerador = DerivativeGenerator(
+        workers=args.processos,
+        thumb_size=config.DERIVATIVES_THUMB_SIZE,
+        thumb_format=config.DERIVATIVES_THUMB_FORMAT,
+        thumb_quality=config.DERIVATIVES_THUMB_QUALITY,
+        embed_size=config.DERIVATIVES_EMBED_SIZE,
+    )
+
+    inicio = time.perf_counter()
+    relatorio = {
+        "gerados": 0, "ja_existentes": 0, "fora_do_bucket": 0, "falhas": 0,
+        "bytes_originais": 0, "bytes_miniaturas": 0, "bytes_copias_clip": 0,
+    }
+    pendentes = []
+    with ThreadPoolExecutor(max_workers=max(1, args.threads)) as threads:
+        for implant_id, object_name in implantes(pool, args.bucket, args.limite):
+            if object_name is None:
+                relatorio["fora_do_bucket"] += 1
+                continue
+            pendentes.append((implant_id, object_name))
+            if len(pendentes) >= LOTE:
+                processar_lote(threads, gerador, indice, args, pendentes, relatorio)
+                pendentes = []
+        processar_lote(threads, gerador, indice, args, pendentes, relatorio)
+
+    gerador.shutdown()
+    indice.close()
+    pool.close()
+    originais = relatorio["bytes_originais"]
+    relatorio["razao_miniatura"] = round(relatorio["bytes_miniaturas"] / originais, 4) if originais else 0.0
+    relatorio["segundos"] = round(time.perf_counter() - inicio, 2)
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+    return 1 if relatorio["falhas"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
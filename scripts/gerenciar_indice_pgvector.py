@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Gerencia o índice pgvector de implants.embedding.
+
+Comandos:
+    listar           Índices existentes na coluna de embedding
+    criar            CREATE INDEX CONCURRENTLY (HNSW ou IVFFlat, vector_l2_ops)
+    reconstruir      Cria um índice novo com os parâmetros atuais e troca pelo antigo
+    remover          DROP INDEX CONCURRENTLY
+    criar-filtros    B-tree (manufacturer, type) e um índice parcial por fabricante
+    remover-filtros  Remove os índices de criar-filtros
+    explicar         EXPLAIN ANALYZE da consulta de busca, com as opções de consulta
+                     da API (PGVECTOR_HNSW_EF_SEARCH / PGVECTOR_IVFFLAT_PROBES)
+
+Uso:
+    python scripts/gerenciar_indice_pgvector.py criar --tipo hnsw --m 16 --ef-construction 64
+    python scripts/gerenciar_indice_pgvector.py reconstruir --tipo ivfflat --lists 200
+    python scripts/gerenciar_indice_pgvector.py explicar --consultas 20
+    python scripts/gerenciar_indice_pgvector.py explicar --ef-search 100 --plano
+    python scripts/gerenciar_indice_pgvector.py explicar --fabricante Straumann
+
+Os parâmetros padrão vêm de app/core/config.py (variáveis PGVECTOR_*).
+O comando explicar sai com código 1 se o planner fizer scan sequencial em
+implants em vez de usar o índice.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.core import config
+from app.db.pool import VectorSearchPool, apply_session_settings
+from app.db.vector_index import (
+    INDEX_TYPES,
+    TABLE,
+    create_filter_indexes,
+    create_index,
+    drop_filter_indexes,
+    drop_index,
+    explain_search,
+    index_name,
+    list_indexes,
+    rebuild_index,
+)
+from app.services.exact_search import embedding_to_numpy
+from app.services.search_backends import search_filters
+from app.services.vector_search import FIND_SIMILAR_TEMPLATE, build_search_query
+
+
+def opcoes_de_construcao(args):
+    return {
+        "m": args.m,
+        "ef_construction": args.ef_construction,
+        "lists": args.lists,
+        "maintenance_work_mem": args.maintenance_work_mem or None,
+    }
+
+
+def explicar(conn, args):
+    settings = dict(config.PGVECTOR_SESSION_SETTINGS)
+    if args.ef_search:
+        settings["hnsw.ef_search"] = args.ef_search
+    if args.probes:
+        settings["ivfflat.probes"] = args.probes
+    apply_session_settings(conn, settings)
+
+    # Consultas reais: embeddings do próprio catálogo
+    amostra = conn.execute(
+        f"SELECT embedding FROM {TABLE} WHERE embedding IS NOT NULL ORDER BY random() LIMIT %s",
+        (args.consultas,),
+        binary=True,
+    ).fetchall()
+    if not amostra:
+        raise SystemExit(f"Tabela {TABLE} sem embeddings")
+
+    filtros = search_filters(manufacturer=args.fabricante, type=args.tipo_implante)
+    consulta, parametros = build_search_query(FIND_SIMILAR_TEMPLATE, filtros)
+    execucoes = []
+    for (embedding,) in amostra:
+        execucoes.append(explain_search(
+            conn, consulta, dict(parametros, q=embedding_to_numpy(embedding), limit=args.limite)
+        ))
+
+    tempos = np.asarray([e["execution_ms"] for e in execucoes])
+    relatorio = {
+        "linhas": conn.execute(f"SELECT count(*) FROM {TABLE}").fetchone()[0],
+        "indices_existentes": [nome for nome, _ in list_indexes(conn)],
+        "opcoes_de_consulta": settings,
+        "filtros": filtros,
+        "indices_usados": sorted({nome for e in execucoes for nome in e["indexes"]}),
+        "consultas_com_seq_scan": sum(1 for e in execucoes if TABLE in e["seq_scans"]),
+        "execucao_ms": {
+            "p50": round(float(np.percentile(tempos, 50)), 3),
+            "p95": round(float(np.percentile(tempos, 95)), 3),
+        },
+        "planejamento_ms_medio": round(float(np.mean([e["planning_ms"] for e in execucoes])), 3),
+    }
+    if args.plano:
+        relatorio["plano"] = execucoes[0]["plan"]
+    return relatorio
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerencia o índice pgvector de implants.embedding")
+    parser.add_argument(
+        "comando",
+        choices=("listar", "criar", "reconstruir", "remover", "criar-filtros", "remover-filtros", "explicar"),
+    )
+    parser.add_argument("--tipo", choices=INDEX_TYPES, default=config.PGVECTOR_INDEX_TYPE)
+    parser.add_argument("--m", type=int, default=config.PGVECTOR_HNSW_M)
+    parser.add_argument("--ef-construction", type=int, default=config.PGVECTOR_HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--lists", type=int, default=config.PGVECTOR_IVFFLAT_LISTS)
+    parser.add_argument("--maintenance-work-mem", default=config.PGVECTOR_MAINTENANCE_WORK_MEM)
+    parser.add_argument("--ef-search", type=int, default=0, help="Sobrescreve hnsw.ef_search no explicar")
+    parser.add_argument("--probes", type=int, default=0, help="Sobrescreve ivfflat.probes no explicar")
+    parser.add_argument("--consultas", type=int, default=10, help="Consultas do explicar")
+    parser.add_argument("--limite", type=int, default=3, help="k do top-k")
+    parser.add_argument("--plano", action="store_true", help="Inclui o plano completo da primeira consulta")
+    parser.add_argument("--fabricante", help="Filtro de fabricante no explicar")
+    parser.add_argument("--tipo-implante", help="Filtro de tipo no explicar")
+    args = parser.parse_args()
+
+    pool = VectorSearchPool(
+        minconn=1,
+        maxconn=1,
+        host=config.VECTOR_DB_HOST,
+        port=config.VECTOR_DB_PORT,
+        dbname=config.VECTOR_DB_NAME,
+        user=config.VECTOR_DB_USER,
+        password=config.VECTOR_DB_PASSWORD,
+    )
+    codigo = 0
+    with pool.connection() as conn:
+        if args.comando == "listar":
+            saida = [{"nome": nome, "definicao": definicao} for nome, definicao in list_indexes(conn)]
+        elif args.comando == "criar":
+            saida = create_index(conn, args.tipo, **opcoes_de_construcao(args))
+        elif args.comando == "reconstruir":
+            saida = rebuild_index(conn, args.tipo, **opcoes_de_construcao(args))
+        elif args.comando == "remover":
+            drop_index(conn, index_name(args.tipo))
+            saida = {"removido": index_name(args.tipo)}
+        elif args.comando == "criar-filtros":
+            saida = create_filter_indexes(conn, args.tipo, **opcoes_de_construcao(args))
+        elif args.comando == "remover-filtros":
+            saida = {"removidos": drop_filter_indexes(conn, args.tipo)}
+        else:
+            saida = explicar(conn, args)
+            if saida["consultas_com_seq_scan"]:
+                print(f"⚠️  Scan sequencial em {TABLE}: o índice não foi usado", file=sys.stderr)
+                codigo = 1
+    pool.close()
+    print(json.dumps(saida, indent=2, ensure_ascii=False, default=str))
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Instala um snapshot do catálogo num worker, sem consultar o banco.
+
+Copia o snapshot gerado por scripts/exportar_catalogo_embeddings.py (de um
+diretório local/montado ou de um prefixo do Spaces publicado com
+--publicar), confere o checksum e o modelo dos embeddings e publica o
+snapshot trocando atomicamente o symlink do catálogo (install_catalog). Os
+workers em execução recarregam sozinhos (CATALOG_RELOAD_INTERVAL). Os
+índices derivados (pca, pq) só são mantidos se os embeddings não mudaram;
+senão, e para o hnsw, precisam ser reconstruídos ou copiados depois.
+
+Uso:
+    python scripts/importar_snapshot_catalogo.py --origem /mnt/snapshots/catalogo
+    python scripts/importar_snapshot_catalogo.py --spaces-prefixo snapshots/catalogo
+    python scripts/importar_snapshot_catalogo.py --origem /mnt/snap --destino /tmp/catalogo --qualquer-modelo
+
+Sai com código 1 se o snapshot estiver corrompido ou for de outro modelo
+(o catálogo atual fica intacto).
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import config
+from app.services.exact_search import CATALOG_FILES, install_catalog, verify_snapshot
+from app.services.spaces import get_s3_client
+
+
+def copiar_local(origem, staging):
+    for nome in CATALOG_FILES:
+        caminho = os.path.join(origem, nome)
+        if os.path.exists(caminho):
+            shutil.copyfile(caminho, os.path.join(staging, nome))
+
+
+def baixar_spaces(prefixo, bucket, staging):
+    cliente = get_s3_client()
+    prefixo = prefixo.strip("/")
+    for nome in CATALOG_FILES:
+        try:
+            cliente.download_file(bucket, f"{prefixo}/{nome}", os.path.join(staging, nome))
+        except cliente.exceptions.ClientError as e:
+            # Snapshots do formato 1 não têm os .npy de colunas
+            if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey"):
+                raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Instala um snapshot do catálogo")
+    origem = parser.add_mutually_exclusive_group(required=True)
+    origem.add_argument("--origem", help="Diretório do snapshot")
+    origem.add_argument("--spaces-prefixo", help="Prefixo do snapshot no Spaces")
+    parser.add_argument("--bucket", default=config.DO_SPACES_BUCKET, help="Bucket do Spaces")
+    parser.add_argument("--destino", default=config.CATALOG_EXPORT_DIR, help="Diretório do catálogo dos workers")
+    parser.add_argument("--modelo", default=config.EMBEDDING_MODEL_VERSION, help="Modelo esperado dos embeddings")
+    parser.add_argument("--qualquer-modelo", action="store_true", help="Não confere o modelo")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    destino = os.path.abspath(args.destino)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    staging = f"{destino}.tmp-{os.getpid()}"
+    os.makedirs(staging, exist_ok=True)
+    try:
+        if args.origem:
+            copiar_local(args.origem, staging)
+        else:
+            baixar_spaces(args.spaces_prefixo, args.bucket, staging)
+        copiado = time.perf_counter()
+        metadata = verify_snapshot(staging, model_version=None if args.qualquer_modelo else args.modelo)
+        verificado = time.perf_counter()
+        install_catalog(staging, destino)
+    except (OSError, ValueError) as e:
+        shutil.rmtree(staging, ignore_errors=True)
+        print(f"❌ Snapshot não instalado: {e}")
+        return 1
+
+    print(json.dumps({
+        "destino": destino,
+        "implantes": metadata["rows"],
+        "modelo": metadata.get("model_version"),
+        "checksum": metadata["checksum"],
+        "criado_em": metadata.get("created_at"),
+        "copia_s": round(copiado - inicio, 3),
+        "verificacao_s": round(verificado - copiado, 3),
+    }, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
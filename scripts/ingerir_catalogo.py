@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Ingestão em massa de imagens de referência na tabela implants.
+
+Lê um diretório local ou um prefixo do Spaces, gera os embeddings com o
+mesmo modelo/backend configurado para a API (CLIP_*) em lotes grandes e
+grava por COPY. O catálogo é sempre gravado em fp32: CLIP_QUANTIZATION só
+vale para as consultas da API (ver EMBEDDING_MODEL_VERSION). Pode ser interrompida e executada de novo: os lotes já
+confirmados (implant_ingest_log) são pulados.
+
+Uso:
+    python scripts/ingerir_catalogo.py --diretorio /dados/referencias
+    python scripts/ingerir_catalogo.py --diretorio /dados/ref --url-base https://cdn.exemplo/ref --manifesto ref.csv
+    python scripts/ingerir_catalogo.py --spaces-prefixo referencias/2025 --lote 512 --processos 8
+
+Estrutura esperada: <fabricante>/<tipo>/<nome>.jpg (o manifesto CSV com
+colunas key,name,manufacturer,type,image_url sobrescreve o caminho).
+
+Cargas grandes num catálogo com índice vetorial pagam a manutenção do
+índice a cada linha: para centenas de milhares de imagens, remova o índice
+antes e recrie depois (scripts/gerenciar_indice_pgvector.py).
+
+Depois da ingestão, backends em processo (exact, hnsw, pca, pq, sharded)
+só enxergam os novos implantes após scripts/exportar_catalogo_embeddings.py
+(e a reconstrução dos índices derivados).
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import config
+from app.db.pool import VectorSearchPool
+from app.services.ingestion import CatalogIngestion, iter_local_images, iter_spaces_images, load_manifest
+from app.services.model_loader import ClipModelLoader
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestão em massa do catálogo de implantes")
+    origem = parser.add_mutually_exclusive_group(required=True)
+    origem.add_argument("--diretorio", help="Diretório local com as imagens")
+    origem.add_argument("--spaces-prefixo", help="Prefixo no bucket do Spaces")
+    parser.add_argument("--bucket", default=config.DO_SPACES_BUCKET, help="Bucket do Spaces")
+    parser.add_argument("--url-base", help="Prefixo de image_url para imagens locais")
+    parser.add_argument("--manifesto", help="CSV com key,name,manufacturer,type,image_url")
+    parser.add_argument("--origem", help="Identificador da origem no log de retomada")
+    parser.add_argument("--lote", type=int, default=config.INGEST_BATCH_SIZE, help="Imagens por lote")
+    parser.add_argument("--processos", type=int, default=config.INGEST_DECODE_WORKERS, help="Processos de decodificação")
+    parser.add_argument("--threads", type=int, default=config.INGEST_IO_THREADS, help="Threads de leitura")
+    parser.add_argument("--limite", type=int, help="Máximo de imagens novas nesta execução")
+    args = parser.parse_args()
+
+    manifesto = load_manifest(args.manifesto) if args.manifesto else None
+    if args.diretorio:
+        itens = iter_local_images(args.diretorio, url_base=args.url_base, manifest=manifesto)
+        origem_padrao = f"local:{os.path.abspath(args.diretorio)}"
+    else:
+        itens = iter_spaces_images(args.spaces_prefixo, bucket=args.bucket, manifest=manifesto)
+        origem_padrao = f"spaces:{args.bucket}/{args.spaces_prefixo.strip('/')}"
+
+    import torch
+
+    # Mesmo modelo, backend e pré-processamento da API: embeddings comparáveis.
+    # Sem quantização: o catálogo fica em fp32, como em reprocessar_embeddings.py
+    loader = ClipModelLoader(
+        config.CLIP_MODEL_NAME,
+        config.CLIP_PRETRAINED,
+        weights_path=config.CLIP_WEIGHTS_PATH or None,
+        cache_dir=config.CLIP_WEIGHTS_CACHE_DIR or None,
+        warmup_iterations=0,
+        backend=config.CLIP_BACKEND,
+        backend_path=config.CLIP_BACKEND_ARTIFACT or None,
+        artifacts_dir=config.CLIP_ARTIFACTS_DIR,
+        onnx_threads=config.CLIP_ONNX_THREADS,
+        quantization="none",
+        fast_preprocess=config.CLIP_FAST_PREPROCESS,
+    )
+    loader.load()
+
+    def codificar(tensores):
+        with torch.inference_mode():
+            return list(loader.encoder.encode(torch.stack(tensores)))
+
+    pool = VectorSearchPool(
+        minconn=1,
+        maxconn=1,
+        host=config.VECTOR_DB_HOST,
+        port=config.VECTOR_DB_PORT,
+        dbname=config.VECTOR_DB_NAME,
+        user=config.VECTOR_DB_USER,
+        password=config.VECTOR_DB_PASSWORD,
+    )
+    ingestao = CatalogIngestion(
+        pool,
+        codificar,
+        loader.image_preprocessor,
+        args.origem or origem_padrao,
+        batch_size=args.lote,
+        decode_workers=args.processos,
+        io_threads=args.threads,
+    )
+
+    def progresso(parcial):
+        print(
+            f"… {parcial['ingested']} ingeridos, {parcial['skipped']} já confirmados, "
+            f"{parcial['failed']} falhas ({parcial['images_per_second']} imagens/s)",
+            file=sys.stderr,
+        )
+
+    relatorio = ingestao.run(itens, limit=args.limite, progress=progresso)
+    pool.close()
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+    return 1 if relatorio["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
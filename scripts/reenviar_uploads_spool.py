@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Operação da fila de uploads write-behind (app/services/upload_spool.py).
+
+Comandos:
+    status          Envios pendentes/desistidos, tamanho do spool e atraso do mais antigo
+    reenviar-falhas Recoloca na fila os envios que esgotaram UPLOAD_MAX_ATTEMPTS
+    drenar          Envia agora, neste processo, tudo o que estiver vencido na fila
+    submissoes      Últimas submissões (de um cliente, com --cliente) e o objeto de cada uma
+
+Uso:
+    python scripts/reenviar_uploads_spool.py status
+    python scripts/reenviar_uploads_spool.py reenviar-falhas
+    python scripts/reenviar_uploads_spool.py drenar --limite 500
+    python scripts/reenviar_uploads_spool.py submissoes --cliente clinica_x
+
+Pode rodar com a API no ar: os envios são reservados na fila, sem
+duplicar o trabalho das threads dos workers. O comando drenar sai com
+código 1 se algum envio falhar.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import config
+from app.services.object_index import ObjectIndex
+from app.services.upload_spool import UploadSpool
+
+
+def drenar(spool, limite):
+    inicio = time.perf_counter()
+    enviados = falhas = 0
+    while limite is None or enviados + falhas < limite:
+        resultado = spool.process_due()
+        if resultado is None:
+            break
+        if resultado:
+            enviados += 1
+        else:
+            falhas += 1
+    return {"enviados": enviados, "falhas": falhas, "segundos": round(time.perf_counter() - inicio, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fila de uploads write-behind para o Spaces")
+    parser.add_argument("comando", choices=("status", "reenviar-falhas", "drenar", "submissoes"))
+    parser.add_argument("--diretorio", default=config.UPLOAD_SPOOL_DIR, help="Diretório do spool")
+    parser.add_argument("--limite", type=int, help="Máximo de envios (drenar) ou de submissões listadas")
+    parser.add_argument("--cliente", help="client_id das submissões listadas")
+    args = parser.parse_args()
+
+    indice = ObjectIndex(config.OBJECT_INDEX_PATH, prefix=config.UPLOAD_OBJECT_PREFIX)
+    spool = UploadSpool(
+        args.diretorio,
+        config.DO_SPACES_BUCKET,
+        max_attempts=config.UPLOAD_MAX_ATTEMPTS,
+        retry_base=config.UPLOAD_RETRY_BASE,
+        retry_max=config.UPLOAD_RETRY_MAX,
+        on_uploaded=indice.mark_stored,
+        on_failed=indice.mark_failed,
+    )
+    codigo = 0
+    saida = {}
+    if args.comando == "reenviar-falhas":
+        saida["reenfileirados"] = spool.retry_failed()
+    elif args.comando == "drenar":
+        saida = drenar(spool, args.limite)
+        codigo = 1 if saida["falhas"] else 0
+    elif args.comando == "submissoes":
+        saida["submissoes"] = indice.submissions(args.cliente, limit=args.limite or 100)
+    saida["fila"] = spool.stats()
+    saida["objetos"] = indice.stats()
+    spool.close()
+    indice.close()
+    print(json.dumps(saida, indent=2, ensure_ascii=False))
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
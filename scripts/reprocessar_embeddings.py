@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Troca do modelo CLIP do catálogo com re-embedding incremental.
+
+Comandos:
+    status              Modelos das vagas active/next, checkpoint e linhas pendentes
+    iniciar             Prepara a vaga next (implants.embedding_next) para o modelo novo
+    executar            Reprocessa as linhas pendentes em lotes, com checkpoint e limite de imagens/s
+    trocar              Cria na coluna nova os índices da atual e troca as vagas atomicamente
+    descartar-anterior  Remove a vaga next (o modelo anterior, depois da troca)
+
+Fluxo:
+    1. python scripts/reprocessar_embeddings.py iniciar --modelo ViT-L-14 --pretrained laion2b_s32b_b82k
+    2. python scripts/reprocessar_embeddings.py executar --modelo ViT-L-14 --pretrained laion2b_s32b_b82k
+       (em segundo plano; pode ser interrompido e executado de novo, continua do checkpoint)
+    3. python scripts/reprocessar_embeddings.py trocar   (ou executar ... --trocar)
+    4. Reinicie a API com CLIP_MODEL_NAME/CLIP_PRETRAINED do modelo novo: até
+       lá, os processos antigos continuam lendo os embeddings do modelo
+       anterior (agora em embedding_next)
+    5. python scripts/reprocessar_embeddings.py descartar-anterior
+
+O modelo atual é o da configuração da API (CLIP_MODEL_NAME/CLIP_PRETRAINED):
+execute o script com o mesmo ambiente da API. Backends em processo (exact,
+hnsw, pca, pq, sharded) usam o catálogo exportado: exporte de novo depois
+da troca (scripts/exportar_catalogo_embeddings.py).
+
+Se a resolução de entrada do modelo novo for DERIVATIVES_EMBED_SIZE, as
+imagens com cópia na resolução do CLIP (scripts/gerar_derivados_catalogo.py)
+são lidas da cópia, que dá o mesmo tensor de entrada; --originais desativa.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import config
+from app.db.embedding_versions import (
+    SLOTS,
+    discard_next,
+    ensure_schema,
+    get_slots,
+    pending_count,
+    start_migration,
+    switch_version,
+)
+from app.db.pool import VectorSearchPool
+from app.db.vector_index import copy_indexes, list_indexes
+from app.services.model_loader import ClipModelLoader
+from app.services.object_index import ObjectIndex
+from app.services.reembedding import ReEmbedding
+
+
+def versao(args):
+    return f"{args.modelo}:{args.pretrained}"
+
+
+def dimensao_do_modelo(nome):
+    import open_clip
+
+    configuracao = open_clip.get_model_config(nome)
+    if configuracao is None:
+        raise SystemExit(f"Modelo open_clip desconhecido: {nome}")
+    return configuracao["embed_dim"]
+
+
+def status(conn):
+    vagas = get_slots(conn)
+    saida = {"modelo_da_api": config.EMBEDDING_MODEL_VERSION, "vagas": vagas}
+    if vagas.get("next"):
+        saida["pendentes"] = pending_count(conn, vagas["next"]["model_version"])
+    saida["indices"] = {
+        vagas[vaga]["column"]: [nome for nome, _ in list_indexes(conn, vagas[vaga]["column"])] for vaga in vagas
+    }
+    return saida
+
+
+def trocar(conn, args):
+    indices = []
+    if not args.sem_indices:
+        indices = [nome for nome, _ in copy_indexes(conn, SLOTS["active"][0], SLOTS["next"][0])]
+    resultado = switch_version(conn)
+    resultado["indices_criados"] = indices
+    return resultado
+
+
+def executar(pool, args):
+    import torch
+
+    # Embeddings do catálogo em fp32 e backend eager: o modelo novo ainda não tem artefatos exportados
+    loader = ClipModelLoader(
+        args.modelo,
+        args.pretrained,
+        cache_dir=config.CLIP_WEIGHTS_CACHE_DIR or None,
+        warmup_iterations=0,
+        fast_preprocess=config.CLIP_FAST_PREPROCESS,
+    )
+    loader.load()
+
+    def codificar(tensores):
+        with torch.inference_mode():
+            return list(loader.encoder.encode(torch.stack(tensores)))
+
+    # A cópia só dá o mesmo tensor com o pré-processamento rápido na mesma resolução
+    copias = None
+    if not args.originais and getattr(loader.image_preprocessor, "image_size", None) == config.DERIVATIVES_EMBED_SIZE:
+        copias = ObjectIndex(config.OBJECT_INDEX_PATH, prefix=config.UPLOAD_OBJECT_PREFIX)
+
+    job = ReEmbedding(
+        pool,
+        codificar,
+        loader.image_preprocessor,
+        versao(args),
+        batch_size=args.lote,
+        decode_workers=args.processos,
+        io_threads=args.threads,
+        max_rate=args.max_por_segundo,
+        embedding_copies=copias,
+    )
+
+    def progresso(parcial):
+        print(
+            f"… {parcial['reembedded']} reprocessados, {parcial['failed']} falhas "
+            f"({parcial['images_per_second']} imagens/s)",
+            file=sys.stderr,
+        )
+
+    relatorio = job.run(limit=args.limite, progress=progresso)
+    if args.trocar and relatorio["pending"] == 0:
+        with pool.connection() as conn:
+            relatorio["troca"] = trocar(conn, args)
+    return relatorio
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Troca do modelo CLIP do catálogo com re-embedding")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    comandos.add_parser("status")
+    for nome in ("iniciar", "executar"):
+        sub = comandos.add_parser(nome)
+        sub.add_argument("--modelo", required=True, help="Modelo open_clip (ex.: ViT-L-14)")
+        sub.add_argument("--pretrained", required=True, help="Pesos open_clip (ex.: laion2b_s32b_b82k)")
+        sub.add_argument("--reiniciar", action="store_true", help="Descarta a vaga next de outro modelo")
+    executar_parser = comandos.choices["executar"]
+    executar_parser.add_argument("--lote", type=int, default=config.INGEST_BATCH_SIZE, help="Linhas por lote")
+    executar_parser.add_argument("--processos", type=int, default=config.INGEST_DECODE_WORKERS, help="Processos de decodificação")
+    executar_parser.add_argument("--threads", type=int, default=config.INGEST_IO_THREADS, help="Threads de leitura")
+    executar_parser.add_argument("--max-por-segundo", type=float, default=config.REEMBED_MAX_RATE, help="Limite de imagens/s (0 = sem limite)")
+    executar_parser.add_argument("--limite", type=int, help="Máximo de linhas nesta execução")
+    executar_parser.add_argument("--trocar", action="store_true", help="Troca as vagas se não restar linha pendente")
+    executar_parser.add_argument("--originais", action="store_true", help="Lê sempre as imagens originais, não as cópias do CLIP")
+    executar_parser.add_argument("--sem-indices", action="store_true", help="Não cria índices na coluna nova ao trocar")
+    trocar_parser = comandos.add_parser("trocar")
+    trocar_parser.add_argument("--sem-indices", action="store_true", help="Não cria índices na coluna nova")
+    comandos.add_parser("descartar-anterior")
+    args = parser.parse_args()
+
+    pool = VectorSearchPool(
+        minconn=1,
+        maxconn=2,
+        host=config.VECTOR_DB_HOST,
+        port=config.VECTOR_DB_PORT,
+        dbname=config.VECTOR_DB_NAME,
+        user=config.VECTOR_DB_USER,
+        password=config.VECTOR_DB_PASSWORD,
+    )
+    with pool.connection() as conn:
+        ensure_schema(conn, config.EMBEDDING_MODEL_VERSION)
+        if args.comando in ("iniciar", "executar"):
+            start_migration(conn, versao(args), dimensao_do_modelo(args.modelo), restart=args.reiniciar)
+
+    codigo = 0
+    if args.comando == "executar":
+        saida = executar(pool, args)
+        codigo = 1 if saida["pending"] else 0
+    else:
+        with pool.connection() as conn:
+            if args.comando == "trocar":
+                saida = trocar(conn, args)
+            elif args.comando == "descartar-anterior":
+                discard_next(conn)
+                saida = status(conn)
+            else:
+                saida = status(conn)
+    pool.close()
+    print(json.dumps(saida, indent=2, ensure_ascii=False, default=str))
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
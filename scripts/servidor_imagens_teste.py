@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Servidor HTTP local com cenários de download de imagem para testar o
+ImageFetcher (app/services/image_fetch.py) e o /webhook.
+
+Rotas:
+    /ok             PNG pequeno (200)
+    /lento          Imagem enviada em gotas, mais devagar que o prazo total
+    /travado        Cabeçalhos enviados, corpo nunca chega (timeout de leitura)
+    /grande         Content-Length acima do limite
+    /grande-chunked Corpo acima do limite sem Content-Length (chunked)
+    /erro           HTTP 500
+    /cortado        Conexão fechada no meio do corpo
+    /redireciona    302 para /ok
+
+Uso:
+    python scripts/servidor_imagens_teste.py --porta 8099
+        (sobe o servidor; ex.: POST /webhook com image_url=http://localhost:8099/lento)
+    python scripts/servidor_imagens_teste.py --verificar
+        (sobe o servidor, baixa cada rota com o ImageFetcher e imprime o resultado
+         de cada cenário e o maior atraso do event loop durante os downloads)
+
+Sai com código 1 no modo --verificar se algum cenário não terminar como esperado.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.image_fetch import ImageFetcher, ImageFetchError
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(4096)
+
+# Rota -> status esperado no modo --verificar (200 = download ok)
+ESPERADO = {
+    "/ok": 200,
+    "/redireciona": 200,
+    "/lento": 504,
+    "/travado": 504,
+    "/grande": 413,
+    "/grande-chunked": 413,
+    "/erro": 400,
+    "/cortado": 400,
+}
+
+
+class Cenarios(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    limite = 1 << 20
+    espera = 1.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _cabecalhos(self, status=200, tamanho=None, extras=()):
+        self.send_response(status)
+        self.send_header("Content-Type", "image/png")
+        if tamanho is None:
+            self.send_header("Transfer-Encoding", "chunked")
+        else:
+            self.send_header("Content-Length", str(tamanho))
+        for nome, valor in extras:
+            self.send_header(nome, valor)
+        self.end_headers()
+
+    def _chunk(self, dados):
+        self.wfile.write(f"{len(dados):x}\r\n".encode() + dados + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        rota = self.path.split("?")[0]
+        try:
+            if rota == "/ok":
+                self._cabecalhos(tamanho=len(PNG))
+                self.wfile.write(PNG)
+            elif rota == "/redireciona":
+                self._cabecalhos(302, tamanho=0, extras=[("Location", "/ok")])
+            elif rota == "/lento":
+                # Cada gota chega antes do timeout de leitura; o total passa do prazo
+                self._cabecalhos(tamanho=None)
+                for _ in range(20):
+                    self._chunk(PNG[:64])
+                    time.sleep(self.espera / 4)
+                self._chunk(b"")
+            elif rota == "/travado":
+                self._cabecalhos(tamanho=len(PNG))
+                time.sleep(self.espera * 3)
+            elif rota == "/grande":
+                self._cabecalhos(tamanho=self.limite * 4)
+                self.wfile.write(bytes(65536))
+            elif rota == "/grande-chunked":
+                self._cabecalhos(tamanho=None)
+                for _ in range(self.limite // 65536 + 4):
+                    self._chunk(bytes(65536))
+                self._chunk(b"")
+            elif rota == "/erro":
+                self._cabecalhos(500, tamanho=0)
+            elif rota == "/cortado":
+                self._cabecalhos(tamanho=len(PNG) * 4)
+                self.wfile.write(PNG)
+                self.wfile.flush()
+                self.close_connection = True
+            else:
+                self._cabecalhos(404, tamanho=0)
+        except (BrokenPipeError, ConnectionResetError):
+            # O cliente desistiu (limite de tamanho ou prazo)
+            self.close_connection = True
+
+
+def subir(porta, limite, espera):
+    Cenarios.limite = limite
+    Cenarios.espera = espera
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), Cenarios)
+    servidor.daemon_threads = True
+    return servidor
+
+
+async def verificar(base, limite, espera):
+    fetcher = ImageFetcher(
+        max_bytes=limite, connect_timeout=espera, read_timeout=espera, total_timeout=espera * 2,
+    )
+    atraso_loop = 0.0
+    rodando = True
+
+    async def medir_loop():
+        # Maior atraso de um sleep de 10 ms: mostra se algo bloqueou o event loop
+        nonlocal atraso_loop
+        while rodando:
+            inicio = time.perf_counter()
+            await asyncio.sleep(0.01)
+            atraso_loop = max(atraso_loop, time.perf_counter() - inicio - 0.01)
+
+    async def baixar(rota):
+        inicio = time.perf_counter()
+        try:
+            dados = await fetcher.fetch(base + rota)
+            status, detalhe = 200, f"{len(dados)} bytes"
+        except ImageFetchError as e:
+            status, detalhe = e.status_code, str(e)
+        return rota, {
+            "status": status,
+            "esperado": ESPERADO[rota],
+            "detalhe": detalhe,
+            "segundos": round(time.perf_counter() - inicio, 3),
+        }
+
+    medidor = asyncio.create_task(medir_loop())
+    inicio = time.perf_counter()
+    resultados = dict(await asyncio.gather(*(baixar(rota) for rota in ESPERADO)))
+    total = time.perf_counter() - inicio
+    # Segunda rodada de /ok: reaproveita a conexão do pool (keep-alive)
+    reuso = time.perf_counter()
+    await asyncio.gather(*(fetcher.fetch(base + "/ok") for _ in range(20)))
+    reuso = time.perf_counter() - reuso
+    rodando = False
+    await medidor
+    estatisticas = fetcher.stats()
+    await fetcher.close()
+    return {
+        "cenarios": resultados,
+        "total_paralelo_s": round(total, 3),
+        "20_downloads_ok_s": round(reuso, 3),
+        "maior_atraso_event_loop_ms": round(atraso_loop * 1000.0, 1),
+        "fetcher": estatisticas,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local de cenários de download de imagem")
+    parser.add_argument("--porta", type=int, default=8099, help="Porta do servidor")
+    parser.add_argument("--limite", type=int, default=1 << 20, help="Limite de bytes usado nos cenários grandes")
+    parser.add_argument("--espera", type=float, default=1.0, help="Timeout de referência (s) dos cenários lentos")
+    parser.add_argument("--verificar", action="store_true", help="Executa os cenários com o ImageFetcher e sai")
+    args = parser.parse_args()
+
+    servidor = subir(args.porta, args.limite, args.espera)
+    if not args.verificar:
+        print(f"Servindo cenários em http://127.0.0.1:{args.porta} (Ctrl+C para sair)")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    saida = asyncio.run(verificar(f"http://127.0.0.1:{args.porta}", args.limite, args.espera))
+    servidor.shutdown()
+    print(json.dumps(saida, indent=2, ensure_ascii=False))
+    falhas = [rota for rota, r in saida["cenarios"].items() if r["status"] != r["esperado"]]
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Serve um shard do catálogo para a busca distribuída (VECTOR_SEARCH_BACKEND=sharded).
+
+O shard é um diretório gerado por scripts/dividir_catalogo_shards.py, no
+mesmo formato da exportação completa; qualquer backend em processo pode
+servi-lo. Não carrega o modelo CLIP.
+
+Uso:
+    python scripts/servir_shard.py --catalogo /opt/raiox-app/cache/shards/shard-00 --porta 8101
+    python scripts/servir_shard.py --catalogo .../shard-01 --socket /run/raiox/shard-01.sock --backend pq
+
+Na API: SEARCH_SHARDS=http://127.0.0.1:8101,unix:/run/raiox/shard-01.sock
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uvicorn
+
+from app.core import config
+from app.services.search_backends import create_search_backend
+from app.shard_server import create_shard_app
+
+# Backends que servem um diretório de catálogo
+SHARD_BACKENDS = ("exact", "hnsw", "pca", "pq")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve um shard do catálogo")
+    parser.add_argument("--catalogo", required=True, help="Diretório do shard")
+    parser.add_argument("--nome", help="Nome do shard (padrão: nome do diretório)")
+    parser.add_argument("--backend", choices=SHARD_BACKENDS, default="exact")
+    parser.add_argument("--indice-hnsw", help="Índice HNSW do shard (padrão: <catalogo>/hnsw.bin)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8101)
+    parser.add_argument("--socket", help="Socket Unix (substitui host/porta)")
+    parser.add_argument("--atraso-ms", type=float, default=0.0, help="Atraso artificial por busca (testes)")
+    args = parser.parse_args()
+
+    catalogo = os.path.abspath(args.catalogo)
+    busca = create_search_backend(
+        args.backend,
+        None,
+        catalog_dir=catalogo,
+        reload_interval=config.CATALOG_RELOAD_INTERVAL,
+        hnsw_index_path=args.indice_hnsw or os.path.join(catalogo, "hnsw.bin"),
+        hnsw_ef_search=config.HNSW_EF_SEARCH,
+        pca_candidates=config.PCA_CANDIDATES,
+        pq_nprobe=config.PQ_NPROBE,
+        pq_rerank=config.PQ_RERANK,
+    )
+    # Carrega antes de aceitar conexões: a primeira busca não paga a carga
+    busca.load()
+    app = create_shard_app(busca, args.nome or os.path.basename(catalogo), delay=args.atraso_ms / 1000.0)
+    if args.socket:
+        uvicorn.run(app, uds=args.socket, log_level="warning")
+    else:
+        uvicorn.run(app, host=args.host, port=args.porta, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
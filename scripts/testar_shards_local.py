@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Testa a busca distribuída inteira em localhost.
+
+Divide o catálogo exportado em shards num diretório temporário, sobe um
+scripts/servir_shard.py por shard (sockets Unix, ou portas TCP com
+--tcp) e compara o coordenador com a busca exata no catálogo completo:
+
+1. todos os shards no ar: o top-k deve ser idêntico ao da busca exata
+   (com backends aproximados, o relatório mostra a concordância);
+2. uma réplica lenta extra (atraso acima do prazo): fica em timeouts e o
+   top-k continua o dos demais shards;
+3. um shard derrubado: resultado parcial, shard em errors.
+
+Uso:
+    python scripts/testar_shards_local.py
+    python scripts/testar_shards_local.py --shards 4 --particao manufacturer --backend pq --tcp
+
+Sai com código 1 se o cenário 1 divergir da busca exata (backend exact) ou se os cenários
+2 e 3 não reportarem o shard com problema.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import numpy as np
+
+from app.core import config
+from app.services.exact_search import EMBEDDINGS_FILE, MmapExactSearch
+from app.services.hnsw_search import build_hnsw_index
+from app.services.pq_search import build_pq_index
+from app.services.reduced_search import write_projection
+from app.services.sharded_search import ShardedSearch, export_shards, shard_client
+
+SCRIPT_SHARD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "servir_shard.py")
+
+
+def consultas_de_teste(diretorio, quantidade):
+    """Linhas do catálogo com ruído leve, como nas demais verificações."""
+    embeddings = np.load(os.path.join(diretorio, EMBEDDINGS_FILE), mmap_mode="r")
+    rng = np.random.default_rng(0)
+    indices = rng.choice(embeddings.shape[0], size=min(quantidade, embeddings.shape[0]), replace=False)
+    ruido = rng.normal(0, 0.01, (len(indices), embeddings.shape[1])).astype(np.float32)
+    return np.asarray(embeddings[np.sort(indices)]) + ruido
+
+
+def preparar_indice(diretorio, backend):
+    """Índice derivado que o backend do shard precisa além da exportação."""
+    if backend == "hnsw":
+        build_hnsw_index(diretorio, os.path.join(diretorio, "hnsw.bin"), config.HNSW_M, config.HNSW_EF_CONSTRUCTION)
+    elif backend == "pca":
+        write_projection(diretorio, config.PCA_COMPONENTS)
+    elif backend == "pq":
+        build_pq_index(diretorio, m=config.PQ_SUBVECTORS, nlist=config.PQ_NLIST)
+
+
+def subir_shard(diretorio, nome, args, numero, atraso_ms=0.0):
+    """Inicia um shard e devolve (processo, endereço)."""
+    comando = [sys.executable, SCRIPT_SHARD, "--catalogo", diretorio, "--nome", nome, "--backend", args.backend]
+    if args.tcp:
+        porta = args.porta_inicial + numero
+        comando += ["--porta", str(porta)]
+        alvo = f"http://127.0.0.1:{porta}"
+    else:
+        socket = os.path.join(os.path.dirname(diretorio), f"{nome}.sock")
+        comando += ["--socket", socket]
+        alvo = f"unix:{socket}"
+    if atraso_ms:
+        comando += ["--atraso-ms", str(atraso_ms)]
+    return subprocess.Popen(comando), alvo
+
+
+def aguardar(alvo, processo, timeout=60.0):
+    limite = time.monotonic() + timeout
+    with shard_client(alvo, 1.0) as cliente:
+        while time.monotonic() < limite:
+            if processo.poll() is not None:
+                raise SystemExit(f"Shard {alvo} terminou com código {processo.returncode}")
+            try:
+                if cliente.get("/healthcheck").status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            time.sleep(0.1)
+    raise SystemExit(f"Shard {alvo} não subiu em {timeout}s")
+
+
+def executar(busca, consultas, limite):
+    resultados, relatorios, tempos = [], [], []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        encontrados, relatorio = busca.scatter([consulta], limit=limite)
+        tempos.append((time.perf_counter() - inicio) * 1000.0)
+        resultados.append([item["id"] for item in encontrados[0]])
+        relatorios.append(relatorio)
+    return resultados, relatorios, tempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Testa a busca distribuída em localhost")
+    parser.add_argument("--catalogo", default=config.CATALOG_EXPORT_DIR, help="Catálogo exportado")
+    parser.add_argument("--shards", type=int, default=3)
+    parser.add_argument("--particao", choices=("id", "manufacturer"), default="id")
+    parser.add_argument("--backend", choices=("exact", "hnsw", "pca", "pq"), default="exact")
+    parser.add_argument("--prazo", type=float, default=config.SEARCH_SHARD_DEADLINE, help="Prazo (s) do coordenador")
+    parser.add_argument("--tcp", action="store_true", help="Portas TCP em vez de sockets Unix")
+    parser.add_argument("--porta-inicial", type=int, default=8101)
+    parser.add_argument("--consultas", type=int, default=50)
+    parser.add_argument("--limite", type=int, default=3, help="k do top-k")
+    args = parser.parse_args()
+
+    consultas = consultas_de_teste(args.catalogo, args.consultas)
+    exata = MmapExactSearch(args.catalogo)
+    ids_exatos = [[item["id"] for item in exata.search(c, limit=args.limite)] for c in consultas]
+
+    temporario = tempfile.mkdtemp(prefix="shards-")
+    processos = []
+    saida = {}
+    codigo = 0
+    try:
+        manifesto = export_shards(args.catalogo, temporario, args.shards, by=args.particao)
+        diretorios = [os.path.join(temporario, shard["name"]) for shard in manifesto["shards"]]
+        for diretorio in diretorios:
+            preparar_indice(diretorio, args.backend)
+        alvos = []
+        for numero, diretorio in enumerate(diretorios):
+            processo, alvo = subir_shard(diretorio, os.path.basename(diretorio), args, numero)
+            processos.append(processo)
+            alvos.append(alvo)
+        # Réplica do shard-00 que responde acima do prazo
+        processo, lento = subir_shard(diretorios[0], "lento", args, len(diretorios), atraso_ms=args.prazo * 4000.0)
+        processos.append(processo)
+        for processo, alvo in zip(processos, alvos + [lento]):
+            aguardar(alvo, processo)
+        saida["shards"] = {alvo: shard["implants"] for alvo, shard in zip(alvos, manifesto["shards"])}
+
+        # 1. Todos os shards no prazo: top-k idêntico ao da busca exata
+        coordenador = ShardedSearch(alvos, deadline=args.prazo)
+        ids, relatorios, tempos = executar(coordenador, consultas, args.limite)
+        iguais = sum(a == b for a, b in zip(ids, ids_exatos))
+        saida["todos_no_prazo"] = {
+            "top_k_identico": round(iguais / len(ids), 4),
+            "p50_ms": round(float(np.percentile(tempos, 50)), 3),
+            "p95_ms": round(float(np.percentile(tempos, 95)), 3),
+        }
+        if iguais < len(ids) and args.backend == "exact":
+            codigo = 1
+        coordenador.close()
+
+        # 2. Um shard lento: fica de fora sem atrasar a resposta além do prazo
+        coordenador = ShardedSearch(alvos + [lento], deadline=args.prazo)
+        ids, relatorios, tempos = executar(coordenador, consultas[:5], args.limite)
+        saida["shard_lento"] = {
+            "relatorio": relatorios[-1],
+            "top_k_identico": round(sum(a == b for a, b in zip(ids, ids_exatos)) / len(ids), 4),
+            "p95_ms": round(float(np.percentile(tempos, 95)), 3),
+        }
+        if relatorios[-1]["timeouts"] != [lento]:
+            codigo = 1
+
+        # 3. Um shard derrubado: parcial, com o shard em errors
+        processos[0].terminate()
+        processos[0].wait()
+        ids, relatorios, tempos = executar(coordenador, consultas[:5], args.limite)
+        saida["shard_derrubado"] = {"relatorio": relatorios[-1], "stats": coordenador.stats()["shards"]}
+        if alvos[0] not in relatorios[-1]["errors"]:
+            codigo = 1
+        coordenador.close()
+    finally:
+        for processo in processos:
+            processo.terminate()
+        for processo in processos:
+            processo.wait()
+        shutil.rmtree(temporario)
+
+    print(json.dumps(saida, indent=2, ensure_ascii=False))
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())